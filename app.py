@@ -1,19 +1,33 @@
 import streamlit as st
-from anthropic import Anthropic
 import os
-from dotenv import load_dotenv
-from database import init_db, add_conversation, get_conversations, add_usage_log, get_schedules, add_schedule
+from database import (
+    DEFAULT_TENANT, set_current_tenant, queue_conversation, queue_usage_log, flush_writes,
+    get_conversations, get_conversation_summary, get_schedules, add_schedule, complete_schedule,
+    delete_schedule
+)
 from avatar_configs import get_avatar_config, get_avatar_list
-from scheduler import parse_schedule_request, format_schedule_list, is_schedule_command
-from usage_dashboard import show_usage_dashboard
-from schedule_page import show_schedule_page
+from scheduler import parse_schedule_request, format_schedule_list
+from intent_router import route_intent
+from schedule_context import get_schedule_context
+from prompt_cache import build_stream_request, usage_from_message, calculate_cost
+from context_window import fit_to_budget
+from conversation_summary import summarized_count, format_summary_context
+from reminders import format_reminder
+from stream_render import ThrottledRenderer
+from timings import StageTimer
+from response_cache import response_cache, cache_key, replay_chunks, REPLAY_INTERVAL
+from conversation_search import show_search_sidebar
+from usage_stats import get_today_stats
+from datetime import datetime
 import json
+import time
+import uuid
 
-# 環境変数の取得
-load_dotenv()
+# 重いモジュール（anthropic、各ページの pandas / plotly など）は使うときに初めて import する
+# （Streamlit は操作のたびにこのスクリプトを再実行するため、先頭では軽いものだけを読み込む）
 
-# DBの初期化
-init_db()
+# .env は database の import 時に読み込まれる
+# DB は利用者ごとに最初に使うときに作成・マイグレーションされる
 
 # Page config
 st.set_page_config(
@@ -22,18 +36,95 @@ st.set_page_config(
     layout="wide"
 )
 
-# Anthropicクライアントの初期化
+# 1回に読み込む会話履歴の件数
+HISTORY_PAGE_SIZE = 50
+
+# 利用者を識別するヘッダー（認証済みのユーザー名を付けるリバースプロキシの背後で使う）
+# 未設定なら全員が同じ利用者（DEFAULT_TENANT）としてデータを共有する
+TENANT_HEADER = os.getenv("TENANT_HEADER", "")
+
+def resolve_tenant():
+    """このセッションの利用者 ID。ヘッダーが無ければ None"""
+    if not TENANT_HEADER:
+        return DEFAULT_TENANT
+    return st.context.headers.get(TENANT_HEADER)
+
+def history_cursor(conversations):
+    """読み込んだ中で最も古い発言の (timestamp, id)。これ以上古い発言が無ければ None"""
+    if len(conversations) < HISTORY_PAGE_SIZE:
+        return None
+    return (conversations[0].timestamp, conversations[0].id)
+
+def history_messages(conversations):
+    """DB の発言を表示・送信用のメッセージにする（要約済みかの判定に id / timestamp を持たせる）"""
+    return [
+        {"role": conv.role, "content": conv.content, "id": conv.id, "timestamp": conv.timestamp}
+        for conv in conversations
+    ]
+
+# Anthropicクライアントの初期化（最初に API を呼ぶときに作成）
+# （全セッションで1つのスケジューラを共有し、レート制限内に収まるよう順番に送信する）
 @st.cache_resource
-def get_anthropic_client():
-    api_key = os.getenv("ANTHROPIC_API_KEY")
-    if not api_key:
-        st.error("ANTHROPIC_API_KEY not found in .env file")
-        st.stop()
-    return Anthropic(api_key=api_key)
+def get_request_scheduler():
+    from anthropic import AsyncAnthropic
+    from request_scheduler import RequestScheduler
+    # 429 と一時的なエラー（5xx・529・接続エラー）の再送はスケジューラが行う
+    # （SDK の再試行は 429 を他のセッションの送信と無関係に繰り返すため無効にする）
+    return RequestScheduler(AsyncAnthropic(api_key=os.getenv("ANTHROPIC_API_KEY"), max_retries=0))
 
-client = get_anthropic_client()
+# 予定のリマインダー（プロセスで1つのスレッドが通知時刻まで眠り、各セッションは受信箱を見るだけ）
+REMINDER_POLL_SECONDS = int(os.getenv("REMINDER_POLL_SECONDS", "15"))
+
+@st.cache_resource
+def get_reminder_engine():
+    from reminders import ReminderEngine
+    engine = ReminderEngine()
+    engine.start()
+    return engine
+
+@st.fragment(run_every=REMINDER_POLL_SECONDS)
+def show_reminders():
+    """届いたリマインダーをトーストで知らせ、秘書とのチャットにも追加する"""
+    # run_every による再実行はスクリプト本体を通らない（別スレッドで空のコンテキストから始まる）ため、
+    # ここでも利用者を設定する
+    set_current_tenant(st.session_state.tenant)
+    reminders = get_reminder_engine().poll(st.session_state.session_id)
+    for reminder in reminders:
+        st.toast(format_reminder(reminder), icon="⏰")
+    if reminders and st.session_state.current_avatar == "secretary":
+        # 表示するだけの通知（DB に保存せず、API にも送らない）
+        st.session_state.messages.extend(
+            {"role": "assistant", "content": format_reminder(reminder), "timestamp": datetime.now(),
+             "kind": "reminder"}
+            for reminder in reminders
+        )
+        # チャットの表示はこのフラグメントの外にあるため全体を再実行する
+        st.rerun()
+
+# 会話のローリング要約（プロセスで1つのスレッドがバックグラウンドで更新する）
+@st.cache_resource
+def get_summarizer():
+    from conversation_summary import ConversationSummarizer
+    return ConversationSummarizer(get_request_scheduler())
+
+if not os.getenv("ANTHROPIC_API_KEY"):
+    st.error("ANTHROPIC_API_KEY not found in .env file")
+    st.stop()
 
 # セッション状態の初期化
+if "session_id" not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
+
+if "tenant" not in st.session_state:
+    st.session_state.tenant = resolve_tenant()
+
+# このスクリプト実行中の DB アクセスを利用者のデータに限定する
+try:
+    set_current_tenant(st.session_state.tenant)
+except ValueError:
+    st.error(f"利用者を特定できません（{TENANT_HEADER} ヘッダーを確認してください）")
+    st.stop()
+
 if "messages" not in st.session_state:
     st.session_state.messages = []
 
@@ -43,15 +134,26 @@ if "current_avatar" not in st.session_state:
 if "current_page" not in st.session_state:
     st.session_state.current_page = "chat"
 
+if "context_start" not in st.session_state:
+    st.session_state.context_start = 0
+
+if "history_cursor" not in st.session_state:
+    st.session_state.history_cursor = None
+
+if "usage_log_pending" not in st.session_state:
+    st.session_state.usage_log_pending = False
+
 # スライドバー設定
 with st.sidebar:
     st.title("🤖 Personal LLM Assistant")
+    if TENANT_HEADER:
+        st.caption(f"👤 {st.session_state.tenant}")
     
     # ページ選択
     st.subheader("📑 ページ")
     page = st.radio(
         "ページを選択",
-        ["💬 チャット", "📊 使用量", "📅 スケジュール"],
+        ["💬 チャット", "📊 使用量", "📅 スケジュール", "📤 エクスポート"],
         key="page_selector",
         label_visibility="collapsed"
     )
@@ -62,6 +164,8 @@ with st.sidebar:
         st.session_state.current_page = "usage"
     elif page == "📅 スケジュール":
         st.session_state.current_page = "schedule"
+    elif page == "📤 エクスポート":
+        st.session_state.current_page = "export"
     
     st.divider()
     
@@ -81,11 +185,12 @@ with st.sidebar:
         if selected_avatar != st.session_state.current_avatar:
             st.session_state.current_avatar = selected_avatar
             # Load conversation history for selected avatar
-            conversations = get_conversations(selected_avatar)
-            st.session_state.messages = [
-                {"role": conv.role, "content": conv.content}
-                for conv in conversations
-            ]
+            # (書き込みキューに残っている発言も含めるため先に反映)
+            flush_writes()
+            conversations = get_conversations(selected_avatar, limit=HISTORY_PAGE_SIZE)
+            st.session_state.messages = history_messages(conversations)
+            st.session_state.history_cursor = history_cursor(conversations)
+            st.session_state.context_start = 0
             st.rerun()
         
         # 現在表示されているアバターの状態
@@ -94,44 +199,65 @@ with st.sidebar:
         
         st.divider()
         
-        # Quick stats
+        # Quick stats（使用履歴が書き込まれるまではキャッシュした集計を表示）
         st.subheader("📊 簡易統計")
-        from database import SessionLocal, UsageLog
-        from sqlalchemy import func
-        
-        db = SessionLocal()
-        today_stats = db.query(
-            func.count(UsageLog.id).label('count'),
-            func.sum(UsageLog.cost).label('cost')
-        ).filter(
-            func.date(UsageLog.timestamp) == func.date(func.now())
-        ).first()
-        db.close()
+        if st.session_state.usage_log_pending:
+            # 直前の応答の使用履歴を反映してから集計する
+            flush_writes()
+            st.session_state.usage_log_pending = False
+        today_stats = get_today_stats()
         
         col1, col2 = st.columns(2)
         with col1:
-            st.metric("今日のリクエスト", f"{today_stats.count or 0}")
+            st.metric("今日のリクエスト", f"{today_stats['count']}")
         with col2:
-            st.metric("今日のコスト", f"${today_stats.cost or 0:.3f}")
+            st.metric("今日のコスト", f"${today_stats['cost']:.3f}")
+        
+        st.divider()
+        
+        # 会話検索
+        show_search_sidebar()
         
         st.divider()
         
         # チャット履歴のクリア
         if st.button("🗑️ チャット履歴をクリア", type="secondary", use_container_width=True):
             st.session_state.messages = []
+            st.session_state.history_cursor = None
+            st.session_state.context_start = 0
             st.rerun()
 
 # メイン部
 if st.session_state.current_page == "usage":
+    from usage_dashboard import show_usage_dashboard
     show_usage_dashboard()
 
 elif st.session_state.current_page == "schedule":
+    from schedule_page import show_schedule_page
     show_schedule_page()
 
+elif st.session_state.current_page == "export":
+    from export_page import show_export_page
+    show_export_page()
+
 else:  # チャットページ
     current_config = get_avatar_config(st.session_state.current_avatar)
     st.title(f"{current_config['icon']} {current_config['name']}")
     
+    # 古い会話履歴の読み込み（表示中の最古の発言より前を1ページ分だけ取得して先頭に追加）
+    if st.session_state.history_cursor is not None:
+        if st.button("⬆️ 以前のメッセージを読み込む", use_container_width=True):
+            older = get_conversations(
+                st.session_state.current_avatar,
+                limit=HISTORY_PAGE_SIZE,
+                before=st.session_state.history_cursor
+            )
+            st.session_state.messages = history_messages(older) + st.session_state.messages
+            st.session_state.history_cursor = history_cursor(older)
+            # 表示用に読み込んだ履歴は API に送る範囲を広げない
+            st.session_state.context_start += len(older)
+            st.rerun()
+    
     # チャットメッセージの表示
     for message in st.session_state.messages:
         with st.chat_message(message["role"]):
@@ -140,10 +266,17 @@ else:  # チャットページ
     # チャットメッセージ入力
     if prompt := st.chat_input("メッセージを入力..."):
         # Add user message to chat
-        st.session_state.messages.append({"role": "user", "content": prompt})
+        user_message = {"role": "user", "content": prompt}
+        st.session_state.messages.append(user_message)
+        
+        # 段階ごとの所要時間（使用履歴に保存）
+        timer = StageTimer()
         
-        # DB への保存
-        add_conversation(st.session_state.current_avatar, "user", prompt)
+        # DB への保存（バックグラウンドで書き込むため、計測はキューに積むまで）
+        with timer.stage("db_enqueue"):
+            user_message["timestamp"] = queue_conversation(
+                st.session_state.current_avatar, "user", prompt
+            )
         
         # ユーザーメッセージの表示
         with st.chat_message("user"):
@@ -151,23 +284,51 @@ else:  # チャットページ
         
         # スケジュール関連の処理（秘書アバターの場合）
         schedule_handled = False
-        if st.session_state.current_avatar == "secretary" and is_schedule_command(prompt):
+        intent = "none"
+        if st.session_state.current_avatar == "secretary":
+            intent = route_intent(prompt)["intent"]
+        
+        if intent != "none":
             # スケジュール確認の場合
-            if any(word in prompt for word in ['確認', '教えて', '見せて', '一覧', 'リスト']):
+            if intent == "list":
                 schedules = get_schedules(limit=20)
                 response_text = format_schedule_list(schedules)
                 schedule_handled = True
+            # スケジュール完了・削除の場合（タイトルが含まれる予定を対象にする）
+            elif intent in ("complete", "delete"):
+                targets = [s for s in get_schedules(limit=100) if s.title in prompt]
+                if len(targets) == 1:
+                    target = targets[0]
+                    dt_str = target.scheduled_datetime.strftime("%Y年%m月%d日 %H:%M")
+                    if intent == "complete":
+                        complete_schedule(target.id)
+                        response_text = f"✅ 予定を完了にしました:\n\n**{target.title}**\n📅 {dt_str}"
+                    else:
+                        delete_schedule(target.id)
+                        response_text = f"🗑️ 予定を削除しました:\n\n**{target.title}**\n📅 {dt_str}"
+                elif targets:
+                    response_text = "該当する予定が複数あります。どの予定か日時も含めて教えてください。\n\n" \
+                        + format_schedule_list(targets)
+                else:
+                    response_text = "対象の予定が見つかりませんでした。予定のタイトルを含めて教えてください。\n\n" \
+                        + format_schedule_list(get_schedules(limit=20))
+                schedule_handled = True
             # スケジュール追加の場合
-            elif any(word in prompt for word in ['入れて', '追加', '登録', '予約']):
+            elif intent == "add":
                 try:
                     schedule_info = parse_schedule_request(prompt)
                     if schedule_info["datetime"] and schedule_info["title"]:
+                        description = ""
+                        dt_str = schedule_info["datetime"].strftime("%Y年%m月%d日 %H:%M")
+                        if schedule_info["end_datetime"]:
+                            end_str = schedule_info["end_datetime"].strftime("%H:%M")
+                            description = f"{schedule_info['datetime'].strftime('%H:%M')}〜{end_str}"
+                            dt_str += f"〜{end_str}"
                         add_schedule(
                             schedule_info["title"],
                             schedule_info["datetime"],
-                            ""
+                            description
                         )
-                        dt_str = schedule_info["datetime"].strftime("%Y年%m月%d日 %H:%M")
                         response_text = f"✅ スケジュールを追加しました:\n\n**{schedule_info['title']}**\n📅 {dt_str}"
                         schedule_handled = True
                 except Exception as e:
@@ -185,62 +346,148 @@ else:  # チャットページ
             else:
                 # 通常のLLM応答
                 full_response = ""
+                stream = None
                 
                 try:
-                    # API
+                    context_started = timer.clock()
+                    
+                    # 要約済みの発言は送らず、代わりに要約を送る（要約はバックグラウンドで更新）
+                    summary = None
+                    if current_config["rolling_summary"]:
+                        summary = get_conversation_summary(st.session_state.current_avatar)
+                    # リマインダーの通知は会話ではないため送らない（context_start もこの並びでの位置）
+                    history = [m for m in st.session_state.messages if m.get("kind") != "reminder"]
+                    summarized = summarized_count(history, summary)
+                    
+                    # API（入力トークン予算に収まる最新の履歴のみ送信）
+                    context = fit_to_budget(
+                        history[summarized:],
+                        current_config["context_token_budget"],
+                        max(st.session_state.context_start - summarized, 0)
+                    )
+                    st.session_state.context_start = context["start"] + summarized
                     api_messages = [{"role": m["role"], "content": m["content"]} 
-                                  for m in st.session_state.messages]
+                                  for m in context["messages"]]
                     
                     # スケジュール情報をコンテキストに追加（秘書の場合）
-                    system_prompt = current_config["system_prompt"]
+                    # 固定のシステムプロンプトと履歴はキャッシュし、要約・予定一覧は最新の発言の後ろに置く
+                    schedule_context = ""
                     if st.session_state.current_avatar == "secretary":
-                        schedules = get_schedules(limit=10)
-                        if schedules:
-                            schedule_context = "\n\n現在登録されている予定:\n"
-                            for s in schedules:
-                                schedule_context += f"- {s.scheduled_datetime.strftime('%m/%d %H:%M')}: {s.title}\n"
-                            system_prompt += schedule_context
+                        schedule_context = get_schedule_context(prompt)
+                    dynamic_context = "\n\n".join(
+                        part for part in (format_summary_context(summary), schedule_context) if part
+                    )
                     
                     # Claude API の呼び出し
-                    with client.messages.stream(
+                    request = build_stream_request(
                         model="claude-sonnet-4-20250514",
                         max_tokens=4096,
-                        system=system_prompt,
-                        messages=api_messages
-                    ) as stream:
-                        for text in stream.text_stream:
-                            full_response += text
-                            message_placeholder.markdown(full_response + "▌")
-                    
-                    message_placeholder.markdown(full_response)
+                        system_prompt=current_config["system_prompt"],
+                        messages=api_messages,
+                        dynamic_context=dynamic_context
+                    )
+                    renderer = ThrottledRenderer(message_placeholder)
                     
-                    # 使用情報の取得
-                    message = stream.get_final_message()
-                    input_tokens = message.usage.input_tokens
-                    output_tokens = message.usage.output_tokens
+                    # 応答キャッシュ（有効なアバターのみ、完全一致のリクエストを再利用）
+                    key = None
+                    cached_response = None
+                    if current_config["response_cache"]:
+                        key = cache_key(request)
+                        cached_response = response_cache.get(key)
                     
-                    # コスト計算
-                    input_cost = float(os.getenv("CLAUDE_SONNET_4_5_INPUT_COST", 3.0))
-                    output_cost = float(os.getenv("CLAUDE_SONNET_4_5_OUTPUT_COST", 15.0))
-                    total_cost = (input_tokens / 1_000_000 * input_cost) + (output_tokens / 1_000_000 * output_cost)
+                    timer.record("context", context_started)
                     
-                    # 使用履歴の保存
-                    add_usage_log(
-                        st.session_state.current_avatar,
-                        input_tokens,
-                        output_tokens,
-                        total_cost
-                    )
+                    if cached_response is not None:
+                        # キャッシュした応答をストリーミングと同じように表示
+                        # （長い応答も REPLAY_MAX_SECONDS 秒で表示し終える）
+                        for text in replay_chunks(cached_response):
+                            renderer.append(text)
+                            time.sleep(REPLAY_INTERVAL)
+                        full_response = renderer.finish()
+                        
+                        queue_usage_log(
+                            st.session_state.current_avatar,
+                            input_tokens=0,
+                            output_tokens=0,
+                            cost=0.0,
+                            response_cache_hits=1,
+                            **timer.metrics()
+                        )
+                        st.session_state.usage_log_pending = True
+                    else:
+                        # 最初のトークンが遅い・途中で止まった応答はやり直す
+                        from stream_guard import GuardedStream
+                        stream_started = timer.clock()
+                        with GuardedStream(
+                            get_request_scheduler(),
+                            st.session_state.session_id,
+                            request,
+                            on_retry=renderer.reset
+                        ) as stream:
+                            for text in stream.text_stream:
+                                timer.record_once("ttft", stream_started)
+                                renderer.append(text)
+                        
+                        full_response = renderer.finish()
+                        
+                        # 使用情報の取得
+                        message = stream.get_final_message()
+                        timer.record("stream", stream_started)
+                        # 取り消したヘッジ・やり直した送信の分も課金されるため合算する
+                        usage = usage_from_message(message)
+                        for name, tokens in stream.abandoned_usage().items():
+                            usage[name] += tokens
+                        
+                        # 途中で打ち切られていない応答のみキャッシュ
+                        if key is not None and message.stop_reason == "end_turn":
+                            response_cache.put(key, st.session_state.current_avatar, full_response)
+                        
+                        # コスト計算（キャッシュ書き込み・読み込みは別単価）
+                        total_cost = calculate_cost(**usage)
+                        
+                        # 使用履歴の保存
+                        queue_usage_log(
+                            st.session_state.current_avatar,
+                            cost=total_cost,
+                            context_trimmed_tokens=context["trimmed_tokens"],
+                            response_cache_misses=0 if key is None else 1,
+                            stream_retries=stream.retries,
+                            stream_hedges=stream.hedges,
+                            **timer.metrics(),
+                            **usage
+                        )
+                        st.session_state.usage_log_pending = True
                     
                 except Exception as e:
                     st.error(f"エラーが発生しました: {str(e)}")
                     full_response = "申し訳ございません。エラーが発生しました。"
                     message_placeholder.markdown(full_response)
+                    
+                    # 再試行を使い切った場合も、それまでの送信で課金された分は使用履歴に残す
+                    if stream is not None:
+                        usage = stream.abandoned_usage()
+                        if any(usage.values()):
+                            queue_usage_log(
+                                st.session_state.current_avatar,
+                                cost=calculate_cost(**usage),
+                                stream_retries=stream.retries,
+                                stream_hedges=stream.hedges,
+                                **usage
+                            )
+                            st.session_state.usage_log_pending = True
         
-        # チャット履歴のアシスタントの返答の追加
-        st.session_state.messages.append({"role": "assistant", "content": full_response})
+        # チャット履歴のアシスタントの返答の追加（DB への保存はバックグラウンドで書き込み）
+        st.session_state.messages.append({
+            "role": "assistant",
+            "content": full_response,
+            "timestamp": queue_conversation(st.session_state.current_avatar, "assistant", full_response)
+        })
         
-        # DB への保存
-        add_conversation(st.session_state.current_avatar, "assistant", full_response)
+        # 古い発言が溜まっていれば要約を更新（チャットの応答は待たせない）
+        if current_config["rolling_summary"]:
+            get_summarizer().request_refresh(st.session_state.current_avatar)
         
-        st.rerun()
\ No newline at end of file
+        st.rerun()
+
+# リマインダーの確認（チャットの処理が終わった後に置き、定期的にこの部分だけ再実行する）
+show_reminders()
@@ -11,7 +11,10 @@ AVATARS = {
 - ユーザーのペースを尊重する
 
 温かく、優しい口調で会話してください。""",
-        "color": "#FFB6C1"
+        "color": "#FFB6C1",
+        "context_token_budget": 24000,  # 履歴として送る入力トークンの上限
+        "response_cache": False,  # 同じリクエストへの応答を再利用するか
+        "rolling_summary": True  # 古い発言を要約して送るか
     },
     
     "tech_advisor": {
@@ -26,7 +29,10 @@ AVATARS = {
 - 必要に応じて代替案や注意点も提示する
 
 論理的で明確な説明を心がけ、専門用語を使う際は適切に解説してください。""",
-        "color": "#87CEEB"
+        "color": "#87CEEB",
+        "context_token_budget": 32000,  # 履歴として送る入力トークンの上限
+        "response_cache": True,  # 同じリクエストへの応答を再利用するか
+        "rolling_summary": False  # 古い発言を要約して送るか
     },
     
     "secretary": {
@@ -42,7 +48,10 @@ AVATARS = {
 
 スケジュールに関する依頼があった場合は、日時とタイトルを明確に確認してください。
 丁寧かつ効率的な口調で、ビジネスライクに対応してください。""",
-        "color": "#98FB98"
+        "color": "#98FB98",
+        "context_token_budget": 8000,  # 履歴として送る入力トークンの上限
+        "response_cache": False,  # 同じリクエストへの応答を再利用するか
+        "rolling_summary": False  # 古い発言を要約して送るか
     }
 }
 
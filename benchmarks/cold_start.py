@@ -0,0 +1,120 @@
+"""
+app.py の起動時間・再実行時間のチェック（-X importtime で import を計測）
+
+実行: uv run python -m benchmarks.cold_start
+
+新しいプロセスで AppTest から app.py のチャットページを実行し、
+- アプリが import したモジュールの合計時間（-X importtime の cumulative）
+- 初回実行・再実行（チャットの1ターンに相当する rerun）の所要時間
+- チャットページで読み込まれてはいけない重いモジュール（pandas / plotly.express / pyarrow など）
+を調べる。上限を超えるか重いモジュールが読み込まれていれば終了コード 1 を返す。
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# チャットページの表示だけでは import されないはずのモジュール
+# （AppTest 側が先に読み込んでいるものは数えない）
+FORBIDDEN_ON_CHAT = ["pandas", "plotly.express", "plotly.graph_objects", "pyarrow"]
+
+# 上限（app.py の import 時間の合計と、再実行の p50）
+MAX_IMPORT_MS = 1000.0
+MAX_RERUN_MS = 150.0
+
+# ここより後の import をアプリによるものとして数える
+MARKER = "--- app start ---"
+
+CHILD_SCRIPT = """
+import json, statistics, sys, time
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file({app!r}, default_timeout=120)
+preloaded = set(sys.modules)
+print({marker!r}, file=sys.stderr, flush=True)
+started = time.perf_counter()
+at.run()
+first_run = (time.perf_counter() - started) * 1000
+if at.exception:
+    raise SystemExit(at.exception[0].value)
+reruns = []
+for _ in range({reruns}):
+    started = time.perf_counter()
+    at.run()
+    reruns.append((time.perf_counter() - started) * 1000)
+loaded = sorted(name for name in {forbidden!r} if name in set(sys.modules) - preloaded)
+print(json.dumps({{
+    "first_run_ms": round(first_run, 1),
+    "rerun_p50_ms": round(statistics.median(reruns), 1),
+    "forbidden_loaded": loaded,
+}}))
+"""
+
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+def app_imports(stderr: str) -> dict:
+    """マーカー以降の import のうち、最上位の import の cumulative（ミリ秒）をモジュールごとに返す"""
+    _, _, after = stderr.partition(MARKER)
+    imports = {}
+    for line in after.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match and len(match.group(3)) == 1:
+            imports[match.group(4)] = int(match.group(2)) / 1000
+    return imports
+
+def run_child(reruns: int) -> tuple:
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(
+            os.environ,
+            DATABASE_URL=f"sqlite:///{Path(tmp) / 'cold_start.db'}",
+            ANTHROPIC_API_KEY=os.environ.get("ANTHROPIC_API_KEY", "fake"),
+        )
+        script = CHILD_SCRIPT.format(
+            app=str(ROOT / "app.py"), marker=MARKER, reruns=reruns, forbidden=FORBIDDEN_ON_CHAT
+        )
+        completed = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", script],
+            cwd=ROOT, env=env, capture_output=True, text=True
+        )
+    if completed.returncode != 0:
+        raise SystemExit(completed.stderr[-2000:])
+    return json.loads(completed.stdout.strip().splitlines()[-1]), app_imports(completed.stderr)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--reruns", type=int, default=10)
+    parser.add_argument("--max-import-ms", type=float, default=MAX_IMPORT_MS,
+                        help="アプリの import 時間の上限")
+    parser.add_argument("--max-rerun-ms", type=float, default=MAX_RERUN_MS,
+                        help="再実行の p50 の上限")
+    parser.add_argument("--top", type=int, default=10, help="表示する重い import の件数")
+    args = parser.parse_args()
+
+    timings, imports = run_child(args.reruns)
+    import_ms = sum(imports.values())
+    result = {
+        "import_ms": round(import_ms, 1),
+        **timings,
+        "slowest_imports_ms": dict(
+            sorted(((k, round(v, 1)) for k, v in imports.items()), key=lambda kv: -kv[1])[:args.top]
+        ),
+    }
+    failures = []
+    if import_ms > args.max_import_ms:
+        failures.append(f"import time {import_ms:.0f}ms > {args.max_import_ms:.0f}ms")
+    if timings["rerun_p50_ms"] > args.max_rerun_ms:
+        failures.append(f"rerun p50 {timings['rerun_p50_ms']:.0f}ms > {args.max_rerun_ms:.0f}ms")
+    if timings["forbidden_loaded"]:
+        failures.append(f"chat page imported {', '.join(timings['forbidden_loaded'])}")
+    result["failures"] = failures
+    print(json.dumps(result, indent=2))
+    if failures:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""
+Messages API のローカル偽サーバー（オフラインでの動作確認・ベンチマーク用）
+
+実行: uv run python -m benchmarks.fake_anthropic --port 8765
+      ANTHROPIC_BASE_URL=http://127.0.0.1:8765 uv run streamlit run app.py
+
+POST /v1/messages にストリーミング（SSE）で応答する。リクエスト数・入力トークン数を
+API と同じくトークンバケットで制限し、超えたら 429 と retry-after を返す。
+レート制限ヘッダー（anthropic-ratelimit-*）も本物と同じ名前で返す。
+slow_fraction の割合のリクエストは最初のトークンを slow_delay 秒遅らせ、
+stall_fraction の割合のリクエストは応答の途中で stall_delay 秒止まる。
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from request_scheduler import TokenBucket, estimate_request_tokens
+
+def _reset_header(seconds: float) -> str:
+    reset_at = datetime.now(timezone.utc) + timedelta(seconds=seconds)
+    return reset_at.isoformat().replace("+00:00", "Z")
+
+class FakeAnthropicServer:
+    """レート制限つきの偽 Messages API"""
+
+    def __init__(self, requests_per_minute: int = 50, input_tokens_per_minute: int = 30000,
+                 period: float = 60.0, first_token_delay: float = 0.05,
+                 token_interval: float = 0.005, response_tokens: int = 40,
+                 slow_fraction: float = 0.0, slow_delay: float = 0.0,
+                 stall_fraction: float = 0.0, stall_delay: float = 0.0, seed: int = 0,
+                 host: str = "127.0.0.1", port: int = 0):
+        self.requests = TokenBucket(requests_per_minute, period)
+        self.input_tokens = TokenBucket(input_tokens_per_minute, period)
+        self.first_token_delay = first_token_delay
+        self.token_interval = token_interval
+        self.response_tokens = response_tokens
+        self.slow_fraction = slow_fraction
+        self.slow_delay = slow_delay
+        self.stall_fraction = stall_fraction
+        self.stall_delay = stall_delay
+        self._random = random.Random(seed)
+        self.stats = {"requests": 0, "rate_limited": 0, "completed": 0, "max_concurrent": 0}
+        self._concurrent = 0
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> str:
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self.base_url
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def _admit(self, input_tokens: int):
+        """受け付けられれば None、制限超過なら retry-after の秒数"""
+        with self._lock:
+            self.stats["requests"] += 1
+            wait = max(self.requests.wait_time(1), self.input_tokens.wait_time(input_tokens))
+            if wait > 0:
+                self.stats["rate_limited"] += 1
+                return wait
+            self.requests.consume(1)
+            self.input_tokens.consume(input_tokens)
+            self._concurrent += 1
+            self.stats["max_concurrent"] = max(self.stats["max_concurrent"], self._concurrent)
+            return None
+
+    def _rate_limit_headers(self) -> dict:
+        headers = {}
+        with self._lock:
+            for kind, bucket in (("requests", self.requests), ("input-tokens", self.input_tokens)):
+                bucket.consume(0)
+                missing = bucket.capacity - max(bucket.tokens, 0)
+                headers[f"anthropic-ratelimit-{kind}-limit"] = str(int(bucket.capacity))
+                headers[f"anthropic-ratelimit-{kind}-remaining"] = str(int(max(bucket.tokens, 0)))
+                headers[f"anthropic-ratelimit-{kind}-reset"] = _reset_header(missing / bucket.rate)
+        return headers
+
+    def _response_text(self, request: dict) -> list:
+        last = request["messages"][-1]["content"]
+        if not isinstance(last, str):
+            last = "".join(block.get("text", "") for block in last)
+        return [f"「{last[:20]}」への応答です。"] + [f"トークン{i} " for i in range(self.response_tokens)]
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _send_json(self, status: int, body: dict, headers: dict):
+                payload = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("content-type", "application/json")
+                self.send_header("content-length", str(len(payload)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _event(self, name: str, data: dict):
+                self.wfile.write(f"event: {name}\ndata: {json.dumps(data)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+
+            def do_POST(self):
+                length = int(self.headers.get("content-length", 0))
+                request = json.loads(self.rfile.read(length))
+                input_tokens = estimate_request_tokens(request)
+
+                retry_after = server._admit(input_tokens)
+                if retry_after is not None:
+                    headers = server._rate_limit_headers()
+                    headers["retry-after"] = f"{retry_after:.3f}"
+                    self._send_json(429, {
+                        "type": "error",
+                        "error": {"type": "rate_limit_error", "message": "rate limited"},
+                    }, headers)
+                    return
+
+                try:
+                    self._stream(request, input_tokens)
+                    with server._lock:
+                        server.stats["completed"] += 1
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+                finally:
+                    with server._lock:
+                        server._concurrent -= 1
+
+            def _stream(self, request: dict, input_tokens: int):
+                self.send_response(200)
+                self.send_header("content-type", "text/event-stream")
+                for name, value in server._rate_limit_headers().items():
+                    self.send_header(name, value)
+                self.end_headers()
+
+                self._event("message_start", {"type": "message_start", "message": {
+                    "id": "msg_fake", "type": "message", "role": "assistant",
+                    "model": request["model"], "content": [], "stop_reason": None,
+                    "stop_sequence": None,
+                    "usage": {"input_tokens": input_tokens, "output_tokens": 1,
+                              "cache_creation_input_tokens": 0, "cache_read_input_tokens": 0},
+                }})
+                self._event("content_block_start", {
+                    "type": "content_block_start", "index": 0,
+                    "content_block": {"type": "text", "text": ""},
+                })
+                with server._lock:
+                    slow = server._random.random() < server.slow_fraction
+                    stall = server._random.random() < server.stall_fraction
+                time.sleep(server.first_token_delay + (server.slow_delay if slow else 0.0))
+                words = server._response_text(request)
+                for i, word in enumerate(words):
+                    if stall and i == len(words) // 2:
+                        time.sleep(server.stall_delay)
+                    self._event("content_block_delta", {
+                        "type": "content_block_delta", "index": 0,
+                        "delta": {"type": "text_delta", "text": word},
+                    })
+                    time.sleep(server.token_interval)
+                self._event("content_block_stop", {"type": "content_block_stop", "index": 0})
+                self._event("message_delta", {
+                    "type": "message_delta",
+                    "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                    "usage": {"output_tokens": len(words)},
+                })
+                self._event("message_stop", {"type": "message_stop"})
+
+        return Handler
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--requests-per-minute", type=int, default=50)
+    parser.add_argument("--input-tokens-per-minute", type=int, default=30000)
+    parser.add_argument("--first-token-delay", type=float, default=0.3)
+    parser.add_argument("--token-interval", type=float, default=0.03)
+    args = parser.parse_args()
+
+    server = FakeAnthropicServer(
+        requests_per_minute=args.requests_per_minute,
+        input_tokens_per_minute=args.input_tokens_per_minute,
+        first_token_delay=args.first_token_delay,
+        token_interval=args.token_interval,
+        port=args.port,
+    )
+    print(f"fake Messages API: {server.base_url}")
+    try:
+        server._httpd.serve_forever()
+    except KeyboardInterrupt:
+        server._httpd.server_close()
+
+if __name__ == "__main__":
+    main()
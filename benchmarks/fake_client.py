@@ -0,0 +1,95 @@
+"""
+AsyncAnthropic の代わりに使うプロセス内の偽クライアント（HTTP を使わない）
+
+RequestScheduler にそのまま渡せる。最初のトークンまでの時間・トークン間隔・応答の長さを
+指定でき、ネットワークや偽サーバーのばらつき無しにアプリ側の処理時間だけを測れる。
+stalled_calls を指定すると、最初のその回数の呼び出しは最初のトークンの後で stall_seconds 秒止まる。
+errors には最初の呼び出しから順に送出する例外を指定できる（None の回は成功する）。
+
+    client = FakeAsyncAnthropic(first_token_delay=0.2, token_interval=0.01)
+    scheduler = RequestScheduler(client)
+"""
+import asyncio
+from types import SimpleNamespace
+
+from request_scheduler import estimate_request_tokens
+
+class _FakeStream:
+    def __init__(self, client, request: dict):
+        self._client = client
+        self._request = request
+        self._words = client.response_words(request)
+        self._stalls = client.calls <= client.stalled_calls
+        self._error = client.errors[client.calls - 1] if client.calls <= len(client.errors) else None
+        self.response = SimpleNamespace(headers={})
+        self._snapshot = None
+        self.text_stream = self._iter_text()
+
+    @property
+    def current_message_snapshot(self):
+        # SDK と同じく message_start の前は使えない
+        assert self._snapshot is not None
+        return self._snapshot
+
+    async def __aenter__(self):
+        if self._error is not None:
+            raise self._error
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    def _usage(self, output_tokens: int):
+        return SimpleNamespace(
+            input_tokens=estimate_request_tokens(self._request),
+            output_tokens=output_tokens,
+            cache_creation_input_tokens=0,
+            cache_read_input_tokens=0,
+        )
+
+    async def _iter_text(self):
+        await asyncio.sleep(self._client.first_token_delay)
+        self._snapshot = SimpleNamespace(usage=self._usage(1))
+        for word in self._words:
+            yield word
+            if self._stalls:
+                await asyncio.sleep(self._client.stall_seconds)
+            if self._client.token_interval:
+                await asyncio.sleep(self._client.token_interval)
+
+    async def get_final_message(self):
+        async for _ in self.text_stream:
+            pass
+        return SimpleNamespace(
+            stop_reason="end_turn",
+            content=[SimpleNamespace(type="text", text="".join(self._words))],
+            usage=self._usage(len(self._words)),
+        )
+
+class _FakeMessages:
+    def __init__(self, client):
+        self._client = client
+
+    def stream(self, **request):
+        self._client.calls += 1
+        return _FakeStream(self._client, request)
+
+class FakeAsyncAnthropic:
+    """messages.stream だけを持つ AsyncAnthropic 互換の偽クライアント"""
+
+    def __init__(self, api_key: str = None, first_token_delay: float = 0.0,
+                 token_interval: float = 0.0, response_tokens: int = 50, stalled_calls: int = 0,
+                 stall_seconds: float = 60.0, errors: list = (), **kwargs):
+        self.first_token_delay = first_token_delay
+        self.token_interval = token_interval
+        self.response_tokens = response_tokens
+        self.stalled_calls = stalled_calls
+        self.stall_seconds = stall_seconds
+        self.errors = list(errors)
+        self.calls = 0
+        self.messages = _FakeMessages(self)
+
+    def response_words(self, request: dict) -> list:
+        return ["これは偽クライアントの応答です。"] + [
+            f"トークン{i} " for i in range(self.response_tokens - 1)
+        ]
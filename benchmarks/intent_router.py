@@ -0,0 +1,97 @@
+"""
+秘書アバターの意図判定ベンチマーク
+
+実行: uv run python -m benchmarks.intent_router
+
+ラベル付きの発言で、従来のキーワードループ（is_schedule_command と any(...) の判定）と
+IntentRouter の正解率・1秒あたりの判定件数を比較する。
+"""
+import argparse
+import json
+import time
+
+from intent_router import route_intent
+from scheduler import is_schedule_command
+
+LABELED_PROMPTS = [
+    ("予定を教えて", "list"),
+    ("今日の予定は何がある？", "list"),
+    ("スケジュール一覧", "list"),
+    ("明日の会議を確認したい", "list"),
+    ("来週の予定を見せて", "list"),
+    ("予定のリストを出して", "list"),
+    ("明日の10時に会議を入れて", "add"),
+    ("来週月曜15時にミーティングを追加", "add"),
+    ("3日後の14時に打ち合わせを登録して", "add"),
+    ("金曜の夜7時に歯医者を予約して", "add"),
+    ("10月20日 午後2時から4時 定例会議を入れといて", "add"),
+    ("定例会議は終わった", "complete"),
+    ("歯医者の予定を完了にして", "complete"),
+    ("打ち合わせ済んだよ", "complete"),
+    ("歯医者の予定を削除して", "delete"),
+    ("飲み会がキャンセルになった", "delete"),
+    ("明日の会議を消して", "delete"),
+    ("Pythonについて教えて", "none"),
+    ("確認", "none"),
+    ("この設定を確認して", "none"),
+    ("疲れたので話を聞いてほしい", "none"),
+    ("メールの文面を考えて", "none"),
+    ("タスクの優先順位の付け方を教えて", "none"),
+    ("タスクの優先順位のつけ方を教えて", "none"),
+    ("テストが終わったので次は何をすればいい？", "none"),
+    ("Pythonのリストに要素を追加する方法を教えて", "none"),
+    ("買い物リストを作って", "none"),
+    ("ありがとう", "none"),
+]
+
+def legacy_route(prompt: str) -> str:
+    """従来の app.py のキーワードループによる判定"""
+    if not is_schedule_command(prompt):
+        return "none"
+    if any(word in prompt for word in ['確認', '教えて', '見せて', '一覧', 'リスト']):
+        return "list"
+    if any(word in prompt for word in ['入れて', '追加', '登録', '予約']):
+        return "add"
+    return "none"
+
+def router_route(prompt: str) -> str:
+    return route_intent(prompt)["intent"]
+
+def evaluate(route) -> dict:
+    failures = []
+    for prompt, expected in LABELED_PROMPTS:
+        got = route(prompt)
+        if got != expected:
+            failures.append({"prompt": prompt, "expected": expected, "got": got})
+    return {
+        "accuracy": 1 - len(failures) / len(LABELED_PROMPTS),
+        "failures": failures,
+    }
+
+def measure_rate(route, seconds: float) -> float:
+    prompts = [prompt for prompt, _ in LABELED_PROMPTS]
+    routed = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        for prompt in prompts:
+            route(prompt)
+        routed += len(prompts)
+    return routed / (time.perf_counter() - start)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=1.0, help="速度計測の時間（方式ごと）")
+    args = parser.parse_args()
+
+    result = {}
+    for name, route in (("legacy", legacy_route), ("router", router_route)):
+        evaluation = evaluate(route)
+        result[name] = {
+            "accuracy": round(evaluation["accuracy"], 3),
+            "routes_per_second": round(measure_rate(route, args.seconds)),
+            "failures": evaluation["failures"],
+        }
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+if __name__ == "__main__":
+    main()
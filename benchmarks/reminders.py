@@ -0,0 +1,116 @@
+"""
+予定のリマインダーのベンチマーク（一時 DB・オフライン実行）
+
+実行: uv run python -m benchmarks.reminders --schedules 1000 10000 100000
+
+--schedules 件の未完了の予定を持つ DB で ReminderEngine を動かし、
+- 最初の poll から最初の分（--load-batch 件）を読み込むまでの時間
+- 予定の追加・完了の通知（on_schedule_change）1回あたりの所要時間の p50 / p99
+  （読み込んだ load_batch 件に --updates 件を加えたヒープで測る。O(log n)）
+- 近い時刻に集中させた --due 件の予定の通知の遅れ（予定時刻 - 通知時刻）の p50 / p99 と、
+  その間に DB を読んだ回数（load_batch 件ごとに1回。定期的な全件の読み直しはしない）
+を測る。
+"""
+import argparse
+import json
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from benchmarks.synthetic_db import configure_database
+from benchmarks.stats import percentiles
+
+def insert_schedules(database, datetimes: list):
+    from database import Schedule
+    if not datetimes:
+        return
+    now = datetime.now()
+    with database.get_engine().begin() as conn:
+        conn.execute(Schedule.__table__.insert(), [
+            {"tenant_id": database.DEFAULT_TENANT, "title": f"予定{i}", "scheduled_datetime": dt,
+             "description": "", "created_at": now, "completed": 0}
+            for i, dt in enumerate(datetimes)
+        ])
+
+def run(database, count: int, args) -> dict:
+    from reminders import ReminderEngine
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database.set_layout(database.SharedLayout(f"sqlite:///{Path(tmp) / 'reminders.db'}"))
+        database.init_db()
+        # 測定中に来ない予定は 1〜365 日後に、--due 件は --due-after 秒後から --due-span 秒の間に置く
+        rest = count - args.due
+        insert_schedules(database, [
+            datetime.now() + timedelta(days=1 + 364 * i / max(rest, 1)) for i in range(rest)
+        ])
+        now = datetime.now()
+        insert_schedules(database, [
+            now + timedelta(seconds=args.due_after + args.due_span * i / max(args.due - 1, 1))
+            for i in range(args.due)
+        ])
+
+        engine = ReminderEngine(lead_minutes=0, load_batch=args.load_batch)
+        engine.start()
+        started = time.perf_counter()
+        engine.poll("bench")
+        while engine.stats["loads"] == 0:
+            time.sleep(0.001)
+        first_load_ms = (time.perf_counter() - started) * 1000
+
+        # 通知の処理だけを測る（DB への書き込みは含めない）
+        # 読み込み済みの範囲（最初の通知より前）に追加してヒープに入れ、通知時刻の前に完了にする
+        soon = now + timedelta(seconds=args.due_after / 2)
+        add_ms, remove_ms = [], []
+        for i in range(args.updates):
+            schedule_id = 10_000_000 + i
+            started = time.perf_counter()
+            engine.on_schedule_change("added", schedule_id, soon + timedelta(microseconds=i), "追加")
+            add_ms.append((time.perf_counter() - started) * 1000)
+        heap_size = len(engine._heap)
+        for i in range(args.updates):
+            started = time.perf_counter()
+            engine.on_schedule_change("completed", 10_000_000 + i, None, None)
+            remove_ms.append((time.perf_counter() - started) * 1000)
+
+        lateness = []
+        deadline = time.monotonic() + args.due_after + args.due_span + 5
+        while len(lateness) < args.due and time.monotonic() < deadline:
+            for reminder in engine.poll("bench"):
+                lateness.append((datetime.now() - reminder["scheduled_datetime"]).total_seconds() * 1000)
+            time.sleep(0.005)
+        engine.stop()
+
+        return {
+            "schedules": count,
+            "first_load_ms": round(first_load_ms, 3),
+            "on_schedule_change_ms": {"add": percentiles(add_ms), "complete": percentiles(remove_ms)},
+            "delivered": len(lateness),
+            "delivery_lateness_ms": percentiles(lateness) if lateness else None,
+            "mean_lateness_ms": round(statistics.mean(lateness), 3) if lateness else None,
+            "db_loads": engine.stats["loads"],
+            "heap_size_after_updates": heap_size,
+        }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--schedules", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--load-batch", type=int, default=500)
+    parser.add_argument("--updates", type=int, default=2000, help="追加・完了の通知の回数")
+    parser.add_argument("--due", type=int, default=1000, help="測定中に通知時刻が来る予定の数")
+    parser.add_argument("--due-after", type=float, default=1.0, help="最初の通知までの秒数")
+    parser.add_argument("--due-span", type=float, default=2.0, help="通知が続く秒数")
+    args = parser.parse_args()
+
+    # 測定する DB は run で差し替える（ここでは import 時の接続先だけ決める）
+    tmp = tempfile.TemporaryDirectory()
+    configure_database(Path(tmp.name) / "unused.db")
+    import database
+
+    results = [run(database, count, args) for count in args.schedules]
+    print(json.dumps(results, indent=2))
+    tmp.cleanup()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+リクエストスケジューラのベンチマーク（偽サーバーを使ってオフラインで実行）
+
+実行: uv run python -m benchmarks.request_scheduler
+
+複数セッションが一斉に送信したときの 429 の回数・失敗数・所要時間・セッションごとの
+完了時間を、各セッションが同期クライアントで個別にリトライする従来方式と
+RequestScheduler で比較する。時間を短縮するため、レート制限の期間（60秒）は
+--period 秒に縮めて扱う。
+"""
+import argparse
+import json
+import statistics
+import threading
+import time
+
+import anthropic
+
+from benchmarks.fake_anthropic import FakeAnthropicServer
+from request_scheduler import RequestScheduler
+
+MODEL = "claude-sonnet-4-20250514"
+
+def make_workload(heavy_requests: int, light_sessions: int, light_requests: int) -> list:
+    """(session_id, request) の一覧。1セッションだけ大量に送る"""
+    workload = []
+    sessions = [("heavy", heavy_requests)] + [
+        (f"light-{i}", light_requests) for i in range(light_sessions)
+    ]
+    for session_id, count in sessions:
+        for i in range(count):
+            workload.append((session_id, {
+                "model": MODEL,
+                "max_tokens": 256,
+                "system": [{"type": "text", "text": "あなたは技術アドバイザーです。"}],
+                "messages": [{"role": "user", "content": f"{session_id} の質問 {i}"}],
+            }))
+    return workload
+
+def summarize(latencies: dict, failures: int, elapsed: float, server: FakeAnthropicServer) -> dict:
+    heavy = latencies.get("heavy", [])
+    light = [t for session_id, values in latencies.items() if session_id != "heavy" for t in values]
+    return {
+        "elapsed_seconds": round(elapsed, 3),
+        "failed": failures,
+        "server_requests": server.stats["requests"],
+        "server_429": server.stats["rate_limited"],
+        "max_concurrent": server.stats["max_concurrent"],
+        "heavy_median_seconds": round(statistics.median(heavy), 3) if heavy else None,
+        "light_median_seconds": round(statistics.median(light), 3) if light else None,
+    }
+
+def run_naive(workload: list, args) -> dict:
+    """セッションごとに同期クライアントで送信し、SDK のリトライに任せる"""
+    server = FakeAnthropicServer(args.requests_per_period, args.tokens_per_period, args.period)
+    client = anthropic.Anthropic(api_key="fake", base_url=server.start(), max_retries=2)
+    latencies, failures, lock = {}, [0], threading.Lock()
+    started = time.monotonic()
+
+    def send(session_id, request):
+        try:
+            with client.messages.stream(**request) as stream:
+                for _ in stream.text_stream:
+                    pass
+            with lock:
+                latencies.setdefault(session_id, []).append(time.monotonic() - started)
+        except anthropic.APIError:
+            with lock:
+                failures[0] += 1
+
+    threads = [threading.Thread(target=send, args=item) for item in workload]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    result = summarize(latencies, failures[0], time.monotonic() - started, server)
+    server.stop()
+    return result
+
+def run_scheduled(workload: list, args) -> dict:
+    """RequestScheduler 経由で送信する"""
+    server = FakeAnthropicServer(args.requests_per_period, args.tokens_per_period, args.period)
+    client = anthropic.AsyncAnthropic(api_key="fake", base_url=server.start(), max_retries=0)
+    scheduler = RequestScheduler(
+        client,
+        requests_per_minute=args.requests_per_period,
+        input_tokens_per_minute=args.tokens_per_period,
+        max_concurrency=args.max_concurrency,
+        period=args.period,
+    )
+    latencies, failures, lock = {}, [0], threading.Lock()
+    started = time.monotonic()
+
+    def send(session_id, request):
+        try:
+            with scheduler.stream(session_id, request) as stream:
+                for _ in stream.text_stream:
+                    pass
+            with lock:
+                latencies.setdefault(session_id, []).append(time.monotonic() - started)
+        except anthropic.APIError:
+            with lock:
+                failures[0] += 1
+
+    threads = [threading.Thread(target=send, args=item) for item in workload]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    result = summarize(latencies, failures[0], time.monotonic() - started, server)
+    result["scheduler"] = dict(scheduler.stats)
+    server.stop()
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--heavy-requests", type=int, default=40)
+    parser.add_argument("--light-sessions", type=int, default=8)
+    parser.add_argument("--light-requests", type=int, default=2)
+    parser.add_argument("--requests-per-period", type=int, default=20)
+    parser.add_argument("--tokens-per-period", type=int, default=100000)
+    parser.add_argument("--period", type=float, default=2.0, help="レート制限の期間（秒）")
+    parser.add_argument("--max-concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    workload = make_workload(args.heavy_requests, args.light_sessions, args.light_requests)
+    result = {
+        "requests": len(workload),
+        "naive": run_naive(workload, args),
+        "scheduled": run_scheduled(workload, args),
+    }
+    print(json.dumps(result, indent=2))
+
+if __name__ == "__main__":
+    main()
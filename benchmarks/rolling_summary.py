@@ -0,0 +1,126 @@
+"""
+会話のローリング要約のベンチマーク（偽クライアントでオフライン実行）
+
+実行: uv run python -m benchmarks.rolling_summary --turns 300
+
+一時 DB 上でメンタルサポートとの会話を --turns 往復分進め、毎ターン app.py と同じ手順で
+送信するリクエストを組み立てて、要約なし（予算内の履歴をすべて送る）と要約あり
+（要約 + 要約していない最近の発言）の入力トークン数（概算）を比べる。
+要約は FakeAsyncAnthropic を渡した RequestScheduler 経由で ConversationSummarizer が
+バックグラウンドで更新し、その間のチャット側の準備時間（要約の読み込み〜リクエスト作成）と
+request_refresh の所要時間も測る（更新の完了は次のターンの前に待つ）。
+要約済みの発言を送っていないことも確かめる。
+"""
+import argparse
+import json
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.fake_client import FakeAsyncAnthropic
+from benchmarks.stats import percentiles
+from benchmarks.synthetic_db import PHRASES, TOPICS, configure_database
+
+AVATAR = "mental_support"
+
+def history_messages(conversations):
+    """app.history_messages と同じ（app は import するとページを描画するため）"""
+    return [
+        {"role": conv.role, "content": conv.content, "id": conv.id, "timestamp": conv.timestamp}
+        for conv in conversations
+    ]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--turns", type=int, default=300, help="ユーザーとアシスタントの往復数")
+    parser.add_argument("--reply-chars", type=int, default=300, help="アシスタントの発言の長さ")
+    parser.add_argument("--keep-recent", type=int, default=10)
+    parser.add_argument("--batch", type=int, default=10)
+    parser.add_argument("--summary-delay", type=float, default=0.2,
+                        help="偽クライアントの最初のトークンまでの時間（秒）")
+    args = parser.parse_args()
+
+    tmp = tempfile.TemporaryDirectory()
+    configure_database(Path(tmp.name) / "summary.db")
+    import database
+    from avatar_configs import get_avatar_config
+    from context_window import fit_to_budget
+    from conversation_summary import (
+        ConversationSummarizer, format_summary_context, summarized_count, summary_cursor
+    )
+    from prompt_cache import build_stream_request
+    from request_scheduler import RequestScheduler, estimate_request_tokens
+
+    config = get_avatar_config(AVATAR)
+    client = FakeAsyncAnthropic(first_token_delay=args.summary_delay, response_tokens=200)
+    # レート制限で待たないよう上限は十分大きくする
+    scheduler = RequestScheduler(client, requests_per_minute=100000, input_tokens_per_minute=10**9)
+    summarizer = ConversationSummarizer(scheduler, args.keep_recent, args.batch)
+    database.init_db()
+
+    def build(messages, summary):
+        summarized = summarized_count(messages, summary)
+        context = fit_to_budget(messages[summarized:], config["context_token_budget"])
+        request = build_stream_request(
+            "claude-sonnet-4-20250514", 4096, config["system_prompt"],
+            [{"role": m["role"], "content": m["content"]} for m in context["messages"]],
+            format_summary_context(summary)
+        )
+        return request, context["messages"]
+
+    baseline, summarized_tokens, prepare_ms, refresh_ms = [], [], [], []
+    for turn in range(args.turns):
+        topic = TOPICS[turn % len(TOPICS)]
+        database.add_conversation(AVATAR, "user", topic + PHRASES[turn % len(PHRASES)])
+        messages = history_messages(database.get_conversations(AVATAR, limit=args.turns * 2))
+
+        request, _ = build(messages, None)
+        baseline.append(estimate_request_tokens(request))
+
+        started = time.perf_counter()
+        summary = database.get_conversation_summary(AVATAR)
+        request, sent = build(messages, summary)
+        prepare_ms.append((time.perf_counter() - started) * 1000)
+        summarized_tokens.append(estimate_request_tokens(request))
+
+        cursor = summary_cursor(summary)
+        if cursor is not None and any((m["timestamp"], m["id"]) <= cursor for m in sent):
+            raise AssertionError(f"turn {turn}: a summarized message was sent")
+
+        reply = f"{topic}についてお話しくださりありがとうございます。" * max(1, args.reply_chars // 30)
+        database.add_conversation(AVATAR, "assistant", reply[:args.reply_chars])
+        started = time.perf_counter()
+        summarizer.request_refresh(AVATAR)
+        refresh_ms.append((time.perf_counter() - started) * 1000)
+        # 実際のチャットでは次の発言まで数秒以上あるため、更新が終わってから次のターンに進む
+        summarizer.join()
+
+    summarizer.join()
+    database.flush_writes()
+    summary = database.get_conversation_summary(AVATAR)
+    usage = database.get_total_usage()  # 要約の更新に使ったトークン（使用履歴に記録される）
+    last = len(baseline) // 10 or 1
+    print(json.dumps({
+        "turns": args.turns,
+        "input_tokens_last_10pct": {
+            "without_summary": round(sum(baseline[-last:]) / last),
+            "with_summary": round(sum(summarized_tokens[-last:]) / last),
+        },
+        "input_tokens_total": {
+            "without_summary": sum(baseline),
+            "with_summary": sum(summarized_tokens),
+        },
+        "summary": {
+            "folded_messages": summary.message_count if summary else 0,
+            "api_calls": client.calls,
+            "input_tokens": usage.total_input or 0,
+            "output_tokens": usage.total_output or 0,
+            **summarizer.stats,
+        },
+        "chat_prepare_ms": percentiles(prepare_ms, with_max=True),
+        "request_refresh_ms": percentiles(refresh_ms, with_max=True),
+    }, indent=2, ensure_ascii=False))
+    tmp.cleanup()
+
+if __name__ == "__main__":
+    main()
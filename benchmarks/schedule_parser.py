@@ -0,0 +1,86 @@
+"""
+スケジュール解析の精度・速度ベンチマーク
+
+実行: uv run python -m benchmarks.schedule_parser
+
+schedule_corpus.json のラベル付きフレーズで parse_schedule_request の
+日時・所要時間・タイトルの正解率と、1秒あたりの解析件数を測る。
+しきい値を下回ると終了コード 1 を返す。
+"""
+import argparse
+import json
+import time
+from datetime import datetime
+from pathlib import Path
+
+from scheduler import parse_schedule_request
+
+CORPUS_PATH = Path(__file__).with_name("schedule_corpus.json")
+
+# 1秒あたり解析件数の下限（tests/test_schedule_parser.py も使う）
+MIN_RATE = 5000.0
+
+def load_corpus(path: Path = CORPUS_PATH):
+    data = json.loads(path.read_text(encoding="utf-8"))
+    return datetime.fromisoformat(data["now"]), data["cases"]
+
+def evaluate(now: datetime, cases: list) -> dict:
+    """フィールドごとの正解数と不正解のケースを返す"""
+    correct = {"datetime": 0, "duration_minutes": 0, "title": 0, "all": 0}
+    failures = []
+    for case in cases:
+        result = parse_schedule_request(case["text"], now=now)
+        got = {
+            "datetime": result["datetime"].isoformat(timespec="minutes"),
+            "duration_minutes": result["duration_minutes"],
+            "title": result["title"],
+        }
+        ok = True
+        for field in ("datetime", "duration_minutes", "title"):
+            if got[field] == case[field]:
+                correct[field] += 1
+            else:
+                ok = False
+        if ok:
+            correct["all"] += 1
+        else:
+            failures.append({"text": case["text"], "expected": case, "got": got})
+    return {
+        "accuracy": {field: count / len(cases) for field, count in correct.items()},
+        "failures": failures,
+    }
+
+def measure_rate(now: datetime, cases: list, seconds: float) -> float:
+    """parse_schedule_request の1秒あたり解析件数"""
+    texts = [case["text"] for case in cases]
+    parsed = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        for text in texts:
+            parse_schedule_request(text, now=now)
+        parsed += len(texts)
+    return parsed / (time.perf_counter() - start)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=1.0, help="速度計測の時間")
+    parser.add_argument("--min-accuracy", type=float, default=1.0, help="全項目正解率の下限")
+    parser.add_argument("--min-rate", type=float, default=MIN_RATE, help="解析件数/秒の下限")
+    args = parser.parse_args()
+
+    now, cases = load_corpus()
+    evaluation = evaluate(now, cases)
+    rate = measure_rate(now, cases, args.seconds)
+
+    print(json.dumps({
+        "cases": len(cases),
+        "accuracy": evaluation["accuracy"],
+        "parses_per_second": round(rate),
+        "failures": evaluation["failures"],
+    }, ensure_ascii=False, indent=2))
+
+    passed = evaluation["accuracy"]["all"] >= args.min_accuracy and rate >= args.min_rate
+    raise SystemExit(0 if passed else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,13 @@
+"""ベンチマークの測定値の集計（各スクリプトで共通）"""
+
+def percentiles(values: list, points: tuple = (0.50, 0.99), with_max: bool = False) -> dict:
+    """values の points のパーセンタイル（{"p50": ..., "p99": ...}、小数3桁）"""
+    ordered = sorted(values)
+
+    def pick(p):
+        return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))], 3)
+
+    result = {f"p{round(p * 100)}": pick(p) for p in points}
+    if with_max:
+        result["max"] = round(ordered[-1], 3)
+    return result
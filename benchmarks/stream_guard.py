@@ -0,0 +1,108 @@
+"""
+ストリーミングのテールレイテンシ対策のベンチマーク（偽サーバーを使ってオフラインで実行）
+
+実行: uv run python -m benchmarks.stream_guard
+
+一部のリクエストで最初のトークンが遅れる・途中で止まる偽サーバーに対して、
+スケジューラのストリームをそのまま使う場合と GuardedStream（停止検知・再試行・ヘッジ）で
+最初のトークンまでの時間と完了までの時間の p50 / p95 / p99 を比較する。
+"""
+import argparse
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import anthropic
+
+from benchmarks.fake_anthropic import FakeAnthropicServer
+from benchmarks.stats import percentiles
+from request_scheduler import RequestScheduler
+from stream_guard import GuardedStream, TTFTTracker
+
+def make_request(i: int) -> dict:
+    return {
+        "model": "claude-sonnet-4-20250514",
+        "max_tokens": 256,
+        "system": [{"type": "text", "text": "あなたは技術アドバイザーです。"}],
+        "messages": [{"role": "user", "content": f"質問 {i}"}],
+    }
+
+def run(args, guarded: bool) -> dict:
+    server = FakeAnthropicServer(
+        requests_per_minute=100000,
+        input_tokens_per_minute=10**9,
+        first_token_delay=args.first_token_delay,
+        token_interval=args.token_interval,
+        slow_fraction=args.slow_fraction,
+        slow_delay=args.slow_delay,
+        stall_fraction=args.stall_fraction,
+        stall_delay=args.slow_delay,
+        seed=args.seed,
+    )
+    client = anthropic.AsyncAnthropic(api_key="fake", base_url=server.start(), max_retries=0)
+    scheduler = RequestScheduler(client, 100000, 10**9, max_concurrency=args.concurrency * 2)
+    tracker = TTFTTracker(min_samples=10)
+    counters = {"retries": 0, "hedges": 0, "abandoned_input_tokens": 0, "abandoned_output_tokens": 0}
+    ttfts, totals, lock = [], [], threading.Lock()
+
+    def send(i):
+        request = make_request(i)
+        started = time.monotonic()
+        first = None
+        if guarded:
+            stream = GuardedStream(
+                scheduler, f"session-{i % args.concurrency}", request,
+                ttft_timeout=args.ttft_timeout, stall_timeout=args.stall_timeout,
+                max_retries=2, hedge=True, hedge_percentile=0.9, tracker=tracker,
+                sleep=lambda seconds: time.sleep(min(seconds, 0.05)),
+            )
+        else:
+            stream = scheduler.stream(f"session-{i % args.concurrency}", request)
+        with stream:
+            for _ in stream.text_stream:
+                if first is None:
+                    first = time.monotonic() - started
+        # 取り消したヘッジ・やり直した送信で課金されたトークン数
+        abandoned = stream.abandoned_usage() if guarded else {}
+        with lock:
+            ttfts.append(first)
+            totals.append(time.monotonic() - started)
+            counters["retries"] += getattr(stream, "retries", 0)
+            counters["hedges"] += getattr(stream, "hedges", 0)
+            counters["abandoned_input_tokens"] += abandoned.get("input_tokens", 0)
+            counters["abandoned_output_tokens"] += abandoned.get("output_tokens", 0)
+
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        list(pool.map(send, range(args.requests)))
+    server.stop()
+    return {
+        "ttft_seconds": percentiles(ttfts, (0.50, 0.95, 0.99)),
+        "total_seconds": percentiles(totals, (0.50, 0.95, 0.99)),
+        "server_requests": server.stats["requests"],
+        **counters,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--first-token-delay", type=float, default=0.05)
+    parser.add_argument("--token-interval", type=float, default=0.002)
+    parser.add_argument("--slow-fraction", type=float, default=0.05)
+    parser.add_argument("--stall-fraction", type=float, default=0.02)
+    parser.add_argument("--slow-delay", type=float, default=1.5, help="遅延・停止する秒数")
+    parser.add_argument("--ttft-timeout", type=float, default=1.0)
+    parser.add_argument("--stall-timeout", type=float, default=0.3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    result = {
+        "requests": args.requests,
+        "plain": run(args, guarded=False),
+        "guarded": run(args, guarded=True),
+    }
+    print(json.dumps(result, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+ストリーミング描画のベンチマーク
+
+実行: uv run python -m benchmarks.stream_render
+
+1応答あたりの placeholder.markdown 呼び出し回数と送信バイト数を、
+差分ごとに全文を描画する従来方式と ThrottledRenderer で比較する。
+"""
+import argparse
+import json
+
+from stream_render import CURSOR, ThrottledRenderer
+
+class RecordingPlaceholder:
+    """markdown 呼び出しを記録するだけの placeholder"""
+
+    def __init__(self):
+        self.calls = 0
+        self.bytes_sent = 0
+        self.last = None
+
+    def markdown(self, body: str):
+        self.calls += 1
+        self.bytes_sent += len(body.encode("utf-8"))
+        self.last = body
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+def make_deltas(tokens: int) -> list:
+    """日本語・コード混在の応答をトークン単位の差分として生成"""
+    pattern = ["これは", "ストリー", "ミング", "応答の", "テスト", "です。", "\n", "```", "python",
+               "\n", "def ", "foo", "():", "\n    ", "return ", "42", "\n", "```", "\n\n"]
+    return [pattern[i % len(pattern)] for i in range(tokens)]
+
+def run_naive(deltas: list) -> dict:
+    placeholder = RecordingPlaceholder()
+    full_response = ""
+    for delta in deltas:
+        full_response += delta
+        placeholder.markdown(full_response + CURSOR)
+    placeholder.markdown(full_response)
+    return {"render_calls": placeholder.calls, "bytes_sent": placeholder.bytes_sent,
+            "final": placeholder.last}
+
+def run_throttled(deltas: list, token_interval: float, frame_interval: float,
+                  char_threshold: int) -> dict:
+    placeholder = RecordingPlaceholder()
+    clock = FakeClock()
+    renderer = ThrottledRenderer(placeholder, frame_interval, char_threshold, clock=clock)
+    for delta in deltas:
+        clock.now += token_interval
+        renderer.append(delta)
+    renderer.finish()
+    return {"render_calls": placeholder.calls, "bytes_sent": placeholder.bytes_sent,
+            "final": placeholder.last}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--tokens", type=int, default=4096, help="応答のトークン数")
+    parser.add_argument("--tokens-per-second", type=float, default=60.0)
+    parser.add_argument("--frame-interval", type=float, default=0.1)
+    parser.add_argument("--char-threshold", type=int, default=400)
+    args = parser.parse_args()
+
+    deltas = make_deltas(args.tokens)
+    naive = run_naive(deltas)
+    throttled = run_throttled(
+        deltas, 1 / args.tokens_per_second, args.frame_interval, args.char_threshold
+    )
+    assert naive["final"] == throttled["final"], "final render differs"
+
+    result = {
+        "tokens": args.tokens,
+        "response_bytes": len("".join(deltas).encode("utf-8")),
+        "naive": {k: v for k, v in naive.items() if k != "final"},
+        "throttled": {k: v for k, v in throttled.items() if k != "final"},
+    }
+    result["reduction"] = {
+        "render_calls": naive["render_calls"] / throttled["render_calls"],
+        "bytes_sent": naive["bytes_sent"] / throttled["bytes_sent"],
+    }
+    print(json.dumps(result, indent=2))
+
+if __name__ == "__main__":
+    main()
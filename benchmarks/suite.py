@@ -0,0 +1,240 @@
+"""
+データベース関数・ページ描画のベンチマーク一式（合成データベースと偽クライアントでオフライン実行）
+
+実行: uv run python -m benchmarks.suite --db bench.db --generate
+      uv run python -m benchmarks.suite --db bench.db --compare benchmarks/results/<前回>.json
+
+--generate を付けると benchmarks.synthetic_db で --usage-rows / --messages の規模の
+データベースを作り直してから測る。各ベンチマークの所要時間（ミリ秒）の平均・p50・p95・最小を
+JSON に保存し、--compare で前回の結果との比（今回 / 前回）を表示する。
+--archive-after-days を付けると、測る前にそれより古い会話をアーカイブへ移す
+（get_conversations.archived_page がアーカイブからの読み出しになる）。
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+from functools import partial
+from pathlib import Path
+
+from benchmarks.synthetic_db import configure_database, populate
+
+ROOT = Path(__file__).resolve().parent.parent
+RESULTS_DIR = Path(__file__).with_name("results")
+
+def measure(fn, repeat: int, warmup: int = 1) -> dict:
+    """fn を warmup 回実行してから repeat 回測る"""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    ordered = sorted(samples)
+    return {
+        "runs": repeat,
+        "mean_ms": round(statistics.fmean(samples), 3),
+        "p50_ms": round(ordered[len(ordered) // 2], 3),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))], 3),
+        "min_ms": round(ordered[0], 3),
+    }
+
+def database_benchmarks(now: datetime) -> list:
+    """(名前, 関数) の一覧。database は接続先の設定後に import する"""
+    import database
+    import usage_stats
+    from schedule_context import get_schedule_context
+
+    today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    month_ago = now - timedelta(days=30)
+
+    # 中ほどの発言を起点に古いページを読む（履歴をさかのぼったときのクエリ）
+    middle = database.get_conversations("tech_advisor", limit=5000)
+    cursor = (middle[0].timestamp, middle[0].id) if middle else None
+    # 60日前より古いページ（--archive-after-days を付けた場合はアーカイブから読む）
+    archived_cursor = (now - timedelta(days=60), 0)
+
+    def queue_and_flush():
+        database.queue_usage_log("tech_advisor", 100, 200, 0.01)
+        database.flush_writes()
+
+    return [
+        ("get_conversations.first_page", partial(database.get_conversations, "tech_advisor")),
+        ("get_conversations.older_page",
+         partial(database.get_conversations, "tech_advisor", before=cursor)),
+        ("get_conversations.archived_page",
+         partial(database.get_conversations, "tech_advisor", before=archived_cursor)),
+        ("search_conversations.fts", partial(database.search_conversations, "インデックス")),
+        ("search_conversations.like", partial(database.search_conversations, "会議")),
+        ("get_schedules", database.get_schedules),
+        ("get_schedule_counts", partial(
+            database.get_schedule_counts,
+            today_start, today_start + timedelta(days=1), today_start + timedelta(days=2)
+        )),
+        ("get_schedules_in_range.today", partial(
+            database.get_schedules_in_range, None, today_start + timedelta(days=1)
+        )),
+        ("get_schedule_context", partial(get_schedule_context, "明日の予定は？", now)),
+        ("get_total_usage", database.get_total_usage),
+        ("get_daily_usage.30d", partial(database.get_daily_usage, month_ago.date())),
+        ("get_avatar_usage.30d", partial(database.get_avatar_usage, month_ago.date())),
+        ("get_latency_histogram.30d", partial(database.get_latency_histogram, month_ago.date())),
+        ("get_latency_histogram.30d.by_date",
+         partial(database.get_latency_histogram, month_ago.date(), "date")),
+        ("get_usage_between.today", partial(
+            database.get_usage_between, today_start, today_start + timedelta(days=1)
+        )),
+        # app.py のサイドバーの「今日」の集計（書き込みが無い間はキャッシュから返る）
+        ("usage_stats.get_today_stats", usage_stats.get_today_stats),
+        ("usage_stats.get_latency_histogram.30d",
+         partial(usage_stats.get_latency_histogram, month_ago.date())),
+        ("add_usage_log", partial(database.add_usage_log, "tech_advisor", 100, 200, 0.01)),
+        ("queue_usage_log.flush", queue_and_flush),
+    ]
+
+def _usage_page():
+    from usage_dashboard import show_usage_dashboard
+    show_usage_dashboard()
+
+def _schedule_page():
+    from schedule_page import show_schedule_page
+    show_schedule_page()
+
+def page_benchmarks(first_token_delay: float, token_interval: float) -> list:
+    """AppTest でページのスクリプトを実行する（Anthropic は偽クライアントに置き換える）"""
+    import anthropic
+    from streamlit.testing.v1 import AppTest
+    from benchmarks.fake_client import FakeAsyncAnthropic
+
+    anthropic.AsyncAnthropic = partial(
+        FakeAsyncAnthropic, first_token_delay=first_token_delay, token_interval=token_interval
+    )
+    os.environ.setdefault("ANTHROPIC_API_KEY", "fake")
+    app_path = str(ROOT / "app.py")
+
+    def render(app):
+        result = app.run()
+        if result.exception:
+            raise RuntimeError(result.exception[0].value)
+        return result
+
+    chat = render(AppTest.from_file(app_path, default_timeout=120))
+
+    def chat_turn():
+        chat.chat_input[0].set_value("SQLite のインデックスについて教えてください").run()
+
+    return [
+        ("page.chat.first_run", lambda: render(AppTest.from_file(app_path, default_timeout=120))),
+        ("page.chat.rerun", lambda: render(chat)),
+        ("page.chat.turn", chat_turn),
+        ("page.usage_dashboard", lambda: render(AppTest.from_function(_usage_page,
+                                                                     default_timeout=120))),
+        ("page.schedule", lambda: render(AppTest.from_function(_schedule_page,
+                                                               default_timeout=120))),
+    ]
+
+def _git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True,
+            check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def _table_counts() -> dict:
+    import database
+    from sqlalchemy import func
+    db = database.get_db()
+    counts = {
+        "usage_logs": db.query(func.count(database.UsageLog.id)).scalar(),
+        "conversations": db.query(func.count(database.Conversation.id)).scalar(),
+        "schedules": db.query(func.count(database.Schedule.id)).scalar(),
+    }
+    db.close()
+    return counts
+
+def compare(current: dict, previous: dict):
+    """p50 の比（今回 / 前回）を表示する"""
+    print(f"{'benchmark':40} {'previous':>10} {'current':>10} {'ratio':>7}")
+    for name, result in current["results"].items():
+        before = previous["results"].get(name)
+        if before is None:
+            continue
+        ratio = result["p50_ms"] / before["p50_ms"] if before["p50_ms"] else float("inf")
+        print(f"{name:40} {before['p50_ms']:10.3f} {result['p50_ms']:10.3f} {ratio:7.2f}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--db", type=Path, default=Path("bench.db"))
+    parser.add_argument("--generate", action="store_true", help="データベースを作り直す")
+    parser.add_argument("--usage-rows", type=int, default=1_000_000)
+    parser.add_argument("--messages", type=int, default=100_000)
+    parser.add_argument("--schedules", type=int, default=5_000)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--page-repeat", type=int, default=3)
+    parser.add_argument("--first-token-delay", type=float, default=0.0)
+    parser.add_argument("--token-interval", type=float, default=0.0)
+    parser.add_argument("--skip-pages", action="store_true")
+    parser.add_argument("--archive-after-days", type=int, help="測る前に会話をアーカイブする")
+    parser.add_argument("--output", type=Path, help="結果の JSON（既定: benchmarks/results/<日時>.json）")
+    parser.add_argument("--compare", type=Path, help="比較する前回の結果の JSON")
+    args = parser.parse_args()
+
+    if args.generate:
+        for suffix in ("", "-wal", "-shm"):
+            Path(f"{args.db}{suffix}").unlink(missing_ok=True)
+    elif not args.db.exists():
+        parser.error(f"{args.db} does not exist (use --generate)")
+    configure_database(args.db)
+
+    generated = None
+    if args.generate:
+        generated = populate(args.usage_rows, args.messages, args.schedules)
+
+    import database
+    database.init_db()
+    archived = None
+    if args.archive_after_days is not None:
+        archived = database.archive_conversations(args.archive_after_days)
+
+    result = {
+        "meta": {
+            "started_at": datetime.now().isoformat(timespec="seconds"),
+            "git_revision": _git_revision(),
+            "python": platform.python_version(),
+            "database": str(args.db),
+            "rows": _table_counts(),
+            "generated": generated,
+            "archived": archived,
+        },
+        "results": {},
+    }
+
+    benchmarks = [(name, fn, args.repeat) for name, fn in database_benchmarks(datetime.now())]
+    if not args.skip_pages:
+        benchmarks += [
+            (name, fn, args.page_repeat)
+            for name, fn in page_benchmarks(args.first_token_delay, args.token_interval)
+        ]
+    for name, fn, repeat in benchmarks:
+        result["results"][name] = measure(fn, repeat)
+        print(f"{name:40} p50 {result['results'][name]['p50_ms']:10.3f} ms", file=sys.stderr)
+    database.flush_writes()
+
+    output = args.output or RESULTS_DIR / f"{datetime.now():%Y%m%d-%H%M%S}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(result, indent=2, ensure_ascii=False, default=str), encoding="utf-8")
+    print(f"saved: {output}", file=sys.stderr)
+
+    if args.compare:
+        compare(result, json.loads(args.compare.read_text(encoding="utf-8")))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+ベンチマーク用の合成データベースの生成
+
+実行: uv run python -m benchmarks.synthetic_db --output bench.db --usage-rows 1000000 --messages 100000
+
+アプリと同じスキーマ（init_db）で新しい SQLite ファイルを作り、使用量ログ・会話履歴・予定を
+指定した件数だけ過去 --days 日に分散して書き込み、ロールアップを作り直す。
+database モジュールは import 時に DATABASE_URL で接続先を決めるため、
+呼び出し側は import 前に configure_database() を呼ぶ。
+"""
+import argparse
+import json
+import os
+import random
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+AVATARS = ["mental_support", "tech_advisor", "secretary"]
+
+TOPICS = [
+    "Python の非同期処理", "SQLite のインデックス", "明日の会議", "週末の予定", "仕事のストレス",
+    "React のレンダリング", "睡眠の質", "データベース設計", "プロジェクトの締め切り", "旅行の計画",
+    "Docker のネットワーク", "チームのコミュニケーション", "歯医者の予約", "読書の習慣",
+]
+
+PHRASES = [
+    "について教えてください。", "で困っています。", "はどう進めればいいですか？",
+    "の良い方法はありますか？", "を整理したいです。", "について相談があります。",
+]
+
+SCHEDULE_TITLES = ["定例会議", "打ち合わせ", "歯医者", "ジム", "レビュー", "1on1", "ランチ", "勉強会"]
+
+BATCH_SIZE = 10_000
+
+def configure_database(path: Path):
+    """database を import する前に接続先を path に向ける"""
+    os.environ["DATABASE_URL"] = f"sqlite:///{Path(path).resolve()}"
+
+def _timestamps(rng: random.Random, count: int, now: datetime, days: int):
+    """過去 days 日に分散した時刻を古い順に返す"""
+    span = days * 86400
+    offsets = sorted((rng.random() * span for _ in range(count)), reverse=True)
+    return [now - timedelta(seconds=offset) for offset in offsets]
+
+def _insert_batches(conn, table, rows):
+    for i in range(0, len(rows), BATCH_SIZE):
+        conn.execute(table.insert(), rows[i:i + BATCH_SIZE])
+
+def populate(usage_rows: int, messages: int, schedules: int, days: int = 90,
+             seed: int = 0, now: datetime = None) -> dict:
+    """設定済みの DATABASE_URL に合成データを書き込み、件数と所要時間を返す"""
+    import database
+
+    rng = random.Random(seed)
+    now = now or datetime.now()
+    started = time.perf_counter()
+    database.init_db()
+
+    usage = []
+    for timestamp in _timestamps(rng, usage_rows, now, days):
+        hit = rng.random() < 0.05
+        ttft = None if hit else rng.lognormvariate(6.5, 0.4)
+        usage.append({
+            "tenant_id": database.DEFAULT_TENANT,
+            "avatar_type": rng.choice(AVATARS),
+            "input_tokens": 0 if hit else rng.randint(200, 4000),
+            "output_tokens": 0 if hit else rng.randint(50, 1500),
+            "cache_creation_tokens": 0 if hit else rng.choice([0, 0, 0, 1500]),
+            "cache_read_tokens": 0 if hit else rng.choice([0, 3000, 6000]),
+            "context_trimmed_tokens": rng.choice([0] * 9 + [2000]),
+            "response_cache_hits": int(hit),
+            "response_cache_misses": 0,
+            "stream_retries": int(rng.random() < 0.01),
+            "stream_hedges": 0,
+            "context_ms": rng.uniform(0.5, 8.0),
+            "ttft_ms": ttft,
+            "stream_ms": None if hit else ttft + rng.uniform(1000, 12000),
+            "db_enqueue_ms": rng.uniform(0.05, 0.5),
+            "cost": 0.0 if hit else rng.uniform(0.001, 0.05),
+            "timestamp": timestamp,
+        })
+
+    conversations = []
+    for i, timestamp in enumerate(_timestamps(rng, messages, now, days)):
+        topic = rng.choice(TOPICS)
+        conversations.append({
+            "tenant_id": database.DEFAULT_TENANT,
+            "avatar_type": rng.choice(AVATARS),
+            "role": "user" if i % 2 == 0 else "assistant",
+            "content": topic + rng.choice(PHRASES) if i % 2 == 0
+            else f"{topic}についてですね。" + "ポイントを順に説明します。" * rng.randint(1, 8),
+            "timestamp": timestamp,
+        })
+
+    schedule_rows = []
+    for _ in range(schedules):
+        scheduled = now + timedelta(minutes=rng.randint(-days * 1440, 60 * 1440))
+        schedule_rows.append({
+            "tenant_id": database.DEFAULT_TENANT,
+            "title": rng.choice(SCHEDULE_TITLES),
+            "scheduled_datetime": scheduled.replace(second=0, microsecond=0),
+            "description": "",
+            "created_at": now,
+            "completed": int(scheduled < now and rng.random() < 0.8),
+        })
+
+    with database.get_engine().begin() as conn:
+        _insert_batches(conn, database.UsageLog.__table__, usage)
+        _insert_batches(conn, database.Conversation.__table__, conversations)
+        _insert_batches(conn, database.Schedule.__table__, schedule_rows)
+    database.rebuild_usage_rollups()
+
+    return {
+        "usage_rows": usage_rows,
+        "messages": messages,
+        "schedules": schedules,
+        "days": days,
+        "seed": seed,
+        "seconds": round(time.perf_counter() - started, 2),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--output", type=Path, default=Path("bench.db"))
+    parser.add_argument("--usage-rows", type=int, default=1_000_000)
+    parser.add_argument("--messages", type=int, default=100_000)
+    parser.add_argument("--schedules", type=int, default=5_000)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--force", action="store_true", help="既存のファイルを上書きする")
+    args = parser.parse_args()
+
+    if args.output.exists():
+        if not args.force:
+            parser.error(f"{args.output} already exists (use --force to overwrite)")
+        for suffix in ("", "-wal", "-shm"):
+            Path(f"{args.output}{suffix}").unlink(missing_ok=True)
+    configure_database(args.output)
+    print(json.dumps(populate(args.usage_rows, args.messages, args.schedules, args.days,
+                              args.seed), indent=2))
+
+if __name__ == "__main__":
+    main()
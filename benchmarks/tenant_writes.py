@@ -0,0 +1,85 @@
+"""
+複数利用者の同時書き込みのベンチマーク（データの配置 shared / per_tenant の比較）
+
+実行: uv run python -m benchmarks.tenant_writes --tenants 1 4 8
+
+利用者ごとに1スレッドで add_usage_log / add_conversation（どちらも1件ずつコミット）を
+--writes 回ずつ実行し、全体の書き込み件数/秒・1件あたりの所要時間の p50 / p99 を比べる。
+shared は1つの SQLite ファイルの書き込みロックを全員で取り合い、per_tenant は利用者ごとの
+ファイルに書き込む。--synchronous の既定は FULL（コミットごとに fsync するため、
+書き込みロックを持つ時間が長い）で、database の import 前に環境変数で設定する。
+"""
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+def run(database, layout, tenants: int, writes: int) -> dict:
+    database.set_layout(layout)
+    names = [f"tenant-{i}" for i in range(tenants)]
+    for name in names:
+        with database.tenant_scope(name):
+            database.init_db()
+
+    latencies, lock = [], threading.Lock()
+    barrier = threading.Barrier(tenants)
+
+    def write(name):
+        samples = []
+        with database.tenant_scope(name):
+            barrier.wait()
+            for i in range(writes):
+                started = time.perf_counter()
+                database.add_conversation("secretary", "user", f"{name} のメッセージ {i}")
+                database.add_usage_log("secretary", 100, 200, 0.01)
+                samples.append((time.perf_counter() - started) * 1000)
+        with lock:
+            latencies.extend(samples)
+
+    threads = [threading.Thread(target=write, args=(name,)) for name in names]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    ordered = sorted(latencies)
+    return {
+        "tenants": tenants,
+        "writes": len(latencies) * 2,
+        "writes_per_second": round(len(latencies) * 2 / elapsed, 1),
+        "p50_ms": round(statistics.median(ordered), 3),
+        "p99_ms": round(ordered[min(len(ordered) - 1, int(0.99 * len(ordered)))], 3),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--tenants", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--writes", type=int, default=200, help="利用者ごとの書き込み回数")
+    parser.add_argument("--synchronous", default="FULL", help="PRAGMA synchronous (NORMAL / FULL)")
+    args = parser.parse_args()
+
+    os.environ["SQLITE_SYNCHRONOUS"] = args.synchronous
+    import database
+
+    results = {"shared": [], "per_tenant": []}
+    for tenants in args.tenants:
+        with tempfile.TemporaryDirectory() as tmp:
+            results["shared"].append(run(
+                database, database.SharedLayout(f"sqlite:///{Path(tmp) / 'shared.db'}"),
+                tenants, args.writes
+            ))
+            results["per_tenant"].append(run(
+                database, database.PerTenantLayout(f"sqlite:///{Path(tmp)}/{{tenant}}.db", tenants),
+                tenants, args.writes
+            ))
+            database.set_layout(database.create_layout())
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+# 会話履歴のコンテキストウィンドウ管理
+from functools import lru_cache
+
+# メッセージごとのロール等のオーバーヘッド（概算）
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# 予算を超えたときは予算のこの割合まで削る
+# （毎ターン先頭が動くとプロンプトキャッシュが効かないため、まとめて削る）
+DEFAULT_LOW_WATER = 0.7
+
+@lru_cache(maxsize=4096)
+def estimate_tokens(text: str) -> int:
+    """
+    トークン数をローカルで概算
+
+    英数字は約4文字で1トークン、日本語などの非ASCII文字は約1文字で1トークンとして数える
+    """
+    ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+    non_ascii_chars = len(text) - ascii_chars
+    return non_ascii_chars + (ascii_chars + 3) // 4
+
+def message_tokens(message: dict) -> int:
+    """1メッセージ分のトークン数（概算、本文ごとにキャッシュ）"""
+    return MESSAGE_OVERHEAD_TOKENS + estimate_tokens(message["content"])
+
+def _align_to_user(messages: list, start: int) -> int:
+    """先頭が user の発言になるまで開始位置を進める（最後の発言は必ず残す）"""
+    while start < len(messages) - 1 and messages[start]["role"] != "user":
+        start += 1
+    return start
+
+def _merge_same_role(messages: list) -> list:
+    """
+    続けて同じロールの発言を1つにまとめる（API は user と assistant の交互を求める）
+
+    応答に失敗して user が続いた場合や、リマインダーなどで assistant が続いた場合に、
+    本文を空行でつないで1つの発言にする。
+    """
+    merged = []
+    for message in messages:
+        if merged and merged[-1]["role"] == message["role"]:
+            merged[-1] = dict(
+                merged[-1], content=merged[-1]["content"] + "\n\n" + message["content"]
+            )
+        else:
+            merged.append(message)
+    return merged
+
+def fit_to_budget(messages: list, budget: int, start: int = 0,
+                  low_water: float = DEFAULT_LOW_WATER) -> dict:
+    """
+    入力トークン予算に収まる最新の発言を選ぶ
+
+    start は前回の開始位置で、予算内であれば同じ位置を使い続ける。
+    予算を超えた場合は budget * low_water に収まるまで古い発言を落とす。
+    選んだ履歴は必ず user の発言から始まり、最新の発言は常に含める。
+    同じロールが続く発言はまとめ、user と assistant が交互になるようにする。
+
+    Returns:
+        {
+            "messages": 送信する発言（同じロールの連続はまとめたもの）,
+            "start": 開始位置（次回の start に渡す）,
+            "kept_tokens": 送信する発言のトークン数,
+            "trimmed_tokens": 削った発言のトークン数,
+            "trimmed_messages": 削った発言の数,
+        }
+    """
+    if not messages:
+        return {
+            "messages": [],
+            "start": 0,
+            "kept_tokens": 0,
+            "trimmed_tokens": 0,
+            "trimmed_messages": 0,
+        }
+
+    counts = [message_tokens(m) for m in messages]
+    start = _align_to_user(messages, min(max(start, 0), len(messages) - 1))
+
+    if sum(counts[start:]) > budget:
+        target = budget * low_water
+        total = counts[-1]
+        new_start = len(messages) - 1
+        while new_start > start and total + counts[new_start - 1] <= target:
+            new_start -= 1
+            total += counts[new_start]
+        start = _align_to_user(messages, new_start)
+
+    return {
+        "messages": _merge_same_role(messages[start:]),
+        "start": start,
+        "kept_tokens": sum(counts[start:]),
+        "trimmed_tokens": sum(counts[:start]),
+        "trimmed_messages": start,
+    }
@@ -0,0 +1,71 @@
+# 会話履歴の検索（サイドバー）
+import streamlit as st
+from datetime import datetime, timedelta
+from database import search_conversations
+from avatar_configs import get_avatar_config, get_avatar_list
+
+PAGE_SIZE = 10
+
+def show_search_sidebar():
+    """サイドバーに会話検索を表示"""
+    with st.expander("🔍 会話検索"):
+        query = st.text_input("キーワード", key="search_query", placeholder="例: 会議 資料")
+        
+        avatar_options = [None] + [av[0] for av in get_avatar_list()]
+        avatar_type = st.selectbox(
+            "アバター",
+            options=avatar_options,
+            format_func=lambda x: "すべて" if x is None else
+                f"{get_avatar_config(x)['icon']} {get_avatar_config(x)['name']}",
+            key="search_avatar"
+        )
+        
+        date_range = st.date_input(
+            "期間",
+            value=(),
+            key="search_dates"
+        )
+        
+        # 条件が変わったら1ページ目に戻す
+        conditions = (query, avatar_type, tuple(date_range))
+        if st.session_state.get("search_conditions") != conditions:
+            st.session_state.search_conditions = conditions
+            st.session_state.search_page = 0
+        
+        if not query.strip():
+            return
+        
+        start = end = None
+        if len(date_range) >= 1:
+            start = datetime.combine(date_range[0], datetime.min.time())
+        if len(date_range) == 2:
+            end = datetime.combine(date_range[1] + timedelta(days=1), datetime.min.time())
+        
+        page = st.session_state.search_page
+        found = search_conversations(
+            query,
+            avatar_type=avatar_type,
+            start=start,
+            end=end,
+            limit=PAGE_SIZE,
+            offset=page * PAGE_SIZE
+        )
+        
+        if not found["results"]:
+            st.caption("該当する会話はありません")
+        
+        for result in found["results"]:
+            config = get_avatar_config(result["avatar_type"])
+            role = "あなた" if result["role"] == "user" else config["name"]
+            st.caption(f"{config['icon']} {result['timestamp'].strftime('%Y/%m/%d %H:%M')} · {role}")
+            st.markdown(result["snippet"])
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            if page > 0 and st.button("← 前へ", key="search_prev", use_container_width=True):
+                st.session_state.search_page -= 1
+                st.rerun()
+        with col2:
+            if found["has_more"] and st.button("次へ →", key="search_next", use_container_width=True):
+                st.session_state.search_page += 1
+                st.rerun()
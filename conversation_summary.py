@@ -0,0 +1,174 @@
+# 会話のローリング要約（古い発言を要約に畳み込み、プロンプトには要約と最近の発言だけを送る）
+import contextvars
+import logging
+import os
+import queue
+import threading
+from database import (
+    current_tenant, get_conversation_summary, get_conversations_after, queue_usage_log,
+    save_conversation_summary
+)
+from prompt_cache import calculate_cost, usage_from_message
+
+logger = logging.getLogger(__name__)
+
+# 要約せずにそのまま送る最近の発言の数
+KEEP_RECENT_MESSAGES = int(os.getenv("SUMMARY_KEEP_RECENT_MESSAGES", "10"))
+
+# 1回の更新で要約に畳み込む発言の数（これだけ溜まるまでは更新しない）
+BATCH_MESSAGES = int(os.getenv("SUMMARY_BATCH_MESSAGES", "10"))
+
+SUMMARY_MODEL = os.getenv("SUMMARY_MODEL", "claude-sonnet-4-20250514")
+SUMMARY_MAX_TOKENS = int(os.getenv("SUMMARY_MAX_TOKENS", "1024"))
+
+# RequestScheduler の待ち行列で要約のリクエストをまとめるセッション ID
+# （セッション間のラウンドロビンでチャットのリクエストを待たせない）
+SUMMARY_SESSION_ID = "conversation-summary"
+
+SUMMARY_SYSTEM_PROMPT = """あなたは会話の記録係です。
+これまでの要約と新しい会話を受け取り、1つの要約に更新してください：
+- ユーザーの状況・悩み・目標・好み、決まったこと、約束したことを残す
+- 以前の要約の重要な内容は、新しい会話で変わっていない限り消さない
+- 挨拶や繰り返しは省き、箇条書きで簡潔にまとめる
+要約だけを出力してください。"""
+
+ROLE_LABELS = {"user": "ユーザー", "assistant": "アシスタント"}
+
+def summary_cursor(summary):
+    """要約に含めた最後の発言の (timestamp, id)。要約が無ければ None"""
+    if summary is None:
+        return None
+    return (summary.through_timestamp, summary.through_id)
+
+def summarized_count(messages: list, summary) -> int:
+    """
+    messages（古い順）の先頭から、要約に含まれている発言の数
+
+    DB から読み込んだ発言は id / timestamp を、このセッションで追加した発言は
+    timestamp（queue_conversation の戻り値）だけを持つ。
+    """
+    cursor = summary_cursor(summary)
+    if cursor is None:
+        return 0
+    count = 0
+    for message in messages:
+        if "timestamp" not in message or (message["timestamp"], message.get("id", 0)) > cursor:
+            break
+        count += 1
+    return count
+
+def format_summary_context(summary) -> str:
+    """システムプロンプトの後ろに置く要約"""
+    if summary is None:
+        return ""
+    return f"## これまでの会話の要約\n{summary.summary}"
+
+def build_summary_request(previous: str, conversations: list,
+                          model: str = SUMMARY_MODEL, max_tokens: int = SUMMARY_MAX_TOKENS) -> dict:
+    """要約を更新するリクエスト（以前の要約 + 畳み込む発言）"""
+    transcript = "\n".join(
+        f"{ROLE_LABELS.get(conv.role, conv.role)}: {conv.content}" for conv in conversations
+    )
+    return {
+        "model": model,
+        "max_tokens": max_tokens,
+        "system": SUMMARY_SYSTEM_PROMPT,
+        "messages": [{
+            "role": "user",
+            "content": f"# これまでの要約\n{previous or '（なし）'}\n\n# 新しい会話\n{transcript}",
+        }],
+    }
+
+class ConversationSummarizer:
+    """
+    アバターごとのローリング要約をバックグラウンドで更新する
+
+    request_refresh はチャットの処理から呼ばれ、待ち行列に入れるだけで戻る。
+    専用スレッドが利用者・アバターごとに1件ずつ refresh を実行し、最近の
+    keep_recent 件より古い発言が batch_size 件溜まるたびに要約へ畳み込む。
+    API は RequestScheduler 経由で呼ぶため、レート制限はチャットと共有する
+    （テストやベンチマークでは偽クライアントを渡したスケジューラを使う）。
+    """
+
+    def __init__(self, scheduler, keep_recent: int = KEEP_RECENT_MESSAGES,
+                 batch_size: int = BATCH_MESSAGES):
+        self.scheduler = scheduler
+        self.keep_recent = keep_recent
+        self.batch_size = batch_size
+        self.stats = {"refreshes": 0, "folded": 0, "failed": 0}
+        self._queue = queue.Queue()
+        self._pending = set()  # 待ち行列にある (利用者, アバター)
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def request_refresh(self, avatar_type: str):
+        """要約の更新を待ち行列に入れる（同じアバターが既に待っていれば何もしない）"""
+        key = (current_tenant(), avatar_type)
+        with self._lock:
+            if key in self._pending:
+                return
+            self._pending.add(key)
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="conversation-summary", daemon=True
+                )
+                self._thread.start()
+        self._queue.put((contextvars.copy_context(), key, avatar_type))
+
+    def join(self):
+        """待ち行列の更新がすべて終わるまで待つ"""
+        self._queue.join()
+
+    def _run(self):
+        while True:
+            context, key, avatar_type = self._queue.get()
+            # 実行中に来た依頼は次の更新として受け付ける
+            with self._lock:
+                self._pending.discard(key)
+            try:
+                context.run(self.refresh, avatar_type)
+            except Exception:
+                self.stats["failed"] += 1
+                logger.exception("Failed to refresh the conversation summary of %s", avatar_type)
+            finally:
+                self._queue.task_done()
+
+    def refresh(self, avatar_type: str) -> int:
+        """
+        溜まった古い発言を要約に畳み込み、畳み込んだ発言の数を返す
+
+        最近の keep_recent 件を残して batch_size 件以上あれば、batch_size 件ずつ
+        （ユーザーの発言の直前で区切って）要約を更新する。
+        """
+        folded = 0
+        summary = get_conversation_summary(avatar_type)
+        while True:
+            pending = get_conversations_after(
+                avatar_type, summary_cursor(summary), self.keep_recent + self.batch_size
+            )
+            if len(pending) < self.keep_recent + self.batch_size:
+                return folded
+
+            # 残す発言がユーザーの発言から始まるように区切る
+            end = self.batch_size
+            while end < len(pending) - 1 and pending[end].role != "user":
+                end += 1
+            batch = pending[:end]
+
+            request = build_summary_request(summary.summary if summary else "", batch)
+            with self.scheduler.stream(SUMMARY_SESSION_ID, request) as stream:
+                message = stream.get_final_message()
+            text = "".join(block.text for block in message.content if block.type == "text").strip()
+            if not text:
+                raise ValueError("Empty summary response")
+
+            save_conversation_summary(
+                avatar_type, text, (batch[-1].timestamp, batch[-1].id), len(batch)
+            )
+            usage = usage_from_message(message)
+            queue_usage_log(avatar_type, cost=calculate_cost(**usage), **usage)
+
+            folded += len(batch)
+            self.stats["refreshes"] += 1
+            self.stats["folded"] += len(batch)
+            summary = get_conversation_summary(avatar_type)
@@ -0,0 +1,183 @@
+"""
+会話履歴・使用量ログのエクスポート
+
+行はチャンク単位（yield_per）で読み出して書き出すため、
+行数に関わらずメモリ使用量は一定に保たれる。
+
+CLI:
+    uv run python data_export.py conversations --format jsonl -o conversations.jsonl
+    uv run python data_export.py usage --format csv --since 2026-01-01 -o usage.csv
+"""
+import argparse
+import csv
+import json
+import sys
+from datetime import datetime, date, timedelta
+from sqlalchemy import select, DateTime, Integer, Float
+from sqlalchemy.exc import SQLAlchemyError
+from database import (
+    DEFAULT_TENANT, current_tenant, get_engine, init_db, iter_archived_conversation_rows,
+    set_current_tenant, Conversation, UsageLog
+)
+
+EXPORT_TABLES = {
+    "conversations": Conversation,
+    "usage": UsageLog,
+}
+
+EXPORT_FORMATS = {
+    "jsonl": "application/x-ndjson",
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+DEFAULT_CHUNK_SIZE = 1000
+
+class ExportError(RuntimeError):
+    """エクスポートに失敗した（DB からの読み出し・Parquet への変換・pyarrow が未インストール）"""
+
+def iter_chunks(table: str, avatar_type: str = None, start: datetime = None,
+                end: datetime = None, chunk_size: int = DEFAULT_CHUNK_SIZE):
+    """Yield lists of row dicts of the current tenant, chunk_size rows at a time"""
+    model = EXPORT_TABLES[table]
+    if model is Conversation:
+        # アーカイブ済みの古い会話を先に出力する（1日分ずつ）
+        yield from iter_archived_conversation_rows(avatar_type, start, end)
+    stmt = select(*model.__table__.columns)\
+        .where(model.tenant_id == current_tenant())\
+        .order_by(model.id)
+    if avatar_type:
+        stmt = stmt.where(model.avatar_type == avatar_type)
+    if start:
+        stmt = stmt.where(model.timestamp >= start)
+    if end:
+        stmt = stmt.where(model.timestamp < end)
+
+    with get_engine().connect() as conn:
+        result = conn.execution_options(yield_per=chunk_size).execute(stmt)
+        for partition in result.mappings().partitions():
+            yield [dict(row) for row in partition]
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def write_jsonl(chunks, fp) -> int:
+    """Write chunks to a binary file object as JSON Lines"""
+    count = 0
+    for chunk in chunks:
+        lines = [json.dumps(row, ensure_ascii=False, default=_json_default) for row in chunk]
+        fp.write(("\n".join(lines) + "\n").encode("utf-8"))
+        count += len(chunk)
+    return count
+
+def write_csv(chunks, fp, columns: list) -> int:
+    """Write chunks to a binary file object as CSV (UTF-8 with BOM for Excel)"""
+    count = 0
+    fp.write("\ufeff".encode("utf-8"))
+    text_fp = _TextWriter(fp)
+    writer = csv.DictWriter(text_fp, fieldnames=columns)
+    writer.writeheader()
+    for chunk in chunks:
+        writer.writerows(chunk)
+        count += len(chunk)
+    return count
+
+class _TextWriter:
+    """csv.writer 用に str を UTF-8 で書き込むラッパー"""
+
+    def __init__(self, fp):
+        self._fp = fp
+
+    def write(self, text: str):
+        return self._fp.write(text.encode("utf-8"))
+
+def write_parquet(chunks, fp, model) -> int:
+    """Write chunks to a binary file object as Parquet, one row group per chunk"""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ExportError(
+            "Parquet export requires pyarrow: uv sync --extra export"
+        ) from e
+
+    def arrow_type(column):
+        if isinstance(column.type, DateTime):
+            return pa.timestamp("us")
+        if isinstance(column.type, Integer):
+            return pa.int64()
+        if isinstance(column.type, Float):
+            return pa.float64()
+        return pa.string()
+
+    schema = pa.schema([(column.name, arrow_type(column)) for column in model.__table__.columns])
+    count = 0
+    try:
+        with pq.ParquetWriter(fp, schema) as writer:
+            for chunk in chunks:
+                writer.write_table(pa.Table.from_pylist(chunk, schema=schema))
+                count += len(chunk)
+    except pa.ArrowException as e:
+        raise ExportError(f"Parquet export failed: {e}") from e
+    return count
+
+def export(table: str, fmt: str, fp, avatar_type: str = None, start: datetime = None,
+           end: datetime = None, chunk_size: int = DEFAULT_CHUNK_SIZE) -> int:
+    """
+    Stream a table to a binary file object in the given format
+
+    Returns the number of exported rows. Raises ExportError when the rows
+    cannot be read or converted.
+    """
+    model = EXPORT_TABLES[table]
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    chunks = iter_chunks(table, avatar_type, start, end, chunk_size)
+    try:
+        if fmt == "jsonl":
+            return write_jsonl(chunks, fp)
+        if fmt == "csv":
+            return write_csv(chunks, fp, [column.name for column in model.__table__.columns])
+        return write_parquet(chunks, fp, model)
+    except SQLAlchemyError as e:
+        raise ExportError(f"Reading {table} failed: {e}") from e
+
+def _parse_day(value: str) -> date:
+    return datetime.strptime(value, "%Y-%m-%d").date()
+
+def main():
+    parser = argparse.ArgumentParser(description="Export conversations or usage logs")
+    parser.add_argument("table", choices=list(EXPORT_TABLES))
+    parser.add_argument("--format", choices=list(EXPORT_FORMATS), default="jsonl")
+    parser.add_argument("--avatar", help="avatar_type で絞り込み")
+    parser.add_argument("--since", type=_parse_day, help="開始日 (YYYY-MM-DD, この日を含む)")
+    parser.add_argument("--until", type=_parse_day, help="終了日 (YYYY-MM-DD, この日を含む)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("-o", "--output", help="出力ファイル（省略時は標準出力）")
+    parser.add_argument("--tenant", default=DEFAULT_TENANT, help="エクスポートする利用者")
+    args = parser.parse_args()
+
+    set_current_tenant(args.tenant)
+    init_db()
+    start = datetime.combine(args.since, datetime.min.time()) if args.since else None
+    end = (
+        datetime.combine(args.until + timedelta(days=1), datetime.min.time())
+        if args.until else None
+    )
+
+    try:
+        if args.output:
+            with open(args.output, "wb") as fp:
+                count = export(args.table, args.format, fp, args.avatar, start, end, args.chunk_size)
+        else:
+            count = export(
+                args.table, args.format, sys.stdout.buffer, args.avatar, start, end, args.chunk_size
+            )
+    except ExportError as e:
+        sys.exit(str(e))
+    print(f"Exported {count:,} rows", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
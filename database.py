@@ -1,128 +1,1930 @@
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Float, Text
+from sqlalchemy import (
+    create_engine, event, inspect, make_url, select, delete, text, bindparam, tuple_,
+    Column, Integer, String, DateTime, Date, Float, Text, LargeBinary, Index, func
+)
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-from datetime import datetime
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from pathlib import Path
+import atexit
+import contextvars
+import json
+import logging
+import math
 import os
+import queue
+import re
+import threading
+import zlib
 from dotenv import load_dotenv
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 Base = declarative_base()
 
 class Conversation(Base):
     __tablename__ = 'conversations'
     
     id = Column(Integer, primary_key=True)
+    tenant_id = Column(String(128), nullable=False)  # 利用者
     avatar_type = Column(String(50), nullable=False)
     role = Column(String(20), nullable=False)  # 'user' or 'assistant'
     content = Column(Text, nullable=False)
     timestamp = Column(DateTime, default=datetime.now)
 
+    __table_args__ = (
+        Index('ix_conversations_tenant_avatar_timestamp', 'tenant_id', 'avatar_type', 'timestamp'),
+    )
+
 class Schedule(Base):
     __tablename__ = 'schedules'
     
     id = Column(Integer, primary_key=True)
+    tenant_id = Column(String(128), nullable=False)  # 利用者
     title = Column(String(200), nullable=False)
     scheduled_datetime = Column(DateTime, nullable=False)
     description = Column(Text)
     created_at = Column(DateTime, default=datetime.now)
     completed = Column(Integer, default=0)  # 0: not completed, 1: completed
 
+    __table_args__ = (
+        Index(
+            'ix_schedules_tenant_completed_datetime', 'tenant_id', 'completed', 'scheduled_datetime'
+        ),
+    )
+
 class UsageLog(Base):
     __tablename__ = 'usage_logs'
     
     id = Column(Integer, primary_key=True)
+    tenant_id = Column(String(128), nullable=False)  # 利用者
     avatar_type = Column(String(50), nullable=False)
     input_tokens = Column(Integer, nullable=False)
     output_tokens = Column(Integer, nullable=False)
+    cache_creation_tokens = Column(Integer, nullable=False, default=0)
+    cache_read_tokens = Column(Integer, nullable=False, default=0)
+    context_trimmed_tokens = Column(Integer, nullable=False, default=0)  # 履歴から削った入力
+    response_cache_hits = Column(Integer, nullable=False, default=0)  # 1: キャッシュから応答
+    response_cache_misses = Column(Integer, nullable=False, default=0)  # 1: キャッシュ対象で API 呼び出し
+    stream_retries = Column(Integer, nullable=False, default=0)  # 期限切れ・エラーでのやり直し回数
+    stream_hedges = Column(Integer, nullable=False, default=0)  # ヘッジで追加送信した回数
+    context_ms = Column(Float)  # 履歴・予定コンテキストの組み立て
+    ttft_ms = Column(Float)  # 送信から最初のトークンまで（待ち行列を含む）
+    stream_ms = Column(Float)  # 送信から応答の完了まで
+    db_enqueue_ms = Column(Float)  # 応答までに DB 書き込みキューへ積むのにかかった時間
     cost = Column(Float, nullable=False)
     timestamp = Column(DateTime, default=datetime.now)
 
+    __table_args__ = (
+        Index('ix_usage_logs_tenant_timestamp', 'tenant_id', 'timestamp'),
+    )
+
+class DailyUsage(Base):
+    """Pre-aggregated usage per tenant and day (kept up to date by add_usage_log)"""
+    __tablename__ = 'usage_daily'
+
+    tenant_id = Column(String(128), primary_key=True)
+    date = Column(Date, primary_key=True)
+    request_count = Column(Integer, nullable=False, default=0)
+    input_tokens = Column(Integer, nullable=False, default=0)
+    output_tokens = Column(Integer, nullable=False, default=0)
+    cache_creation_tokens = Column(Integer, nullable=False, default=0)
+    cache_read_tokens = Column(Integer, nullable=False, default=0)
+    context_trimmed_tokens = Column(Integer, nullable=False, default=0)
+    response_cache_hits = Column(Integer, nullable=False, default=0)
+    response_cache_misses = Column(Integer, nullable=False, default=0)
+    stream_retries = Column(Integer, nullable=False, default=0)
+    stream_hedges = Column(Integer, nullable=False, default=0)
+    cost = Column(Float, nullable=False, default=0.0)
+
+class AvatarDailyUsage(Base):
+    """Pre-aggregated usage per tenant, day and avatar (kept up to date by add_usage_log)"""
+    __tablename__ = 'usage_avatar_daily'
+
+    tenant_id = Column(String(128), primary_key=True)
+    date = Column(Date, primary_key=True)
+    avatar_type = Column(String(50), primary_key=True)
+    request_count = Column(Integer, nullable=False, default=0)
+    input_tokens = Column(Integer, nullable=False, default=0)
+    output_tokens = Column(Integer, nullable=False, default=0)
+    cache_creation_tokens = Column(Integer, nullable=False, default=0)
+    cache_read_tokens = Column(Integer, nullable=False, default=0)
+    context_trimmed_tokens = Column(Integer, nullable=False, default=0)
+    response_cache_hits = Column(Integer, nullable=False, default=0)
+    response_cache_misses = Column(Integer, nullable=False, default=0)
+    stream_retries = Column(Integer, nullable=False, default=0)
+    stream_hedges = Column(Integer, nullable=False, default=0)
+    cost = Column(Float, nullable=False, default=0.0)
+
+class LatencyHistogram(Base):
+    """
+    Request counts per tenant, day, avatar, latency metric and log-scale bucket
+    (kept up to date by add_usage_log; percentiles are read from it instead of usage_logs)
+    """
+    __tablename__ = 'usage_latency_daily'
+
+    tenant_id = Column(String(128), primary_key=True)
+    date = Column(Date, primary_key=True)
+    avatar_type = Column(String(50), primary_key=True)
+    metric = Column(String(32), primary_key=True)
+    bucket = Column(Integer, primary_key=True)  # latency_bucket() の値
+    count = Column(Integer, nullable=False, default=0)
+
+class ResponseCacheEntry(Base):
+    """Persistent tier of the exact-match LLM response cache"""
+    __tablename__ = 'response_cache'
+
+    tenant_id = Column(String(128), primary_key=True)
+    key = Column(String(64), primary_key=True)  # リクエストの SHA-256
+    avatar_type = Column(String(50), nullable=False)
+    response = Column(Text, nullable=False)
+    created_at = Column(DateTime, nullable=False, default=datetime.now)
+    expires_at = Column(DateTime, nullable=False)
+    last_hit_at = Column(DateTime, nullable=False, default=datetime.now)
+    hits = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        Index('ix_response_cache_expires_at', 'expires_at'),
+        Index('ix_response_cache_tenant_last_hit_at', 'tenant_id', 'last_hit_at'),
+    )
+
+class ConversationSummary(Base):
+    """Rolling summary of the turns folded out of the prompt, per tenant and avatar"""
+    __tablename__ = 'conversation_summaries'
+
+    tenant_id = Column(String(128), primary_key=True)
+    avatar_type = Column(String(50), primary_key=True)
+    summary = Column(Text, nullable=False)
+    # 要約に含めた最後の発言（これより後の発言はそのまま送る）
+    through_timestamp = Column(DateTime, nullable=False)
+    through_id = Column(Integer, nullable=False)
+    message_count = Column(Integer, nullable=False, default=0)  # 要約に含めた発言の数
+    updated_at = Column(DateTime, nullable=False, default=datetime.now)
+
+class ConversationArchive(Base):
+    """Cold storage for old conversations: one compressed blob per tenant, avatar and day"""
+    __tablename__ = 'conversations_archive'
+
+    id = Column(Integer, primary_key=True)
+    tenant_id = Column(String(128), nullable=False)
+    avatar_type = Column(String(50), nullable=False)
+    date = Column(Date, nullable=False)
+    message_count = Column(Integer, nullable=False)
+    first_timestamp = Column(DateTime, nullable=False)
+    last_timestamp = Column(DateTime, nullable=False)
+    raw_bytes = Column(Integer, nullable=False)  # 圧縮前の JSON のバイト数
+    data = Column(LargeBinary, nullable=False)  # 発言の JSON 配列を zlib で圧縮したもの
+    archived_at = Column(DateTime, nullable=False, default=datetime.now)
+
+    __table_args__ = (
+        Index(
+            'ix_conversations_archive_tenant_avatar_date', 'tenant_id', 'avatar_type', 'date',
+            unique=True
+        ),
+    )
+
 # DB の設定
 DATABASE_URL = os.getenv('DATABASE_URL', 'sqlite:///llm_app.db')
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(bind=engine)
+
+# SQLite のチューニング設定（.env で上書き可能）
+SQLITE_PRAGMAS = {
+    'journal_mode': os.getenv('SQLITE_JOURNAL_MODE', 'WAL'),
+    'synchronous': os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL'),
+    'busy_timeout': int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', 5000)),
+    'mmap_size': int(os.getenv('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+    'cache_size': int(os.getenv('SQLITE_CACHE_SIZE', -64 * 1024)),  # 負の値は KiB 単位
+}
+SQLITE_POOL_SIZE = int(os.getenv('SQLITE_POOL_SIZE', 5))
+SQLITE_MAX_OVERFLOW = int(os.getenv('SQLITE_MAX_OVERFLOW', 10))
+
+# データの配置（.env で切り替え）
+# shared: 全利用者を DATABASE_URL の1つの DB に置き、tenant_id 列で分ける
+# per_tenant: 利用者ごとに TENANT_DATABASE_URL（{tenant} を利用者IDに置換）の DB を使う
+STORAGE_LAYOUT = os.getenv('STORAGE_LAYOUT', 'shared')
+TENANT_DATABASE_URL = os.getenv('TENANT_DATABASE_URL', 'sqlite:///tenants/{tenant}.db')
+TENANT_ENGINE_CACHE_SIZE = int(os.getenv('TENANT_ENGINE_CACHE_SIZE', 16))  # 開いておく DB の数
+
+# 利用者（テナント）。各関数は current_tenant() の行だけを読み書きする
+# （スレッドごとの contextvars で保持し、app.py がスクリプトの実行ごとに設定する）
+DEFAULT_TENANT = 'default'
+TENANT_ID_PATTERN = re.compile(r'[A-Za-z0-9_@+-][A-Za-z0-9_.@+-]{0,127}')
+
+_current_tenant = contextvars.ContextVar('tenant', default=DEFAULT_TENANT)
+
+def validate_tenant(tenant: str) -> str:
+    """Return tenant if it is a valid tenant id (it may become a file name), else ValueError"""
+    if not isinstance(tenant, str) or not TENANT_ID_PATTERN.fullmatch(tenant):
+        raise ValueError(f"Invalid tenant id: {tenant!r}")
+    return tenant
+
+def current_tenant() -> str:
+    """Tenant whose rows the database functions read and write"""
+    return _current_tenant.get()
+
+def set_current_tenant(tenant: str):
+    """Scope the database functions called from this thread to tenant"""
+    _current_tenant.set(validate_tenant(tenant))
+
+@contextmanager
+def tenant_scope(tenant: str):
+    """Scope the database functions to tenant inside a with block"""
+    token = _current_tenant.set(validate_tenant(tenant))
+    try:
+        yield
+    finally:
+        _current_tenant.reset(token)
+
+def create_db_engine(url: str):
+    """Create an engine, applying the SQLite tuning profile for SQLite URLs"""
+    parsed = make_url(url)
+    if parsed.get_backend_name() != 'sqlite':
+        return create_engine(url)
+
+    if parsed.database in (None, '', ':memory:'):
+        # インメモリDBは SQLAlchemy 既定のスレッド単位プールのまま
+        new_engine = create_engine(url)
+    else:
+        # Streamlit はセッションごとにスレッドが変わるため、
+        # 接続はスレッド間で受け渡し可能にしてプールで使い回す
+        new_engine = create_engine(
+            url,
+            connect_args={
+                'check_same_thread': False,
+                'timeout': SQLITE_PRAGMAS['busy_timeout'] / 1000,
+            },
+            pool_size=SQLITE_POOL_SIZE,
+            max_overflow=SQLITE_MAX_OVERFLOW,
+            pool_pre_ping=True
+        )
+
+    @event.listens_for(new_engine, 'connect')
+    def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+        cursor.close()
+        # 短い語の検索索引を同期するトリガーが使う
+        dbapi_connection.create_function(
+            'search_bigrams', 1, search_bigrams, deterministic=True
+        )
+
+    return new_engine
+
+def _column_names(conn, table: str) -> set:
+    return {row[1] for row in conn.exec_driver_sql(f"PRAGMA table_info({table})")}
+
+def _add_column(conn, table: str, column: str, ddl: str):
+    """
+    ALTER TABLE ... ADD COLUMN, skipped when the column already exists
+
+    init_db creates missing tables from the current models before migrating,
+    so a table may already have columns that older migrations add.
+    """
+    if column not in _column_names(conn, table):
+        conn.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}")
+
+def _migration_1_indexes(conn):
+    """v1: secondary indexes for the hot queries"""
+    for statement in (
+        "CREATE INDEX IF NOT EXISTS ix_conversations_avatar_timestamp "
+        "ON conversations (avatar_type, timestamp)",
+        "CREATE INDEX IF NOT EXISTS ix_schedules_completed_datetime "
+        "ON schedules (completed, scheduled_datetime)",
+        "CREATE INDEX IF NOT EXISTS ix_usage_logs_timestamp ON usage_logs (timestamp)",
+    ):
+        conn.exec_driver_sql(statement)
+
+def _migration_2_cache_tokens(conn):
+    """v2: prompt cache token columns on usage logs and rollups"""
+    for table in ('usage_logs', 'usage_daily', 'usage_avatar_daily'):
+        for column in ('cache_creation_tokens', 'cache_read_tokens'):
+            _add_column(conn, table, column, "INTEGER NOT NULL DEFAULT 0")
+
+def _migration_3_context_trimmed_tokens(conn):
+    """v3: tokens trimmed from the context window on usage logs and rollups"""
+    for table in ('usage_logs', 'usage_daily', 'usage_avatar_daily'):
+        _add_column(conn, table, 'context_trimmed_tokens', "INTEGER NOT NULL DEFAULT 0")
+
+# 会話の全文検索（FTS5 外部コンテンツテーブル、トリガーで conversations と同期）
+# 日本語は空白で区切られないため trigram トークナイザで部分一致検索する
+CONVERSATION_SEARCH_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS conversations_fts USING fts5(
+        content, content='conversations', content_rowid='id', tokenize='trigram'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS conversations_fts_ai AFTER INSERT ON conversations BEGIN
+        INSERT INTO conversations_fts(rowid, content) VALUES (new.id, new.content);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS conversations_fts_ad AFTER DELETE ON conversations BEGIN
+        INSERT INTO conversations_fts(conversations_fts, rowid, content)
+        VALUES ('delete', old.id, old.content);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS conversations_fts_au AFTER UPDATE OF content ON conversations
+    BEGIN
+        INSERT INTO conversations_fts(conversations_fts, rowid, content)
+        VALUES ('delete', old.id, old.content);
+        INSERT INTO conversations_fts(rowid, content) VALUES (new.id, new.content);
+    END
+    """,
+]
+
+def search_bigrams(content):
+    """
+    Overlapping 2-character grams of content plus its last character, space separated
+
+    Indexed with the unicode61 tokenizer so 1-2 character terms, which the
+    trigram index cannot match, are found by a token (or token prefix) lookup.
+    """
+    if content is None:
+        return None
+    grams = [content[i:i + 2] for i in range(len(content) - 1)]
+    grams.append(content[-1:])
+    return " ".join(grams)
+
+# 3文字未満の語の索引（2文字ずつずらした bigram を unicode61 で索引する contentless テーブル）
+# トリガーは接続ごとに登録する search_bigrams 関数を使うため、
+# conversations の書き込みは create_db_engine の接続から行う
+CONVERSATION_BIGRAM_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS conversations_bigram USING fts5(
+        content, content='', tokenize='unicode61 remove_diacritics 0'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS conversations_bigram_ai AFTER INSERT ON conversations BEGIN
+        INSERT INTO conversations_bigram(rowid, content)
+        VALUES (new.id, search_bigrams(new.content));
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS conversations_bigram_ad AFTER DELETE ON conversations BEGIN
+        INSERT INTO conversations_bigram(conversations_bigram, rowid, content)
+        VALUES ('delete', old.id, search_bigrams(old.content));
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS conversations_bigram_au AFTER UPDATE OF content ON conversations
+    BEGIN
+        INSERT INTO conversations_bigram(conversations_bigram, rowid, content)
+        VALUES ('delete', old.id, search_bigrams(old.content));
+        INSERT INTO conversations_bigram(rowid, content)
+        VALUES (new.id, search_bigrams(new.content));
+    END
+    """,
+]
+
+def _create_conversation_search(conn):
+    for statement in CONVERSATION_SEARCH_DDL + CONVERSATION_BIGRAM_DDL:
+        conn.exec_driver_sql(statement)
+
+def _migration_4_conversation_search(conn):
+    """v4: FTS5 index over conversations.content, backfilled from existing rows"""
+    for statement in CONVERSATION_SEARCH_DDL:
+        conn.exec_driver_sql(statement)
+    conn.exec_driver_sql("INSERT INTO conversations_fts(conversations_fts) VALUES ('rebuild')")
+
+def _migration_5_response_cache_counters(conn):
+    """v5: response cache hit/miss counters on usage logs and rollups"""
+    for table in ('usage_logs', 'usage_daily', 'usage_avatar_daily'):
+        for column in ('response_cache_hits', 'response_cache_misses'):
+            _add_column(conn, table, column, "INTEGER NOT NULL DEFAULT 0")
+
+def _migration_6_stream_guard_counters(conn):
+    """v6: stream retry/hedge counters on usage logs and rollups"""
+    for table in ('usage_logs', 'usage_daily', 'usage_avatar_daily'):
+        for column in ('stream_retries', 'stream_hedges'):
+            _add_column(conn, table, column, "INTEGER NOT NULL DEFAULT 0")
+
+def _migration_7_latency_columns(conn):
+    """v7: per-request latency measurements on usage logs"""
+    for column in ('context_ms', 'ttft_ms', 'stream_ms', 'db_write_ms'):
+        _add_column(conn, 'usage_logs', column, "FLOAT")
+
+def _migration_8_tenants(conn):
+    """v8: tenant_id on every table; existing rows belong to DEFAULT_TENANT"""
+    partitioned = (Conversation.__table__, Schedule.__table__, UsageLog.__table__)
+    for table in partitioned:
+        _add_column(
+            conn, table.name, 'tenant_id', f"VARCHAR(128) NOT NULL DEFAULT '{DEFAULT_TENANT}'"
+        )
+    # インデックスは tenant_id を先頭にしたものに置き換える
+    for name in (
+        'ix_conversations_avatar_timestamp',
+        'ix_schedules_completed_datetime',
+        'ix_usage_logs_timestamp',
+    ):
+        conn.exec_driver_sql(f"DROP INDEX IF EXISTS {name}")
+    for table in partitioned:
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+    # 主キーが変わるテーブルは作り直す（ロールアップは init_db が usage_logs から再集計し、
+    # 応答キャッシュは空から始める）
+    for table in (DailyUsage.__table__, AvatarDailyUsage.__table__, ResponseCacheEntry.__table__):
+        if 'tenant_id' not in _column_names(conn, table.name):
+            table.drop(conn)
+            table.create(conn)
+
+def _migration_9_latency_histogram(conn):
+    """v9: db_write_ms renamed to db_enqueue_ms; latency histogram backfilled from usage logs"""
+    if 'db_write_ms' in _column_names(conn, 'usage_logs'):
+        conn.exec_driver_sql("ALTER TABLE usage_logs RENAME COLUMN db_write_ms TO db_enqueue_ms")
+    LatencyHistogram.__table__.create(conn, checkfirst=True)
+    _rebuild_latency_histogram(conn)
+
+def _migration_10_short_term_search(conn):
+    """v10: bigram index for search terms shorter than the trigram, backfilled from existing rows"""
+    for statement in CONVERSATION_BIGRAM_DDL:
+        conn.exec_driver_sql(statement)
+    conn.exec_driver_sql("INSERT INTO conversations_bigram(conversations_bigram) VALUES ('delete-all')")
+    conn.exec_driver_sql(
+        "INSERT INTO conversations_bigram(rowid, content) "
+        "SELECT id, search_bigrams(content) FROM conversations"
+    )
+
+# スキーマのマイグレーション（PRAGMA user_version で適用済みバージョンを管理）
+# 最新バージョンのファイルは開くときに create_all もしないため、テーブルの追加もここに加える
+MIGRATIONS = [
+    _migration_1_indexes,
+    _migration_2_cache_tokens,
+    _migration_3_context_trimmed_tokens,
+    _migration_4_conversation_search,
+    _migration_5_response_cache_counters,
+    _migration_6_stream_guard_counters,
+    _migration_7_latency_columns,
+    _migration_8_tenants,
+    _migration_9_latency_histogram,
+    _migration_10_short_term_search,
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+def migrate_db(engine):
+    """Upgrade an existing database file in place to SCHEMA_VERSION"""
+    with engine.begin() as conn:
+        version = conn.exec_driver_sql("PRAGMA user_version").scalar()
+        for target in range(version + 1, SCHEMA_VERSION + 1):
+            MIGRATIONS[target - 1](conn)
+            conn.exec_driver_sql(f"PRAGMA user_version = {target}")
+
+# 利用者・テーブルごとの書き込みバージョン（キャッシュの無効化に使う）
+_write_versions = {}
+_write_versions_lock = threading.Lock()
+
+def get_write_version(table: str) -> int:
+    """Current write version of the current tenant's table; changes whenever it is written"""
+    return _write_versions.get((current_tenant(), table), 0)
+
+def bump_write_version(table: str):
+    """Mark the current tenant's table as written so caches keyed on its version are invalidated"""
+    key = (current_tenant(), table)
+    with _write_versions_lock:
+        _write_versions[key] = _write_versions.get(key, 0) + 1
+
+def _prepare_database(store):
+    """Create or upgrade the tables of a store's database (a no-op once at SCHEMA_VERSION)"""
+    # 最新のバージョンのファイルは以前に開いたときに作成・移行・ロールアップの作成が済んでいる
+    # （PerTenantLayout が閉じたファイルを開き直すたびに繰り返さない）
+    with store.engine.connect() as conn:
+        if conn.exec_driver_sql("PRAGMA user_version").scalar() == SCHEMA_VERSION:
+            return
+
+    is_new = not inspect(store.engine).has_table(Conversation.__tablename__)
+    Base.metadata.create_all(store.engine)
+    if is_new:
+        # 新規DBは最新スキーマで作成されるため、ORM 外のオブジェクトを作ってバージョンを記録
+        with store.engine.begin() as conn:
+            _create_conversation_search(conn)
+            conn.exec_driver_sql(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    else:
+        migrate_db(store.engine)
+
+    # 既存DBにロールアップが無ければ UsageLog から作成
+    db = store.session_factory()
+    needs_backfill = (
+        db.query(DailyUsage.date).first() is None
+        and db.query(UsageLog.id).first() is not None
+    )
+    if needs_backfill:
+        _rebuild_usage_rollups(db)
+    db.close()
 
 def init_db():
-    """Initialize database tables"""
-    Base.metadata.create_all(engine)
+    """Initialize database tables of the current tenant (also done on first use)"""
+    _store()
 
 def get_db():
     """Get database session"""
-    db = SessionLocal()
+    db = _session()
     try:
         return db
     finally:
         pass
 
-def add_conversation(avatar_type: str, role: str, content: str):
-    """Add conversation to database"""
-    db = SessionLocal()
-    conversation = Conversation(
+def _insert_conversation(db, avatar_type: str, role: str, content: str, timestamp: datetime):
+    """Stage a conversation row in the given session"""
+    db.add(Conversation(
+        tenant_id=current_tenant(),
         avatar_type=avatar_type,
         role=role,
-        content=content
-    )
-    db.add(conversation)
+        content=content,
+        timestamp=timestamp
+    ))
+
+def add_conversation(avatar_type: str, role: str, content: str):
+    """Add conversation to database"""
+    db = _session()
+    _insert_conversation(db, avatar_type, role, content, datetime.now())
     db.commit()
     db.close()
 
-def get_conversations(avatar_type: str, limit: int = 50):
-    """Get conversation history for specific avatar"""
-    db = SessionLocal()
-    conversations = db.query(Conversation)\
-        .filter(Conversation.avatar_type == avatar_type)\
-        .order_by(Conversation.timestamp.desc())\
+def get_conversations(avatar_type: str, limit: int = 50, before: tuple = None):
+    """
+    Get conversation history for specific avatar
+
+    Returns up to `limit` messages in chronological order. Pass the
+    (timestamp, id) of the oldest message already loaded as `before` to get
+    the page preceding it (keyset pagination on the avatar/timestamp index).
+    """
+    db = _session()
+    query = db.query(Conversation)\
+        .filter(Conversation.tenant_id == current_tenant(), Conversation.avatar_type == avatar_type)
+    if before is not None:
+        query = query.filter(tuple_(Conversation.timestamp, Conversation.id) < tuple_(*before))
+    conversations = query\
+        .order_by(Conversation.timestamp.desc(), Conversation.id.desc())\
         .limit(limit)\
         .all()
     db.close()
+    if len(conversations) < limit:
+        # 足りない分はアーカイブから読む
+        conversations = sorted(
+            conversations + _archived_conversations(avatar_type, limit, before),
+            key=lambda conv: (conv.timestamp, conv.id),
+            reverse=True
+        )[:limit]
     return list(reversed(conversations))
 
-def add_usage_log(avatar_type: str, input_tokens: int, output_tokens: int, cost: float):
-    """Add API usage log"""
-    db = SessionLocal()
-    usage = UsageLog(
+def get_conversations_after(avatar_type: str, after: tuple = None, limit: int = 50):
+    """
+    Oldest conversations of an avatar after the (timestamp, id) cursor,
+    in chronological order (reads through to the archive, so turns archived
+    before the summarizer reached them are not skipped)
+    """
+    db = _session()
+    query = db.query(Conversation)\
+        .filter(Conversation.tenant_id == current_tenant(), Conversation.avatar_type == avatar_type)
+    if after is not None:
+        query = query.filter(tuple_(Conversation.timestamp, Conversation.id) > tuple_(*after))
+    conversations = query.order_by(Conversation.timestamp, Conversation.id).limit(limit).all()
+    db.close()
+    archived = _archived_conversations_after(avatar_type, after, limit)
+    if archived:
+        conversations = sorted(
+            archived + conversations, key=lambda conv: (conv.timestamp, conv.id)
+        )[:limit]
+    return conversations
+
+def get_conversation_summary(avatar_type: str):
+    """The avatar's rolling summary, or None before the first refresh"""
+    db = _session()
+    summary = db.get(ConversationSummary, (current_tenant(), avatar_type))
+    db.close()
+    return summary
+
+def save_conversation_summary(avatar_type: str, summary: str, through: tuple, folded: int):
+    """Store a refreshed summary that now covers the turns up to the through cursor"""
+    now = datetime.now()
+    stmt = sqlite_insert(ConversationSummary).values(
+        tenant_id=current_tenant(),
+        avatar_type=avatar_type,
+        summary=summary,
+        through_timestamp=through[0],
+        through_id=through[1],
+        message_count=folded,
+        updated_at=now
+    )
+    db = _session()
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=['tenant_id', 'avatar_type'],
+        set_={
+            'summary': stmt.excluded.summary,
+            'through_timestamp': stmt.excluded.through_timestamp,
+            'through_id': stmt.excluded.through_id,
+            'message_count': ConversationSummary.message_count + stmt.excluded.message_count,
+            'updated_at': stmt.excluded.updated_at,
+        }
+    ))
+    db.commit()
+    db.close()
+
+# この日数より古い会話をアーカイブへ移す（archive_conversations の既定値）
+ARCHIVE_AFTER_DAYS = int(os.getenv('ARCHIVE_AFTER_DAYS', 90))
+ARCHIVE_COMPRESSION_LEVEL = int(os.getenv('ARCHIVE_COMPRESSION_LEVEL', 9))
+
+def _encode_archive(messages: list) -> tuple:
+    """(bytes before compression, zlib-compressed JSON) for a list of message dicts"""
+    raw = json.dumps(messages, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return len(raw), zlib.compress(raw, ARCHIVE_COMPRESSION_LEVEL)
+
+def _decode_archive(data: bytes) -> list:
+    return json.loads(zlib.decompress(data))
+
+def _archived_conversations(avatar_type: str, limit: int, before: tuple = None) -> list:
+    """Newest archived messages older than before, as detached Conversation objects"""
+    db = _session()
+    query = db.query(ConversationArchive)\
+        .filter(
+            ConversationArchive.tenant_id == current_tenant(),
+            ConversationArchive.avatar_type == avatar_type
+        )
+    if before is not None:
+        query = query.filter(ConversationArchive.first_timestamp <= before[0])
+    blobs = query.order_by(ConversationArchive.date.desc()).yield_per(4)
+
+    # 日ごとの塊を新しい順に展開し、必要な件数が集まったところで止める
+    # （塊は日付順、塊の中は (timestamp, id) 順なので新しい方から読めばよい）
+    conversations = []
+    for blob in blobs:
+        for message in reversed(_decode_archive(blob.data)):
+            timestamp = datetime.fromisoformat(message['timestamp'])
+            if before is not None and (timestamp, message['id']) >= tuple(before):
+                continue
+            conversations.append(Conversation(
+                id=message['id'],
+                tenant_id=blob.tenant_id,
+                avatar_type=blob.avatar_type,
+                role=message['role'],
+                content=message['content'],
+                timestamp=timestamp
+            ))
+            if len(conversations) >= limit:
+                break
+        if len(conversations) >= limit:
+            break
+    db.close()
+    return conversations
+
+def _archived_conversations_after(avatar_type: str, after: tuple, limit: int) -> list:
+    """Oldest archived messages newer than after, as detached Conversation objects"""
+    db = _session()
+    query = db.query(ConversationArchive)\
+        .filter(
+            ConversationArchive.tenant_id == current_tenant(),
+            ConversationArchive.avatar_type == avatar_type
+        )
+    if after is not None:
+        query = query.filter(ConversationArchive.last_timestamp >= after[0])
+    blobs = query.order_by(ConversationArchive.date).yield_per(4)
+
+    conversations = []
+    for blob in blobs:
+        for message in _decode_archive(blob.data):
+            timestamp = datetime.fromisoformat(message['timestamp'])
+            if after is not None and (timestamp, message['id']) <= tuple(after):
+                continue
+            conversations.append(Conversation(
+                id=message['id'],
+                tenant_id=blob.tenant_id,
+                avatar_type=blob.avatar_type,
+                role=message['role'],
+                content=message['content'],
+                timestamp=timestamp
+            ))
+            if len(conversations) >= limit:
+                break
+        if len(conversations) >= limit:
+            break
+    db.close()
+    return conversations
+
+def iter_archived_conversation_rows(avatar_type: str = None, start: datetime = None,
+                                    end: datetime = None):
+    """Yield the current tenant's archived messages as lists of row dicts, one day at a time"""
+    db = _session()
+    query = db.query(ConversationArchive)\
+        .filter(ConversationArchive.tenant_id == current_tenant())
+    if avatar_type:
+        query = query.filter(ConversationArchive.avatar_type == avatar_type)
+    if start:
+        query = query.filter(ConversationArchive.last_timestamp >= start)
+    if end:
+        query = query.filter(ConversationArchive.first_timestamp < end)
+    try:
+        for blob in query.order_by(ConversationArchive.date, ConversationArchive.id).yield_per(4):
+            rows = []
+            for message in _decode_archive(blob.data):
+                timestamp = datetime.fromisoformat(message['timestamp'])
+                if (start and timestamp < start) or (end and timestamp >= end):
+                    continue
+                rows.append({
+                    'id': message['id'],
+                    'tenant_id': blob.tenant_id,
+                    'avatar_type': blob.avatar_type,
+                    'role': message['role'],
+                    'content': message['content'],
+                    'timestamp': timestamp,
+                })
+            if rows:
+                yield rows
+    finally:
+        db.close()
+
+def _conversation_storage(engine) -> dict:
+    """
+    Bytes used by the hot conversation table (with its indexes and search
+    index) and by the archive, from the dbstat table (None if unavailable)
+    """
+    hot = [Conversation.__tablename__] + [index.name for index in Conversation.__table__.indexes]
+    cold = [ConversationArchive.__tablename__] + [
+        index.name for index in ConversationArchive.__table__.indexes
+    ]
+    with engine.connect() as conn:
+        page_size = conn.exec_driver_sql("PRAGMA page_size").scalar()
+        page_count = conn.exec_driver_sql("PRAGMA page_count").scalar()
+        try:
+            sizes = dict(conn.exec_driver_sql(
+                "SELECT name, SUM(pgsize) FROM dbstat "
+                "WHERE name IN ({}) OR name LIKE 'conversations_fts%' "
+                "OR name LIKE 'conversations_bigram%' GROUP BY name"
+                .format(", ".join(f"'{name}'" for name in hot + cold))
+            ).all())
+        except OperationalError:
+            sizes = None
+    return {
+        'file_bytes': page_size * page_count,
+        'hot_bytes': None if sizes is None else sum(
+            size for name, size in sizes.items() if name not in cold
+        ),
+        'archive_bytes': None if sizes is None else sum(sizes.get(name, 0) for name in cold),
+    }
+
+def archive_conversations(older_than_days: int = ARCHIVE_AFTER_DAYS, now: datetime = None,
+                          vacuum: bool = False) -> dict:
+    """
+    Move conversations older than older_than_days into the compressed archive
+
+    Messages are grouped per tenant, avatar and day into one zlib-compressed
+    JSON blob (merged into the day's existing blob) and deleted from the hot
+    table, one day per transaction. Covers every tenant in the current
+    tenant's database. get_conversations, get_conversations_after and the
+    export read through to the archive; search_conversations scans it
+    after the indexed hot rows.
+
+    Returns the archived message and blob counts, their size before and
+    after compression and the storage used before and after (VACUUM
+    shrinks the file; otherwise freed pages are reused by later writes).
+    """
+    now = now or datetime.now()
+    cutoff = datetime.combine((now - timedelta(days=older_than_days)).date(), datetime.min.time())
+    store = _store()
+    before = _conversation_storage(store.engine)
+
+    db = store.session_factory()
+    day = func.date(Conversation.timestamp)
+    groups = db.query(Conversation.tenant_id, Conversation.avatar_type, day)\
+        .filter(Conversation.timestamp < cutoff)\
+        .distinct()\
+        .all()
+
+    report = {'cutoff': cutoff, 'messages': 0, 'blobs': 0, 'raw_bytes': 0, 'compressed_bytes': 0}
+    for tenant_id, avatar_type, day_value in groups:
+        archive_date = _parse_date(day_value)
+        day_start = datetime.combine(archive_date, datetime.min.time())
+        rows = db.query(Conversation)\
+            .filter(
+                Conversation.tenant_id == tenant_id,
+                Conversation.avatar_type == avatar_type,
+                Conversation.timestamp >= day_start,
+                Conversation.timestamp < min(day_start + timedelta(days=1), cutoff)
+            )\
+            .order_by(Conversation.timestamp, Conversation.id)\
+            .all()
+        if not rows:
+            continue
+        messages = [
+            {
+                'id': row.id,
+                'role': row.role,
+                'content': row.content,
+                'timestamp': row.timestamp.isoformat(),
+            }
+            for row in rows
+        ]
+
+        blob = db.query(ConversationArchive)\
+            .filter(
+                ConversationArchive.tenant_id == tenant_id,
+                ConversationArchive.avatar_type == avatar_type,
+                ConversationArchive.date == archive_date
+            )\
+            .one_or_none()
+        if blob is None:
+            blob = ConversationArchive(
+                tenant_id=tenant_id,
+                avatar_type=avatar_type,
+                date=archive_date
+            )
+            db.add(blob)
+        else:
+            messages = sorted(
+                _decode_archive(blob.data) + messages,
+                key=lambda message: (message['timestamp'], message['id'])
+            )
+        raw_bytes, data = _encode_archive(messages)
+        blob.message_count = len(messages)
+        blob.first_timestamp = datetime.fromisoformat(messages[0]['timestamp'])
+        blob.last_timestamp = datetime.fromisoformat(messages[-1]['timestamp'])
+        blob.raw_bytes = raw_bytes
+        blob.data = data
+        blob.archived_at = now
+
+        ids = [row.id for row in rows]
+        for i in range(0, len(ids), 500):
+            db.query(Conversation).filter(Conversation.id.in_(ids[i:i + 500]))\
+                .delete(synchronize_session=False)
+        db.commit()
+        db.expunge_all()
+
+        report['messages'] += len(rows)
+        report['blobs'] += 1
+        report['raw_bytes'] += raw_bytes
+        report['compressed_bytes'] += len(data)
+    db.close()
+
+    if vacuum:
+        with store.engine.connect() as conn:
+            conn.exec_driver_sql("VACUUM")
+    report['before'] = before
+    report['after'] = _conversation_storage(store.engine)
+    return report
+
+# ロールアップで合計する UsageLog の列
+ROLLUP_METRICS = [
+    'input_tokens',
+    'output_tokens',
+    'cache_creation_tokens',
+    'cache_read_tokens',
+    'context_trimmed_tokens',
+    'response_cache_hits',
+    'response_cache_misses',
+    'stream_retries',
+    'stream_hedges',
+    'cost',
+]
+
+# リクエストごとの所要時間（ミリ秒）。UsageLog に保存し、パーセンタイル用に
+# LatencyHistogram の対数の階級ごとの件数にも数える
+LATENCY_METRICS = [
+    'context_ms',
+    'ttft_ms',
+    'stream_ms',
+    'db_enqueue_ms',
+]
+
+# ヒストグラムに数える指標（所要時間と、最初のトークン以降の出力トークン/秒）
+HISTOGRAM_METRICS = LATENCY_METRICS + ['tokens_per_second']
+
+# 隣り合う階級の比（階級の代表値と実際の値の差は ±2.5% 以内）
+LATENCY_BUCKET_GROWTH = 1.05
+# これより小さい値は最小の階級に数える
+LATENCY_BUCKET_MIN = 0.001
+
+def latency_bucket(value: float) -> int:
+    """Log-scale histogram bucket of a latency value"""
+    return math.floor(math.log(max(value, LATENCY_BUCKET_MIN), LATENCY_BUCKET_GROWTH))
+
+def latency_bucket_value(bucket: int) -> float:
+    """Representative value (geometric midpoint) of a histogram bucket"""
+    return LATENCY_BUCKET_GROWTH ** (bucket + 0.5)
+
+def _latency_observations(metrics: dict) -> dict:
+    """Histogram values of one request ({} for cache hits and requests without timings)"""
+    if metrics.get('stream_ms') is None or metrics.get('response_cache_hits'):
+        return {}
+    values = {name: metrics[name] for name in LATENCY_METRICS if metrics.get(name) is not None}
+    if metrics.get('ttft_ms') is not None:
+        generation_seconds = (metrics['stream_ms'] - metrics['ttft_ms']) / 1000
+        if generation_seconds > 0:
+            values['tokens_per_second'] = metrics.get('output_tokens', 0) / generation_seconds
+    return values
+
+# trigram 索引で検索できる最短の語長（これより短い語は bigram 索引で検索する）
+SEARCH_MIN_TERM_CHARS = 3
+
+def _like_snippet(content: str, term: str, width: int = 40) -> str:
+    """LIKE 検索結果用に、最初の一致箇所の前後を切り出して強調する"""
+    position = content.lower().find(term.lower())
+    if position < 0:
+        return content[:width * 2]
+    start = max(position - width, 0)
+    end = position + len(term) + width
+    snippet = (
+        content[start:position]
+        + f"**{content[position:position + len(term)]}**"
+        + content[position + len(term):end]
+    )
+    return ("…" if start > 0 else "") + snippet + ("…" if end < len(content) else "")
+
+def _fts_phrase(term: str) -> str:
+    return '"' + term.replace('"', '""') + '"'
+
+def search_conversations(query: str, avatar_type: str = None, start: datetime = None,
+                         end: datetime = None, limit: int = 20, offset: int = 0) -> dict:
+    """
+    Full-text search over conversation history
+
+    Terms separated by whitespace are ANDed. Terms of SEARCH_MIN_TERM_CHARS
+    or more use the trigram index; shorter letter/digit terms use the bigram
+    index. Results are ranked by bm25 and carry a highlighted snippet. Short
+    terms containing symbols fall back to a LIKE filter (a newest-first scan
+    if no term is indexed). Archived conversations are not indexed: once the
+    hot matches run out, the archive is decompressed and scanned newest day
+    first, so deep pages over a large archive are slow.
+
+    Returns {"results": [...], "has_more": bool}
+    """
+    terms = query.split()
+    if not terms:
+        return {"results": [], "has_more": False}
+
+    long_terms = [term for term in terms if len(term) >= SEARCH_MIN_TERM_CHARS]
+    short_terms = [term for term in terms if len(term) < SEARCH_MIN_TERM_CHARS and term.isalnum()]
+    like_terms = [term for term in terms if term not in long_terms and term not in short_terms]
+
+    filters = ["c.tenant_id = :tenant_id"]
+    params = {"limit": limit + 1, "offset": offset, "tenant_id": current_tenant()}
+    if avatar_type:
+        filters.append("c.avatar_type = :avatar_type")
+        params["avatar_type"] = avatar_type
+    if start:
+        filters.append("c.timestamp >= :start")
+        params["start"] = start
+    if end:
+        filters.append("c.timestamp < :end")
+        params["end"] = end
+    for i, term in enumerate(like_terms):
+        escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        params[f"term{i}"] = f"%{escaped}%"
+        filters.append(f"c.content LIKE :term{i} ESCAPE '\\'")
+    if short_terms:
+        # 1文字の語は、その文字で始まる bigram（末尾の1文字を含む）の前方一致で探す
+        params["short_match"] = " ".join(
+            _fts_phrase(term) + ("*" if len(term) == 1 else "") for term in short_terms
+        )
+
+    if long_terms:
+        params["match"] = " ".join(_fts_phrase(term) for term in long_terms)
+        if short_terms:
+            filters.append(
+                "c.id IN (SELECT rowid FROM conversations_bigram "
+                "WHERE conversations_bigram MATCH :short_match)"
+            )
+        where = " AND ".join(["conversations_fts MATCH :match"] + filters)
+        sql = f"""
+            SELECT c.id, c.avatar_type, c.role, c.timestamp,
+                   snippet(conversations_fts, 0, '**', '**', '…', 24) AS snippet
+            FROM conversations_fts
+            JOIN conversations c ON c.id = conversations_fts.rowid
+            WHERE {where}
+            ORDER BY conversations_fts.rank
+        """
+    elif short_terms:
+        # bigram テーブルは本文を持たないため、スニペットは本文から切り出す
+        where = " AND ".join(["conversations_bigram MATCH :short_match"] + filters)
+        sql = f"""
+            SELECT c.id, c.avatar_type, c.role, c.timestamp, c.content AS snippet
+            FROM conversations_bigram
+            JOIN conversations c ON c.id = conversations_bigram.rowid
+            WHERE {where}
+            ORDER BY conversations_bigram.rank
+        """
+    else:
+        where = " AND ".join(filters)
+        sql = f"""
+            SELECT c.id, c.avatar_type, c.role, c.timestamp, c.content AS snippet
+            FROM conversations c
+            WHERE {where}
+            ORDER BY c.timestamp DESC
+        """
+
+    stmt = text(sql + " LIMIT :limit OFFSET :offset").columns(
+        id=Integer, avatar_type=String, role=String, timestamp=DateTime, snippet=Text
+    )
+    count_stmt = text(f"SELECT COUNT(*) FROM ({sql})")
+    if start:
+        stmt = stmt.bindparams(bindparam("start", type_=DateTime))
+        count_stmt = count_stmt.bindparams(bindparam("start", type_=DateTime))
+    if end:
+        stmt = stmt.bindparams(bindparam("end", type_=DateTime))
+        count_stmt = count_stmt.bindparams(bindparam("end", type_=DateTime))
+
+    with _store().engine.connect() as conn:
+        rows = conn.execute(stmt, params).mappings().all()
+        if len(rows) > limit:
+            hot_total = None
+        elif rows or offset == 0:
+            hot_total = offset + len(rows)
+        else:
+            hot_total = conn.execute(count_stmt, params).scalar()
+
+    results = []
+    for row in rows[:limit]:
+        result = dict(row)
+        if not long_terms:
+            result["snippet"] = _like_snippet(result["snippet"], (short_terms or like_terms)[0])
+        results.append(result)
+    if hot_total is None:
+        return {"results": results, "has_more": True}
+
+    # 索引のある会話を出し切ったら、アーカイブを新しい日から順に読んで続ける
+    wanted = limit - len(results)
+    archived = _search_archive(
+        terms, avatar_type, start, end, skip=offset + len(results) - hot_total, limit=wanted + 1
+    )
+    return {"results": results + archived[:wanted], "has_more": len(archived) > wanted}
+
+def _search_archive(terms: list, avatar_type: str, start: datetime, end: datetime,
+                    skip: int, limit: int) -> list:
+    """Archived messages containing every term (case-insensitive), newest day first"""
+    lowered = [term.lower() for term in terms]
+    db = _session()
+    query = db.query(ConversationArchive)\
+        .filter(ConversationArchive.tenant_id == current_tenant())
+    if avatar_type:
+        query = query.filter(ConversationArchive.avatar_type == avatar_type)
+    if start:
+        query = query.filter(ConversationArchive.last_timestamp >= start)
+    if end:
+        query = query.filter(ConversationArchive.first_timestamp < end)
+    blobs = query.order_by(ConversationArchive.date.desc(), ConversationArchive.avatar_type)
+
+    results = []
+    try:
+        for blob in blobs.yield_per(4):
+            for message in reversed(_decode_archive(blob.data)):
+                content = message['content'].lower()
+                if not all(term in content for term in lowered):
+                    continue
+                timestamp = datetime.fromisoformat(message['timestamp'])
+                if (start and timestamp < start) or (end and timestamp >= end):
+                    continue
+                if skip > 0:
+                    skip -= 1
+                    continue
+                results.append({
+                    'id': message['id'],
+                    'avatar_type': blob.avatar_type,
+                    'role': message['role'],
+                    'timestamp': timestamp,
+                    'snippet': _like_snippet(message['content'], terms[0]),
+                })
+                if len(results) >= limit:
+                    return results
+    finally:
+        db.close()
+    return results
+
+def _bump_usage_rollups(db, tenant_id: str, day, avatar_type: str, metrics: dict):
+    """Add one request to the daily and per-avatar rollups (same transaction as the log)"""
+    for model, keys in (
+        (DailyUsage, {'tenant_id': tenant_id, 'date': day}),
+        (AvatarDailyUsage, {'tenant_id': tenant_id, 'date': day, 'avatar_type': avatar_type}),
+    ):
+        stmt = sqlite_insert(model).values(**keys, request_count=1, **metrics)
+        updates = {'request_count': model.request_count + 1}
+        for name in metrics:
+            updates[name] = getattr(model, name) + getattr(stmt.excluded, name)
+        db.execute(stmt.on_conflict_do_update(index_elements=list(keys), set_=updates))
+
+def _bump_latency_histogram(db, tenant_id: str, day, avatar_type: str, observations: dict):
+    """Count one request's timings in the latency histogram (same transaction as the log)"""
+    keys = ['tenant_id', 'date', 'avatar_type', 'metric', 'bucket']
+    for metric, value in observations.items():
+        stmt = sqlite_insert(LatencyHistogram).values(
+            tenant_id=tenant_id,
+            date=day,
+            avatar_type=avatar_type,
+            metric=metric,
+            bucket=latency_bucket(value),
+            count=1
+        )
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=keys, set_={'count': LatencyHistogram.count + 1}
+        ))
+
+def _insert_usage_log(db, avatar_type: str, timestamp: datetime, **metrics):
+    """Stage a usage log row and its rollup updates in the given session"""
+    tenant_id = current_tenant()
+    db.add(UsageLog(tenant_id=tenant_id, avatar_type=avatar_type, timestamp=timestamp, **metrics))
+    _bump_usage_rollups(
+        db,
+        tenant_id,
+        timestamp.date(),
+        avatar_type,
+        {name: metrics[name] for name in ROLLUP_METRICS if name in metrics}
+    )
+    _bump_latency_histogram(
+        db, tenant_id, timestamp.date(), avatar_type, _latency_observations(metrics)
+    )
+
+def _usage_metrics(input_tokens: int, output_tokens: int, cost: float, extra: dict) -> dict:
+    """Complete the usage counters for one request (missing ones are 0, timings are NULL)"""
+    unknown = set(extra) - set(ROLLUP_METRICS) - set(LATENCY_METRICS)
+    if unknown:
+        raise ValueError(f"Unknown usage metrics: {sorted(unknown)}")
+    metrics = {name: 0 for name in ROLLUP_METRICS}
+    metrics.update(extra)
+    metrics.update(input_tokens=input_tokens, output_tokens=output_tokens, cost=cost)
+    return metrics
+
+def add_usage_log(avatar_type: str, input_tokens: int, output_tokens: int, cost: float,
+                  **extra_metrics):
+    """
+    Add API usage log
+
+    extra_metrics are the optional counters in ROLLUP_METRICS
+    (cache_creation_tokens, cache_read_tokens, ...) and the timings in
+    LATENCY_METRICS (milliseconds)
+    """
+    db = _session()
+    _insert_usage_log(
+        db,
+        avatar_type,
+        datetime.now(),
+        **_usage_metrics(input_tokens, output_tokens, cost, extra_metrics)
+    )
+    db.commit()
+    db.close()
+    bump_write_version(UsageLog.__tablename__)
+
+class WriteQueueClosed(RuntimeError):
+    """A write was put on a WriteBehindQueue after close()"""
+
+class WriteBehindQueue:
+    """
+    Background writer that commits queued inserts in batches
+
+    Pending writes are grouped into a single transaction on a dedicated
+    writer thread, so callers on the UI path never wait for a commit.
+    Once closed, the queue rejects new writes instead of starting another
+    writer thread on a store whose engine has been disposed.
+    """
+
+    _STOP = object()
+
+    def __init__(self, session_factory, max_batch: int = 100):
+        self._session_factory = session_factory
+        self._max_batch = max_batch
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._closed = False
+
+    def put(self, writer, *, invalidates: tuple = (), **kwargs):
+        """
+        Queue writer(db, **kwargs) to run on the writer thread
+
+        The writer runs in a copy of the caller's context, so it writes as the
+        caller's tenant. Tables named in invalidates get their write version
+        bumped once the write has been committed, so version-keyed caches
+        never see it early. Raises WriteQueueClosed after close().
+        """
+        with self._lock:
+            if self._closed:
+                raise WriteQueueClosed("Write-behind queue is closed")
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run,
+                    name="db-write-behind",
+                    daemon=True
+                )
+                self._thread.start()
+            # ロック内で入れるので、close() の停止の印より後ろに書き込みが並ぶことはない
+            self._queue.put((contextvars.copy_context(), writer, kwargs, invalidates))
+
+    def flush(self):
+        """Block until every queued write has been committed"""
+        self._queue.join()
+
+    def close(self):
+        """Flush pending writes, stop the writer thread and reject further writes"""
+        with self._lock:
+            self._closed = True
+            thread = self._thread
+            self._thread = None
+        if thread is not None and thread.is_alive():
+            self._queue.put(self._STOP)
+            thread.join()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while batch[-1] is not self._STOP and len(batch) < self._max_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            stop = batch[-1] is self._STOP
+            items = batch[:-1] if stop else batch
+            try:
+                if items:
+                    self._write(items)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+            if stop:
+                return
+
+    def _write(self, items):
+        db = self._session_factory()
+        try:
+            for context, writer, kwargs, _ in items:
+                context.run(writer, db, **kwargs)
+            db.commit()
+            for context, _, _, invalidates in items:
+                for table in invalidates:
+                    context.run(bump_write_version, table)
+        except Exception:
+            db.rollback()
+            logger.exception("Batched write failed; retrying %d writes one by one", len(items))
+            # 1件ずつ書き直して、失敗した行だけを捨てる
+            for context, writer, kwargs, invalidates in items:
+                try:
+                    context.run(writer, db, **kwargs)
+                    db.commit()
+                    for table in invalidates:
+                        context.run(bump_write_version, table)
+                except Exception:
+                    db.rollback()
+                    logger.exception("Dropped queued write %s(%r)", writer.__name__, kwargs)
+        finally:
+            db.close()
+
+class Store:
+    """Engine, session factory and write-behind queue of one database"""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.engine = create_db_engine(url)
+        self.session_factory = sessionmaker(bind=self.engine)
+        self.write_queue = WriteBehindQueue(self.session_factory)
+        self._prepared = False
+        self._prepare_lock = threading.Lock()
+
+    def open(self):
+        """Create or migrate the tables on first use, then return the store"""
+        if not self._prepared:
+            with self._prepare_lock:
+                if not self._prepared:
+                    _prepare_database(self)
+                    self._prepared = True
+        return self
+
+    def close(self):
+        """Flush queued writes and close the pooled connections"""
+        self.write_queue.close()
+        self.engine.dispose()
+
+class SharedLayout:
+    """Every tenant in one database, rows told apart by tenant_id"""
+
+    def __init__(self, url: str):
+        self._store = Store(url)
+
+    def store(self, tenant: str) -> Store:
+        return self._store.open()
+
+    def close(self):
+        self._store.close()
+
+class PerTenantLayout:
+    """
+    One database per tenant, so tenants never wait on each other's write lock
+
+    url_template contains "{tenant}". Stores of at most max_open tenants are
+    kept open; opening another closes the least recently used one.
+    """
+
+    def __init__(self, url_template: str, max_open: int):
+        if '{tenant}' not in url_template:
+            raise ValueError("TENANT_DATABASE_URL must contain {tenant}")
+        self.url_template = url_template
+        self.max_open = max_open
+        self._stores = OrderedDict()
+        self._lock = threading.Lock()
+
+    def url_for(self, tenant: str) -> str:
+        url = self.url_template.format(tenant=validate_tenant(tenant))
+        parsed = make_url(url)
+        if parsed.get_backend_name() == 'sqlite' and parsed.database not in (None, '', ':memory:'):
+            Path(parsed.database).parent.mkdir(parents=True, exist_ok=True)
+        return url
+
+    def store(self, tenant: str) -> Store:
+        evicted = []
+        with self._lock:
+            store = self._stores.get(tenant)
+            if store is None:
+                store = Store(self.url_for(tenant))
+                self._stores[tenant] = store
+                while len(self._stores) > self.max_open:
+                    evicted.append(self._stores.popitem(last=False)[1])
+            else:
+                self._stores.move_to_end(tenant)
+        # 閉じる DB の書き込みキューを流し切るのはロックの外で
+        for old in evicted:
+            old.close()
+        return store.open()
+
+    def close(self):
+        with self._lock:
+            stores = list(self._stores.values())
+            self._stores.clear()
+        for store in stores:
+            store.close()
+
+def create_layout(name: str = STORAGE_LAYOUT):
+    """Storage layout for STORAGE_LAYOUT ('shared' or 'per_tenant')"""
+    if name == 'shared':
+        return SharedLayout(DATABASE_URL)
+    if name == 'per_tenant':
+        return PerTenantLayout(TENANT_DATABASE_URL, TENANT_ENGINE_CACHE_SIZE)
+    raise ValueError(f"Unknown STORAGE_LAYOUT: {name}")
+
+layout = create_layout()
+
+def set_layout(new_layout):
+    """Switch to another storage layout, closing the stores of the current one"""
+    global layout
+    old_layout, layout = layout, new_layout
+    old_layout.close()
+
+@atexit.register
+def _close_layout():
+    layout.close()
+
+def _store() -> Store:
+    return layout.store(current_tenant())
+
+def _session():
+    return _store().session_factory()
+
+def get_engine():
+    """Engine of the current tenant's database"""
+    return _store().engine
+
+def flush_writes():
+    """Block until the current tenant's queued writes have been committed"""
+    _store().write_queue.flush()
+
+def _queue_write(writer, **kwargs):
+    """Put a write on the current tenant's write-behind queue"""
+    try:
+        _store().write_queue.put(writer, **kwargs)
+    except WriteQueueClosed:
+        # 取得した直後に PerTenantLayout が閉じたストアなら、開き直したストアに入れる
+        _store().write_queue.put(writer, **kwargs)
+
+def queue_conversation(avatar_type: str, role: str, content: str) -> datetime:
+    """Queue a conversation insert on the write-behind queue and return its timestamp"""
+    timestamp = datetime.now()
+    _queue_write(
+        _insert_conversation,
         avatar_type=avatar_type,
-        input_tokens=input_tokens,
-        output_tokens=output_tokens,
-        cost=cost
+        role=role,
+        content=content,
+        timestamp=timestamp
+    )
+    return timestamp
+
+def queue_usage_log(avatar_type: str, input_tokens: int, output_tokens: int, cost: float,
+                    **extra_metrics):
+    """Queue an API usage log insert on the write-behind queue (see add_usage_log)"""
+    _queue_write(
+        _insert_usage_log,
+        invalidates=(UsageLog.__tablename__,),
+        avatar_type=avatar_type,
+        timestamp=datetime.now(),
+        **_usage_metrics(input_tokens, output_tokens, cost, extra_metrics)
     )
-    db.add(usage)
+
+def _rebuild_usage_rollups(db):
+    """Rebuild the rollup tables of the session's database for every tenant in it"""
+    db.query(DailyUsage).delete()
+    db.query(AvatarDailyUsage).delete()
+
+    tenant = UsageLog.tenant_id
+    day = func.date(UsageLog.timestamp)
+    aggregates = [func.count(UsageLog.id)]
+    aggregates += [func.sum(getattr(UsageLog, name)) for name in ROLLUP_METRICS]
+    columns = ['request_count'] + ROLLUP_METRICS
+    for row in db.query(tenant, day, *aggregates).group_by(tenant, day):
+        db.add(DailyUsage(
+            tenant_id=row[0],
+            date=_parse_date(row[1]),
+            **dict(zip(columns, row[2:]))
+        ))
+    rows = db.query(tenant, day, UsageLog.avatar_type, *aggregates)\
+        .group_by(tenant, day, UsageLog.avatar_type)
+    for row in rows:
+        db.add(AvatarDailyUsage(
+            tenant_id=row[0],
+            date=_parse_date(row[1]),
+            avatar_type=row[2],
+            **dict(zip(columns, row[3:]))
+        ))
+    _rebuild_latency_histogram(db.connection())
     db.commit()
+
+def _rebuild_latency_histogram(conn):
+    """Rebuild the latency histogram of the connection's database from usage_logs"""
+    conn.execute(delete(LatencyHistogram))
+    names = ['output_tokens', 'response_cache_hits'] + LATENCY_METRICS
+    rows = conn.execute(
+        select(
+            UsageLog.tenant_id,
+            func.date(UsageLog.timestamp),
+            UsageLog.avatar_type,
+            *[getattr(UsageLog, name) for name in names]
+        ).where(UsageLog.stream_ms.isnot(None), UsageLog.response_cache_hits == 0)
+    )
+    counts = Counter()
+    for row in rows:
+        for metric, value in _latency_observations(dict(zip(names, row[3:]))).items():
+            counts[(row[0], row[1], row[2], metric, latency_bucket(value))] += 1
+    histogram = [
+        {
+            'tenant_id': tenant_id,
+            'date': _parse_date(day),
+            'avatar_type': avatar_type,
+            'metric': metric,
+            'bucket': bucket,
+            'count': count,
+        }
+        for (tenant_id, day, avatar_type, metric, bucket), count in counts.items()
+    ]
+    if histogram:
+        conn.execute(LatencyHistogram.__table__.insert(), histogram)
+
+def rebuild_usage_rollups():
+    """Rebuild the usage rollup tables from UsageLog (backfill for existing data)"""
+    db = _session()
+    _rebuild_usage_rollups(db)
+    db.close()
+
+def _parse_date(value):
+    """SQLite の date() は文字列を返すため date 型に変換"""
+    if isinstance(value, str):
+        return datetime.strptime(value, "%Y-%m-%d").date()
+    return value
+
+def get_cached_response(key: str, now: datetime):
+    """Look up an unexpired response in the persistent cache tier"""
+    db = _session()
+    entry = db.query(ResponseCacheEntry.response, ResponseCacheEntry.expires_at)\
+        .filter(
+            ResponseCacheEntry.tenant_id == current_tenant(),
+            ResponseCacheEntry.key == key,
+            ResponseCacheEntry.expires_at > now
+        )\
+        .first()
     db.close()
+    return entry
+
+def _record_response_cache_hit(db, key: str, timestamp: datetime):
+    db.query(ResponseCacheEntry).filter(
+        ResponseCacheEntry.tenant_id == current_tenant(),
+        ResponseCacheEntry.key == key
+    ).update({
+        ResponseCacheEntry.hits: ResponseCacheEntry.hits + 1,
+        ResponseCacheEntry.last_hit_at: timestamp,
+    })
+
+def _store_response(db, key: str, avatar_type: str, response: str, timestamp: datetime,
+                    expires_at: datetime, max_entries: int):
+    """Upsert a cached response, then evict expired and the tenant's least recently used entries"""
+    tenant_id = current_tenant()
+    stmt = sqlite_insert(ResponseCacheEntry).values(
+        tenant_id=tenant_id,
+        key=key,
+        avatar_type=avatar_type,
+        response=response,
+        created_at=timestamp,
+        expires_at=expires_at,
+        last_hit_at=timestamp,
+        hits=0
+    )
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=['tenant_id', 'key'],
+        set_={
+            'response': stmt.excluded.response,
+            'created_at': stmt.excluded.created_at,
+            'expires_at': stmt.excluded.expires_at,
+            'last_hit_at': stmt.excluded.last_hit_at,
+        }
+    ))
+    db.query(ResponseCacheEntry).filter(ResponseCacheEntry.expires_at <= timestamp)\
+        .delete(synchronize_session=False)
+    overflow = select(ResponseCacheEntry.key)\
+        .where(ResponseCacheEntry.tenant_id == tenant_id)\
+        .order_by(ResponseCacheEntry.last_hit_at.desc())\
+        .offset(max_entries)\
+        .limit(-1)
+    db.query(ResponseCacheEntry)\
+        .filter(ResponseCacheEntry.tenant_id == tenant_id, ResponseCacheEntry.key.in_(overflow))\
+        .delete(synchronize_session=False)
+
+def queue_response_cache_hit(key: str):
+    """Queue a hit counter update for a persistent cache entry"""
+    _queue_write(_record_response_cache_hit, key=key, timestamp=datetime.now())
+
+def queue_cached_response(key: str, avatar_type: str, response: str, expires_at: datetime,
+                          max_entries: int):
+    """Queue storing a response in the persistent cache tier"""
+    _queue_write(
+        _store_response,
+        key=key,
+        avatar_type=avatar_type,
+        response=response,
+        timestamp=datetime.now(),
+        expires_at=expires_at,
+        max_entries=max_entries
+    )
 
 def get_total_usage():
     """Get total usage statistics"""
-    db = SessionLocal()
+    db = _session()
     total = db.query(
-        sqlalchemy.func.sum(UsageLog.input_tokens).label('total_input'),
-        sqlalchemy.func.sum(UsageLog.output_tokens).label('total_output'),
-        sqlalchemy.func.sum(UsageLog.cost).label('total_cost')
+        func.sum(DailyUsage.input_tokens).label('total_input'),
+        func.sum(DailyUsage.output_tokens).label('total_output'),
+        func.sum(DailyUsage.cache_creation_tokens).label('total_cache_creation'),
+        func.sum(DailyUsage.cache_read_tokens).label('total_cache_read'),
+        func.sum(DailyUsage.context_trimmed_tokens).label('total_context_trimmed'),
+        func.sum(DailyUsage.response_cache_hits).label('total_response_cache_hits'),
+        func.sum(DailyUsage.response_cache_misses).label('total_response_cache_misses'),
+        func.sum(DailyUsage.stream_retries).label('total_stream_retries'),
+        func.sum(DailyUsage.stream_hedges).label('total_stream_hedges'),
+        func.sum(DailyUsage.cost).label('total_cost'),
+        func.sum(DailyUsage.request_count).label('total_requests')
+    ).filter(
+        DailyUsage.tenant_id == current_tenant()
     ).first()
     db.close()
     return total
 
+def get_daily_usage(since):
+    """Get daily usage rollups since the given date"""
+    db = _session()
+    rows = db.query(DailyUsage)\
+        .filter(DailyUsage.tenant_id == current_tenant(), DailyUsage.date >= since)\
+        .order_by(DailyUsage.date)\
+        .all()
+    db.close()
+    return rows
+
+def get_usage_between(start: datetime, end: datetime) -> dict:
+    """
+    Count requests and total cost for start <= timestamp < end
+
+    A plain range on timestamp, so SQLite scans only that slice of
+    ix_usage_logs_tenant_timestamp instead of evaluating date() on every row.
+    """
+    stmt = select(
+        func.count(UsageLog.id).label('count'),
+        func.coalesce(func.sum(UsageLog.cost), 0.0).label('cost')
+    ).where(
+        UsageLog.tenant_id == current_tenant(),
+        UsageLog.timestamp >= start,
+        UsageLog.timestamp < end
+    )
+    with _store().engine.connect() as conn:
+        row = conn.execute(stmt).one()
+    return dict(row._mapping)
+
+def get_latency_histogram(since, by: str = 'avatar_type'):
+    """
+    Get latency histogram counts of API responses since the given date (cache hits excluded)
+
+    Rows are (key, metric, bucket, count) summed per by ('avatar_type' or 'date');
+    see latency_bucket_value for the value of a bucket
+    """
+    if by not in ('avatar_type', 'date'):
+        raise ValueError(f"Unknown latency histogram grouping: {by}")
+    key = getattr(LatencyHistogram, by)
+    stmt = select(
+        key,
+        LatencyHistogram.metric,
+        LatencyHistogram.bucket,
+        func.sum(LatencyHistogram.count)
+    ).where(
+        LatencyHistogram.tenant_id == current_tenant(),
+        LatencyHistogram.date >= since
+    ).group_by(key, LatencyHistogram.metric, LatencyHistogram.bucket)
+    with _store().engine.connect() as conn:
+        return conn.execute(stmt).all()
+
+def get_avatar_usage(since):
+    """Get per-avatar usage totals since the given date"""
+    db = _session()
+    rows = db.query(
+        AvatarDailyUsage.avatar_type,
+        func.sum(AvatarDailyUsage.request_count).label('request_count'),
+        func.sum(AvatarDailyUsage.input_tokens).label('input_tokens'),
+        func.sum(AvatarDailyUsage.output_tokens).label('output_tokens'),
+        func.sum(AvatarDailyUsage.cache_creation_tokens).label('cache_creation_tokens'),
+        func.sum(AvatarDailyUsage.cache_read_tokens).label('cache_read_tokens'),
+        func.sum(AvatarDailyUsage.context_trimmed_tokens).label('context_trimmed_tokens'),
+        func.sum(AvatarDailyUsage.cost).label('cost')
+    ).filter(
+        AvatarDailyUsage.tenant_id == current_tenant(),
+        AvatarDailyUsage.date >= since
+    ).group_by(AvatarDailyUsage.avatar_type).all()
+    db.close()
+    return rows
+
+# 予定の追加・完了・削除を受け取る関数（リマインダーなど）
+# listener(event, schedule_id, scheduled_datetime, title) の形で、コミット後に
+# 変更した利用者のコンテキストで呼ばれる（event は added / completed / deleted）
+_schedule_listeners = []
+
+def add_schedule_listener(listener):
+    """Call listener after every schedule change committed in this process"""
+    _schedule_listeners.append(listener)
+
+def remove_schedule_listener(listener):
+    if listener in _schedule_listeners:
+        _schedule_listeners.remove(listener)
+
+def _notify_schedule_listeners(event: str, schedule_id: int, scheduled_datetime: datetime = None,
+                               title: str = None):
+    for listener in list(_schedule_listeners):
+        try:
+            listener(event, schedule_id, scheduled_datetime, title)
+        except Exception:
+            logger.exception("Schedule listener failed")
+
 def add_schedule(title: str, scheduled_datetime: datetime, description: str = ""):
     """Add schedule to database"""
-    db = SessionLocal()
+    db = _session()
     schedule = Schedule(
+        tenant_id=current_tenant(),
         title=title,
         scheduled_datetime=scheduled_datetime,
         description=description
     )
     db.add(schedule)
+    db.flush()
+    schedule_id = schedule.id
     db.commit()
     db.close()
+    bump_write_version(Schedule.__tablename__)
+    _notify_schedule_listeners('added', schedule_id, scheduled_datetime, title)
 
 def get_schedules(limit: int = 20):
     """Get upcoming schedules"""
-    db = SessionLocal()
+    db = _session()
     schedules = db.query(Schedule)\
-        .filter(Schedule.completed == 0)\
+        .filter(Schedule.tenant_id == current_tenant(), Schedule.completed == 0)\
         .order_by(Schedule.scheduled_datetime)\
         .limit(limit)\
         .all()
     db.close()
     return schedules
 
-import sqlalchemy
\ No newline at end of file
+def get_schedules_after(after: tuple = None, limit: int = 500):
+    """Active schedules after the (scheduled_datetime, id) cursor, soonest first"""
+    db = _session()
+    query = db.query(Schedule)\
+        .filter(Schedule.tenant_id == current_tenant(), Schedule.completed == 0)
+    if after is not None:
+        query = query.filter(tuple_(Schedule.scheduled_datetime, Schedule.id) > tuple_(*after))
+    schedules = query.order_by(Schedule.scheduled_datetime, Schedule.id).limit(limit).all()
+    db.close()
+    return schedules
+
+def get_schedule_counts(today_start: datetime, tomorrow_start: datetime,
+                        day_after_start: datetime) -> dict:
+    """
+    Count schedules per page bucket without loading the rows
+
+    Buckets: today (including overdue), tomorrow, later and completed.
+    Each count is an index range scan on (tenant_id, completed, scheduled_datetime).
+    """
+    tenant_id = current_tenant()
+
+    def count(*conditions):
+        return select(func.count(Schedule.id))\
+            .where(Schedule.tenant_id == tenant_id, *conditions)\
+            .scalar_subquery()
+
+    active = Schedule.completed == 0
+    stmt = select(
+        count(active, Schedule.scheduled_datetime < tomorrow_start).label('today'),
+        count(
+            active,
+            Schedule.scheduled_datetime >= tomorrow_start,
+            Schedule.scheduled_datetime < day_after_start
+        ).label('tomorrow'),
+        count(active, Schedule.scheduled_datetime >= day_after_start).label('later'),
+        count(Schedule.completed == 1).label('completed')
+    )
+    with _store().engine.connect() as conn:
+        row = conn.execute(stmt).one()
+    return dict(row._mapping)
+
+def get_schedules_in_range(start: datetime = None, end: datetime = None, completed: bool = False,
+                           limit: int = 20, offset: int = 0):
+    """
+    Get schedules with start <= scheduled_datetime < end
+
+    Active schedules are returned soonest first, completed ones most recent first.
+    """
+    db = _session()
+    query = db.query(Schedule).filter(
+        Schedule.tenant_id == current_tenant(),
+        Schedule.completed == (1 if completed else 0)
+    )
+    if start is not None:
+        query = query.filter(Schedule.scheduled_datetime >= start)
+    if end is not None:
+        query = query.filter(Schedule.scheduled_datetime < end)
+    order = Schedule.scheduled_datetime.desc() if completed else Schedule.scheduled_datetime
+    schedules = query.order_by(order).offset(offset).limit(limit).all()
+    db.close()
+    return schedules
+
+def complete_schedule(schedule_id: int):
+    """Mark a schedule as completed"""
+    db = _session()
+    db.query(Schedule)\
+        .filter(Schedule.tenant_id == current_tenant(), Schedule.id == schedule_id)\
+        .update({Schedule.completed: 1})
+    db.commit()
+    db.close()
+    bump_write_version(Schedule.__tablename__)
+    _notify_schedule_listeners('completed', schedule_id)
+
+def delete_schedule(schedule_id: int):
+    """Delete a schedule"""
+    db = _session()
+    db.query(Schedule)\
+        .filter(Schedule.tenant_id == current_tenant(), Schedule.id == schedule_id)\
+        .delete()
+    db.commit()
+    db.close()
+    bump_write_version(Schedule.__tablename__)
+    _notify_schedule_listeners('deleted', schedule_id)
+
+def explain_hot_queries():
+    """
+    Run EXPLAIN QUERY PLAN for the hot queries and check each one uses its index
+
+    Returns a list of (name, expected_index, plan, uses_index)
+    """
+    now = datetime.now()
+    tenant_id = current_tenant()
+    checks = [
+        (
+            "get_conversations",
+            "ix_conversations_tenant_avatar_timestamp",
+            select(Conversation)
+            .where(Conversation.tenant_id == tenant_id, Conversation.avatar_type == "secretary")
+            .order_by(Conversation.timestamp.desc())
+            .limit(50),
+        ),
+        (
+            "get_conversations (older page)",
+            "ix_conversations_tenant_avatar_timestamp",
+            select(Conversation)
+            .where(
+                Conversation.tenant_id == tenant_id,
+                Conversation.avatar_type == "secretary",
+                tuple_(Conversation.timestamp, Conversation.id) < tuple_(now, 1000)
+            )
+            .order_by(Conversation.timestamp.desc(), Conversation.id.desc())
+            .limit(50),
+        ),
+        (
+            "get_schedules",
+            "ix_schedules_tenant_completed_datetime",
+            select(Schedule)
+            .where(Schedule.tenant_id == tenant_id, Schedule.completed == 0)
+            .order_by(Schedule.scheduled_datetime)
+            .limit(20),
+        ),
+        (
+            "get_schedules_after (reminders)",
+            "ix_schedules_tenant_completed_datetime",
+            select(Schedule)
+            .where(
+                Schedule.tenant_id == tenant_id,
+                Schedule.completed == 0,
+                tuple_(Schedule.scheduled_datetime, Schedule.id) > tuple_(now, 1000)
+            )
+            .order_by(Schedule.scheduled_datetime, Schedule.id)
+            .limit(500),
+        ),
+        (
+            "get_latency_histogram",
+            "sqlite_autoindex_usage_latency_daily_1",
+            select(
+                LatencyHistogram.avatar_type,
+                LatencyHistogram.metric,
+                LatencyHistogram.bucket,
+                func.sum(LatencyHistogram.count)
+            )
+            .where(
+                LatencyHistogram.tenant_id == tenant_id,
+                LatencyHistogram.date >= (now - timedelta(days=30)).date()
+            )
+            .group_by(LatencyHistogram.avatar_type, LatencyHistogram.metric, LatencyHistogram.bucket),
+        ),
+        (
+            "get_usage_between (today)",
+            "ix_usage_logs_tenant_timestamp",
+            select(func.count(UsageLog.id), func.sum(UsageLog.cost))
+            .where(
+                UsageLog.tenant_id == tenant_id,
+                UsageLog.timestamp >= now.replace(hour=0, minute=0, second=0, microsecond=0),
+                UsageLog.timestamp < now
+            ),
+        ),
+    ]
+
+    results = []
+    engine = get_engine()
+    with engine.connect() as conn:
+        for name, index_name, stmt in checks:
+            sql = str(stmt.compile(engine, compile_kwargs={"literal_binds": True}))
+            plan = [row[-1] for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}")]
+            uses_index = any(index_name in detail for detail in plan)
+            results.append((name, index_name, plan, uses_index))
+    return results
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Database maintenance commands")
+    parser.add_argument(
+        "command",
+        choices=["init", "rebuild-rollups", "explain", "archive"],
+        help="init: create/upgrade tables / rebuild-rollups: rebuild usage rollups from "
+             "usage_logs / explain: check the hot queries use their indexes / archive: move "
+             "old conversations into the compressed archive"
+    )
+    parser.add_argument(
+        "--tenant",
+        default=DEFAULT_TENANT,
+        help="tenant to operate on (with STORAGE_LAYOUT=per_tenant this selects the database)"
+    )
+    parser.add_argument(
+        "--older-than-days",
+        type=int,
+        default=ARCHIVE_AFTER_DAYS,
+        help="archive: archive conversations older than this many days"
+    )
+    parser.add_argument(
+        "--vacuum",
+        action="store_true",
+        help="archive: VACUUM afterwards so the database file shrinks"
+    )
+    args = parser.parse_args()
+
+    set_current_tenant(args.tenant)
+    init_db()
+    if args.command == "rebuild-rollups":
+        rebuild_usage_rollups()
+        print("Usage rollups rebuilt.")
+    elif args.command == "archive":
+        report = archive_conversations(args.older_than_days, vacuum=args.vacuum)
+        print(f"Archived {report['messages']:,} messages older than {report['cutoff']:%Y-%m-%d} "
+              f"into {report['blobs']:,} daily blobs")
+        if report['raw_bytes']:
+            print(f"  compressed {report['raw_bytes']:,} -> {report['compressed_bytes']:,} bytes "
+                  f"({report['compressed_bytes'] / report['raw_bytes']:.1%})")
+        for name in ('hot_bytes', 'archive_bytes', 'file_bytes'):
+            before, after = report['before'][name], report['after'][name]
+            if before is not None:
+                print(f"  {name}: {before:,} -> {after:,} ({after - before:+,})")
+    elif args.command == "explain":
+        all_ok = True
+        for name, index_name, plan, uses_index in explain_hot_queries():
+            status = "OK" if uses_index else "NG"
+            print(f"[{status}] {name} ({index_name})")
+            for detail in plan:
+                print(f"    {detail}")
+            all_ok = all_ok and uses_index
+        raise SystemExit(0 if all_ok else 1)
\ No newline at end of file
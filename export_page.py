@@ -0,0 +1,59 @@
+# エクスポートページの設定
+import streamlit as st
+import tempfile
+from datetime import datetime, timedelta
+from data_export import EXPORT_FORMATS, ExportError, export
+from avatar_configs import get_avatar_config, get_avatar_list
+
+def show_export_page():
+    """データエクスポートページの表示"""
+    st.title("📤 データエクスポート")
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        table = st.radio(
+            "対象",
+            ["conversations", "usage"],
+            format_func=lambda x: "💬 会話履歴" if x == "conversations" else "📊 使用量ログ",
+            horizontal=True
+        )
+    with col2:
+        fmt = st.radio("形式", list(EXPORT_FORMATS), horizontal=True)
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        avatar_type = st.selectbox(
+            "アバター",
+            options=[None] + [av[0] for av in get_avatar_list()],
+            format_func=lambda x: "すべて" if x is None else
+                f"{get_avatar_config(x)['icon']} {get_avatar_config(x)['name']}"
+        )
+    with col2:
+        date_range = st.date_input("期間", value=())
+    
+    start = end = None
+    if len(date_range) >= 1:
+        start = datetime.combine(date_range[0], datetime.min.time())
+    if len(date_range) == 2:
+        end = datetime.combine(date_range[1] + timedelta(days=1), datetime.min.time())
+    
+    if st.button("📦 エクスポートを作成", type="primary"):
+        # 一時ファイルへチャンク単位で書き出す（全行をメモリに載せない）
+        # download_button が受け付けるのは RawIOBase のためバッファなしで開く
+        # （download_button が呼び出し時に読み込むので、ファイルはその後で閉じてよい）
+        with tempfile.TemporaryFile(buffering=0) as fp:
+            try:
+                with st.spinner("エクスポート中..."):
+                    count = export(table, fmt, fp, avatar_type, start, end)
+            except ExportError as e:
+                st.error(f"エクスポートに失敗しました: {e}")
+                return
+            fp.seek(0)
+            st.success(f"✅ {count:,} 件をエクスポートしました")
+            st.download_button(
+                "⬇️ ダウンロード",
+                data=fp,
+                file_name=f"{table}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{fmt}",
+                mime=EXPORT_FORMATS[fmt],
+                use_container_width=True
+            )
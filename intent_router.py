@@ -0,0 +1,142 @@
+# 秘書アバターの意図判定（Aho-Corasick による複数キーワードの一括照合）
+from collections import deque
+
+class AhoCorasick:
+    """複数キーワードをテキストの1回の走査で照合するオートマトン"""
+
+    def __init__(self, keywords):
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]
+        for keyword in keywords:
+            self._add(keyword)
+        self._build_failure_links()
+
+    def _add(self, keyword: str):
+        state = 0
+        for ch in keyword:
+            next_state = self._goto[state].get(ch)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][ch] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            state = next_state
+        self._output[state].append(keyword)
+
+    def _build_failure_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(ch, 0)
+                if self._fail[next_state] == next_state:
+                    self._fail[next_state] = 0
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+    def find_all(self, text: str) -> list:
+        """一致したキーワードを出現順に返す（重複・包含も含む）"""
+        matches = []
+        state = 0
+        goto = self._goto
+        fail = self._fail
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if self._output[state]:
+                matches.extend(self._output[state])
+        return matches
+
+# 意図ごとのキーワードと重み（2 は強い表現、1 は「教えて」などの弱い表現）
+# どちらも予定の話題と一緒のときだけ意図を決める（「リストに追加」「テストが終わった」など
+# 予定以外の話でも使われるため）
+INTENT_KEYWORDS = {
+    "list": {
+        "一覧": 2, "リスト": 2, "見せて": 1, "教えて": 1, "確認": 1, "何がある": 1, "ある?": 1, "ある？": 1,
+        "あるか": 1, "ありますか": 1,
+    },
+    "add": {
+        "追加": 2, "登録": 2, "入れて": 2, "入れといて": 2, "予約": 1, "おいて": 1, "設定": 1,
+    },
+    "complete": {
+        "完了": 2, "終わった": 2, "終わりました": 2, "済んだ": 2, "済み": 1, "done": 2,
+    },
+    "delete": {
+        "削除": 2, "消して": 2, "取り消": 2, "キャンセル": 2, "なくなった": 2, "中止": 1,
+    },
+}
+
+# 予定の話題を表すキーワード（意図は決めないが、これが無いと意図を決めない）
+# 「タスク」は優先順位の付け方などの相談にも使われるため含めない
+TOPIC_KEYWORDS = [
+    "予定", "スケジュール", "会議", "ミーティング", "打ち合わせ", "アポ", "イベント", "予約",
+    "約束", "用事", "飲み会", "歯医者", "病院", "面接",
+]
+
+# 予定の話題が無いときの確からしさの係数（CONFIDENCE_THRESHOLD 未満になる値）
+NO_TOPIC_FACTOR = 0.5
+
+class IntentRouter:
+    """
+    キーワード表から意図を判定する
+
+    intents: {意図名: {キーワード: 重み}}
+    topic_keywords: 話題を表すキーワード
+    """
+
+    def __init__(self, intents: dict, topic_keywords: list):
+        self._intents = intents
+        self._topic_keywords = set(topic_keywords)
+        self._keyword_intents = {}
+        for intent, keywords in intents.items():
+            for keyword, weight in keywords.items():
+                self._keyword_intents.setdefault(keyword, []).append((intent, weight))
+        self._matcher = AhoCorasick(set(self._keyword_intents) | self._topic_keywords)
+
+    def classify(self, text: str) -> dict:
+        """
+        テキストを意図に分類する
+
+        Returns:
+            {
+                "intent": 意図名（該当なしは "none"）,
+                "confidence": 0〜1 の確からしさ,
+                "scores": {意図名: 重みの合計},
+                "topic": 予定の話題を含むか,
+            }
+        """
+        scores = {intent: 0 for intent in self._intents}
+        topic = False
+        for keyword in self._matcher.find_all(text):
+            if keyword in self._topic_keywords:
+                topic = True
+            for intent, weight in self._keyword_intents.get(keyword, ()):
+                scores[intent] += weight
+
+        total = sum(scores.values())
+        if total == 0:
+            return {"intent": "none", "confidence": 0.0, "scores": scores, "topic": topic}
+
+        intent = max(scores, key=scores.get)
+        confidence = scores[intent] / total
+        if not topic:
+            confidence *= NO_TOPIC_FACTOR
+        return {"intent": intent, "confidence": confidence, "scores": scores, "topic": topic}
+
+# この値未満の確からしさは "none" として LLM に任せる
+CONFIDENCE_THRESHOLD = 0.6
+
+default_router = IntentRouter(INTENT_KEYWORDS, TOPIC_KEYWORDS)
+
+def route_intent(text: str, threshold: float = CONFIDENCE_THRESHOLD) -> dict:
+    """既定のキーワード表で意図を判定し、確からしさが低ければ "none" にする"""
+    result = default_router.classify(text)
+    if result["confidence"] < threshold:
+        result = dict(result, intent="none")
+    return result
@@ -0,0 +1,89 @@
+# Anthropic プロンプトキャッシュの設定
+import os
+
+CACHE_CONTROL = {"type": "ephemeral"}
+
+def build_system_blocks(system_prompt: str) -> list:
+    """
+    システムプロンプトをキャッシュ可能なブロックにする
+
+    アバターの固定プロンプトにキャッシュブレークポイントを置く
+    （要約・予定一覧など毎回変わる部分は add_dynamic_context で最後の発言の後ろに置く）
+    """
+    return [{"type": "text", "text": system_prompt, "cache_control": CACHE_CONTROL}]
+
+def add_cache_breakpoints(messages: list) -> list:
+    """
+    会話履歴にキャッシュブレークポイントを付与
+
+    - 新しい発言の直前（前回までの安定した履歴）: 前ターンで作ったキャッシュを読む
+    - 最新の発言: 次のターンのためにキャッシュを作る
+    """
+    cached = [{"role": m["role"], "content": m["content"]} for m in messages]
+    for index in {len(cached) - 2, len(cached) - 1}:
+        if index < 0:
+            continue
+        content = cached[index]["content"]
+        if isinstance(content, str):
+            content = [{"type": "text", "text": content}]
+        else:
+            content = [dict(block) for block in content]
+        content[-1]["cache_control"] = CACHE_CONTROL
+        cached[index]["content"] = content
+    return cached
+
+def add_dynamic_context(messages: list, dynamic_context: str) -> list:
+    """
+    毎回変わるコンテキストを最新の発言の最後のブレークポイントの後ろに足す
+
+    システムプロンプトに置くと、予定一覧が変わるたびにその後ろの会話履歴の
+    キャッシュも無効になるため、キャッシュする範囲の外（最後）に置く。
+    次のターンの履歴には含めないので、キャッシュした履歴とも一致する。
+    """
+    if not dynamic_context or not messages:
+        return messages
+    last = dict(messages[-1])
+    content = last["content"]
+    if isinstance(content, str):
+        content = [{"type": "text", "text": content}]
+    last["content"] = list(content) + [{"type": "text", "text": dynamic_context}]
+    return messages[:-1] + [last]
+
+def build_stream_request(model: str, max_tokens: int, system_prompt: str, messages: list,
+                         dynamic_context: str = "") -> dict:
+    """client.messages.stream に渡す引数を組み立てる"""
+    return {
+        "model": model,
+        "max_tokens": max_tokens,
+        "system": build_system_blocks(system_prompt),
+        "messages": add_dynamic_context(add_cache_breakpoints(messages), dynamic_context),
+    }
+
+def usage_from_message(message) -> dict:
+    """API レスポンスの usage からトークン数を取り出す（キャッシュ項目は無ければ 0）"""
+    usage = message.usage
+    return {
+        "input_tokens": usage.input_tokens,
+        "output_tokens": usage.output_tokens,
+        "cache_creation_tokens": getattr(usage, "cache_creation_input_tokens", None) or 0,
+        "cache_read_tokens": getattr(usage, "cache_read_input_tokens", None) or 0,
+    }
+
+def calculate_cost(input_tokens: int, output_tokens: int, cache_creation_tokens: int = 0,
+                   cache_read_tokens: int = 0) -> float:
+    """
+    コスト計算 (USD)
+
+    input_tokens はキャッシュ対象外の入力のみを含むため、
+    キャッシュ書き込み・読み込みはそれぞれの単価で加算する
+    """
+    input_cost = float(os.getenv("CLAUDE_SONNET_4_5_INPUT_COST", 3.0))
+    output_cost = float(os.getenv("CLAUDE_SONNET_4_5_OUTPUT_COST", 15.0))
+    cache_write_cost = float(os.getenv("CLAUDE_SONNET_4_5_CACHE_WRITE_COST", input_cost * 1.25))
+    cache_read_cost = float(os.getenv("CLAUDE_SONNET_4_5_CACHE_READ_COST", input_cost * 0.1))
+    return (
+        input_tokens / 1_000_000 * input_cost
+        + output_tokens / 1_000_000 * output_cost
+        + cache_creation_tokens / 1_000_000 * cache_write_cost
+        + cache_read_tokens / 1_000_000 * cache_read_cost
+    )
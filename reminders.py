@@ -0,0 +1,208 @@
+# 予定のリマインダー（プロセスで1つのスレッドが次の通知時刻まで眠り、接続中のセッションに届ける）
+import heapq
+import itertools
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+from database import (
+    add_schedule_listener, current_tenant, get_schedules_after, remove_schedule_listener,
+    tenant_scope
+)
+
+logger = logging.getLogger(__name__)
+
+# 予定の何分前に通知するか
+LEAD_MINUTES = int(os.getenv("REMINDER_LEAD_MINUTES", "10"))
+
+# 1回に DB から読み込む予定の数（読み込んだ最後の予定の通知時刻に次を読み込む）
+LOAD_BATCH = int(os.getenv("REMINDER_LOAD_BATCH", "500"))
+
+# この秒数 poll されなかったセッション（タブを閉じたなど）には届けない
+SESSION_TTL_SECONDS = int(os.getenv("REMINDER_SESSION_TTL_SECONDS", "600"))
+
+# 時計の変更などに備えて、次の通知まで長くてもこの秒数で起きる
+MAX_SLEEP_SECONDS = 60.0
+
+class ReminderEngine:
+    """
+    予定の通知時刻（scheduled_datetime - lead）の min-heap で通知するエンジン
+
+    - 利用者の最初のセッションが poll したときに、その利用者の未完了の予定を
+      load_batch 件ずつ（日時順に）読み込む。残りは読み込んだ最後の予定の通知時刻に
+      次の分を読み込む目印をヒープに置き、定期的な全件の読み直しはしない
+    - add_schedule / complete_schedule / delete_schedule の後に database から呼ばれ、
+      追加は heappush、完了・削除は取り消しの印を付けるだけ（ヒープの先頭に来たら捨てる）
+    - 専用スレッドが先頭の通知時刻まで Condition で眠り、時刻が来たら利用者の
+      セッションごとの受信箱に入れる。各セッションは poll で受け取る（DB は読まない）
+    """
+
+    def __init__(self, lead_minutes: int = LEAD_MINUTES, load_batch: int = LOAD_BATCH,
+                 session_ttl: int = SESSION_TTL_SECONDS, clock=datetime.now):
+        self.lead = timedelta(minutes=lead_minutes)
+        self.load_batch = load_batch
+        self.session_ttl = timedelta(seconds=session_ttl)
+        self.clock = clock
+        self.stats = {"loads": 0, "loaded": 0, "added": 0, "removed": 0, "fired": 0,
+                      "delivered": 0}
+        self._heap = []  # (通知時刻, 連番, 利用者, 予定 ID)。予定 ID が None なら次の分の読み込み
+        self._live = {}  # (利用者, 予定 ID) -> (連番, 予定の日時, タイトル)。無いものは取り消し済み
+        self._cursors = {}  # 利用者 -> 読み込んだ最後の (日時, ID)。None なら全件読み込み済み
+        self._loading = {}  # 読み込み中の利用者 -> その間の変更 {"added": [...], "removed": set()}
+        self._inboxes = {}  # 利用者 -> {セッション ID: {"reminders": [...], "seen": 日時}}
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def start(self):
+        """通知スレッドを起動し、予定の変更を受け取る"""
+        with self._cond:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="reminders", daemon=True)
+            self._thread.start()
+        add_schedule_listener(self.on_schedule_change)
+
+    def stop(self):
+        remove_schedule_listener(self.on_schedule_change)
+
+    def poll(self, session_id: str) -> list:
+        """
+        このセッションに届いた通知を取り出す（初回はセッションを登録する）
+
+        通知は {"schedule_id", "title", "scheduled_datetime"} の辞書。
+        """
+        tenant = current_tenant()
+        now = self.clock()
+        with self._cond:
+            inboxes = self._inboxes.setdefault(tenant, {})
+            inbox = inboxes.setdefault(session_id, {"reminders": [], "seen": now})
+            inbox["seen"] = now
+            reminders, inbox["reminders"] = inbox["reminders"], []
+            if tenant not in self._cursors:
+                # 最初の分の読み込みは通知スレッドで行う（ここでは DB を読まない）
+                self._cursors[tenant] = (now, 0)
+                self._push(now, tenant, None)
+        return reminders
+
+    def on_schedule_change(self, event: str, schedule_id: int, scheduled_datetime: datetime,
+                           title: str):
+        """database の予定の変更の通知（listener）"""
+        tenant = current_tenant()
+        with self._cond:
+            if tenant not in self._cursors:
+                return  # 利用者のセッションが無い（最初の poll で読み込む）
+            loading = self._loading.get(tenant)
+            if event == "added":
+                if scheduled_datetime <= self.clock():
+                    return
+                if loading is not None:
+                    # 読み込みの結果に含まれるか分からないため、読み込み後に判断する
+                    loading["added"].append((schedule_id, scheduled_datetime, title))
+                else:
+                    self._add_loaded(tenant, schedule_id, scheduled_datetime, title)
+            elif self._live.pop((tenant, schedule_id), None) is not None:
+                self.stats["removed"] += 1
+            elif loading is not None:
+                loading["removed"].add(schedule_id)
+
+    def _push(self, fire_at: datetime, tenant: str, schedule_id):
+        seq = next(self._seq)
+        if not self._heap or fire_at < self._heap[0][0]:
+            self._cond.notify()
+        heapq.heappush(self._heap, (fire_at, seq, tenant, schedule_id))
+        return seq
+
+    def _add(self, tenant: str, schedule_id: int, scheduled_datetime: datetime, title: str):
+        if (tenant, schedule_id) in self._live:
+            return
+        seq = self._push(scheduled_datetime - self.lead, tenant, schedule_id)
+        self._live[(tenant, schedule_id)] = (seq, scheduled_datetime, title)
+
+    def _add_loaded(self, tenant: str, schedule_id: int, scheduled_datetime: datetime, title: str):
+        """読み込み済みの範囲の予定だけ入れる（その先は次の分の読み込みで入る）"""
+        cursor = self._cursors[tenant]
+        if cursor is None or (scheduled_datetime, schedule_id) <= cursor:
+            self._add(tenant, schedule_id, scheduled_datetime, title)
+            self.stats["added"] += 1
+
+    def _load(self, tenant: str):
+        """利用者の次の load_batch 件を読み込み、続きがあれば次の読み込みを予約する"""
+        with self._cond:
+            cursor = self._cursors.get(tenant)
+            self._loading[tenant] = {"added": [], "removed": set()}
+        try:
+            with tenant_scope(tenant):
+                schedules = get_schedules_after(cursor, self.load_batch)
+        except Exception:
+            logger.exception("Failed to load schedules for reminders")
+            schedules = None
+
+        with self._cond:
+            changes = self._loading.pop(tenant)
+            if schedules is None:
+                # 読み込みに失敗したときは少し後にやり直す
+                self._push(self.clock() + timedelta(seconds=MAX_SLEEP_SECONDS), tenant, None)
+                return
+            for schedule in schedules:
+                if schedule.id not in changes["removed"]:
+                    self._add(tenant, schedule.id, schedule.scheduled_datetime, schedule.title)
+            self.stats["loads"] += 1
+            self.stats["loaded"] += len(schedules)
+            if len(schedules) < self.load_batch:
+                self._cursors[tenant] = None
+            else:
+                last = schedules[-1]
+                self._cursors[tenant] = (last.scheduled_datetime, last.id)
+                self._push(last.scheduled_datetime - self.lead, tenant, None)
+            for added in changes["added"]:
+                if added[0] not in changes["removed"]:
+                    self._add_loaded(tenant, *added)
+
+    def _next_due(self):
+        """通知時刻が来た先頭の要素を取り出す（それまで眠る）。呼び出し側で _cond を持つ"""
+        while True:
+            # 完了・削除された予定は先頭に来たときに捨てる
+            while self._heap:
+                fire_at, seq, tenant, schedule_id = self._heap[0]
+                live = self._live.get((tenant, schedule_id))
+                if schedule_id is None or (live is not None and live[0] == seq):
+                    break
+                heapq.heappop(self._heap)
+            if not self._heap:
+                self._cond.wait()
+                continue
+            delay = (self._heap[0][0] - self.clock()).total_seconds()
+            if delay <= 0:
+                return heapq.heappop(self._heap)
+            self._cond.wait(min(delay, MAX_SLEEP_SECONDS))
+
+    def _deliver(self, tenant: str, schedule_id: int):
+        live = self._live.pop((tenant, schedule_id))
+        self.stats["fired"] += 1
+        reminder = {"schedule_id": schedule_id, "title": live[2], "scheduled_datetime": live[1]}
+        expired = self.clock() - self.session_ttl
+        inboxes = self._inboxes.get(tenant, {})
+        for session_id, inbox in list(inboxes.items()):
+            if inbox["seen"] < expired:
+                del inboxes[session_id]
+                continue
+            inbox["reminders"].append(reminder)
+            self.stats["delivered"] += 1
+
+    def _run(self):
+        while True:
+            with self._cond:
+                _, _, tenant, schedule_id = self._next_due()
+                if schedule_id is not None:
+                    self._deliver(tenant, schedule_id)
+                    continue
+            self._load(tenant)
+
+def format_reminder(reminder: dict, now: datetime = None) -> str:
+    """チャット・トーストに表示するリマインダーの文面"""
+    now = now or datetime.now()
+    scheduled = reminder["scheduled_datetime"]
+    minutes = max(0, int((scheduled - now).total_seconds() // 60))
+    when = f"{minutes}分後" if minutes else "まもなく"
+    return f"⏰ リマインダー（{when}）:\n\n**{reminder['title']}**\n📅 {scheduled.strftime('%m/%d(%a) %H:%M')}"
@@ -0,0 +1,445 @@
+# Anthropic API 呼び出しのプロセス共通スケジューラ（レート制限対応）
+import asyncio
+import os
+import queue
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import datetime, timezone
+from functools import partial
+import anthropic
+from context_window import MESSAGE_OVERHEAD_TOKENS, estimate_tokens
+from prompt_cache import usage_from_message
+
+# 1分あたりのリクエスト数・入力トークン数の上限（API の組織ごとの上限に合わせる）
+REQUESTS_PER_MINUTE = int(os.getenv("ANTHROPIC_REQUESTS_PER_MINUTE", "50"))
+INPUT_TOKENS_PER_MINUTE = int(os.getenv("ANTHROPIC_INPUT_TOKENS_PER_MINUTE", "30000"))
+
+# 同時に実行するリクエストの上限
+MAX_CONCURRENCY = int(os.getenv("ANTHROPIC_MAX_CONCURRENCY", "8"))
+
+# 429 を受けたときに待ち行列へ戻す回数の上限
+MAX_RATE_LIMIT_RETRIES = int(os.getenv("ANTHROPIC_MAX_RATE_LIMIT_RETRIES", "4"))
+
+# retry-after が無い 429 のときに全体で待つ秒数
+DEFAULT_RETRY_AFTER = 1.0
+
+# 一時的なエラー（5xx・529・接続エラーなど）で応答が始まる前に失敗したときに再送する回数と
+# 待ち時間（クライアントは max_retries=0 で作るため、SDK の再試行の代わりにここで行う）
+MAX_ERROR_RETRIES = int(os.getenv("ANTHROPIC_MAX_ERROR_RETRIES", "2"))
+ERROR_BACKOFF_BASE = 0.5
+ERROR_BACKOFF_MAX = 8.0
+
+# ストリームが次のイベント（送信・テキスト・完了）を待つ時間の上限（秒）
+STREAM_EVENT_TIMEOUT = float(os.getenv("ANTHROPIC_STREAM_EVENT_TIMEOUT_SECONDS", "600"))
+
+def estimate_request_tokens(request: dict) -> int:
+    """build_stream_request で組み立てたリクエストの入力トークン数（概算）"""
+    system = request.get("system", "")
+    if isinstance(system, str):
+        total = estimate_tokens(system)
+    else:
+        total = sum(estimate_tokens(block.get("text", "")) for block in system)
+    for message in request["messages"]:
+        content = message["content"]
+        if isinstance(content, str):
+            total += MESSAGE_OVERHEAD_TOKENS + estimate_tokens(content)
+        else:
+            total += MESSAGE_OVERHEAD_TOKENS + sum(
+                estimate_tokens(block.get("text", "")) for block in content
+            )
+    return total
+
+class TokenBucket:
+    """
+    period 秒あたり limit の速度で補充されるトークンバケット
+
+    API のレート制限もトークンバケットで計算されるため、同じ形で手元に持っておき、
+    レスポンスヘッダーの残量・上限で随時補正する。
+    """
+
+    def __init__(self, limit: float, period: float = 60.0, clock=time.monotonic):
+        self.period = period
+        self.clock = clock
+        self._set_limit(limit)
+        self.tokens = self.capacity
+        self._updated = clock()
+        self._paused_until = 0.0
+
+    def _set_limit(self, limit: float):
+        self.capacity = float(limit)
+        self.rate = self.capacity / self.period
+
+    def _refill(self) -> float:
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        return now
+
+    def wait_time(self, amount: float) -> float:
+        """amount を消費できるまでの秒数"""
+        now = self._refill()
+        # 1回で上限を超える量は満杯になるまで待てばよい
+        amount = min(amount, self.capacity)
+        wait = max(0.0, self._paused_until - now)
+        if self.tokens < amount:
+            wait = max(wait, (amount - self.tokens) / self.rate)
+        return wait
+
+    def consume(self, amount: float):
+        """amount を消費する（負の値なら返却。残量はマイナスにもなる）"""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens - amount)
+
+    def pause(self, seconds: float):
+        """seconds 秒間は消費させない"""
+        self._paused_until = max(self._paused_until, self.clock() + seconds)
+
+    def observe(self, limit=None, remaining=None, reset_after=None):
+        """レスポンスヘッダーの上限・残量に合わせる（サーバー側の方が少なければ下げる）"""
+        self._refill()
+        if limit:
+            self._set_limit(limit)
+        if remaining is not None:
+            self.tokens = min(self.tokens, float(remaining))
+            if remaining <= 0 and reset_after:
+                self.pause(reset_after)
+
+def _header_number(headers, name: str):
+    value = headers.get(name)
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+def _seconds_until(value):
+    """RFC 3339 のリセット時刻までの秒数"""
+    if not value:
+        return None
+    try:
+        reset_at = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    return max(0.0, (reset_at - datetime.now(timezone.utc)).total_seconds())
+
+def rate_limit_headers(headers, kind: str) -> dict:
+    """anthropic-ratelimit-{kind}-limit / remaining / reset を取り出す"""
+    prefix = f"anthropic-ratelimit-{kind}"
+    return {
+        "limit": _header_number(headers, f"{prefix}-limit"),
+        "remaining": _header_number(headers, f"{prefix}-remaining"),
+        "reset_after": _seconds_until(headers.get(f"{prefix}-reset")),
+    }
+
+def is_transient_error(error: Exception) -> bool:
+    """再送すれば通りうるエラーか（SDK が再試行する範囲から 429 を除いたもの）"""
+    if isinstance(error, anthropic.APIConnectionError):
+        return True
+    return isinstance(error, anthropic.APIStatusError) and (
+        error.status_code in (408, 409) or error.status_code >= 500
+    )
+
+def error_backoff(attempt: int) -> float:
+    """一時的なエラーの attempt 回目の再送までの待ち時間（ジッター付き）"""
+    delay = min(ERROR_BACKOFF_MAX, ERROR_BACKOFF_BASE * 2 ** (attempt - 1))
+    return delay * random.uniform(0.5, 1.0)
+
+def partial_usage(stream, texts: list):
+    """
+    最終メッセージを受け取らずに終わったストリームで課金されたトークン数
+
+    入力は message_start の usage、出力は届いたテキストからの概算（message_start を
+    受け取る前に終わっていれば課金されないので None）。
+    """
+    try:
+        message = stream.current_message_snapshot
+    except (AssertionError, AttributeError):
+        return None
+    usage = usage_from_message(message)
+    usage["output_tokens"] = max(usage["output_tokens"], estimate_tokens("".join(texts)))
+    return usage
+
+class _Job:
+    """
+    待ち行列に入った1リクエスト
+
+    結果は (job, kind, value) の形で events に入る（kind は dispatched / text / final / error）。
+    dispatched は待ち行列から取り出して API に送った時点（429 で戻されたら再送のたびに入る）。
+    複数のリクエストで1つの events を共有すると、どれが先に応答したかを待てる。
+    """
+
+    def __init__(self, session_id: str, request: dict, events: queue.Queue = None):
+        self.session_id = session_id
+        self.request = request
+        self.cost = estimate_request_tokens(request)
+        self.events = events if events is not None else queue.Queue()
+        self.attempts = 0  # 429 で待ち行列に戻した回数
+        self.errors = 0  # 一時的なエラーで再送した回数
+        self.task = None
+        self.cancelled = False
+        self.partial_usage = None  # 最終メッセージ無しで終わったときに課金されたトークン数
+        self.finished = threading.Event()  # 完了・失敗・取り消しで終わった
+
+class ScheduledStream:
+    """
+    スケジューラ経由のストリーム
+
+    client.messages.stream と同じく with 文で使い、text_stream で差分を受け取り、
+    get_final_message で最終メッセージを受け取る。with を抜けると未完了の
+    リクエストは取り消される。
+    """
+
+    def __init__(self, scheduler, job: _Job, timeout: float = STREAM_EVENT_TIMEOUT):
+        self._scheduler = scheduler
+        self._job = job
+        self.timeout = timeout
+        self._final = None
+        self.text_stream = self._iter_text()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+    def owns(self, event) -> bool:
+        """共有の events から取り出したイベントがこのストリームのものか"""
+        return event[0] is self._job
+
+    def _iter_text(self):
+        while self._final is None:
+            try:
+                job, kind, value = self._job.events.get(timeout=self.timeout)
+            except queue.Empty:
+                self.close()
+                raise TimeoutError(f"no response from the scheduler within {self.timeout:.0f}s")
+            if job is not self._job or kind == "dispatched":
+                continue
+            if kind == "text":
+                yield value
+            elif kind == "final":
+                self._final = value
+            else:
+                raise value
+
+    def get_final_message(self):
+        for _ in self.text_stream:
+            pass
+        return self._final
+
+    def close(self):
+        self._scheduler.cancel(self._job)
+
+    def wait_closed(self, timeout: float = None) -> bool:
+        """リクエストが終わる（完了・失敗・取り消し）まで待つ。timeout までに終われば True"""
+        return self._job.finished.wait(timeout)
+
+    @property
+    def partial_usage(self):
+        """最終メッセージを受け取らずに終わったときに課金されたトークン数（無ければ None）"""
+        return self._job.partial_usage
+
+class RequestScheduler:
+    """
+    AsyncAnthropic の呼び出しをプロセス全体で順番待ちさせるスケジューラ
+
+    - リクエスト数・入力トークン数のトークンバケットで送信を間引く
+    - レスポンスヘッダーのレート制限情報でバケットを補正し、429 を受けたら
+      retry-after の間すべてのセッションの送信を止めて待ち行列に戻す
+    - 応答が始まる前の一時的なエラー（5xx・529・接続エラー）は指数バックオフの後に再送する
+    - セッションごとの待ち行列をラウンドロビンで取り出して公平にする
+    - 同時実行数は max_concurrency まで
+
+    イベントループは専用スレッドで動かし、Streamlit のスクリプトスレッドからは
+    stream() が返す同期のハンドルで受け取る。
+    """
+
+    def __init__(self, client, requests_per_minute: int = REQUESTS_PER_MINUTE,
+                 input_tokens_per_minute: int = INPUT_TOKENS_PER_MINUTE,
+                 max_concurrency: int = MAX_CONCURRENCY,
+                 max_retries: int = MAX_RATE_LIMIT_RETRIES,
+                 max_error_retries: int = MAX_ERROR_RETRIES,
+                 period: float = 60.0, clock=time.monotonic):
+        self.client = client
+        self.requests = TokenBucket(requests_per_minute, period, clock)
+        self.input_tokens = TokenBucket(input_tokens_per_minute, period, clock)
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.max_error_retries = max_error_retries
+        self.stats = {
+            "dispatched": 0, "rate_limited": 0, "requeued": 0, "error_retries": 0, "failed": 0
+        }
+        self._queues = OrderedDict()  # session_id -> deque[_Job]（先頭のセッションから取り出す）
+        self._in_flight = 0
+        self._loop = None
+        self._wakeup = None
+        self._start_lock = threading.Lock()
+
+    def stream(self, session_id: str, request: dict, events: queue.Queue = None,
+               timeout: float = STREAM_EVENT_TIMEOUT) -> ScheduledStream:
+        """
+        リクエストを待ち行列に入れ、ストリームのハンドルを返す
+
+        text_stream は次のイベントを timeout 秒待っても届かなければ TimeoutError を送出する。
+        """
+        job = _Job(session_id, request, events)
+        self._ensure_loop()
+        self._loop.call_soon_threadsafe(self._enqueue, job)
+        return ScheduledStream(self, job, timeout)
+
+    def cancel(self, job: _Job):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._cancel, job)
+
+    def _ensure_loop(self):
+        with self._start_lock:
+            if self._loop is not None:
+                return
+            loop = asyncio.new_event_loop()
+            ready = threading.Event()
+
+            def run():
+                asyncio.set_event_loop(loop)
+                self._wakeup = asyncio.Event()
+                loop.create_task(self._dispatch())
+                ready.set()
+                loop.run_forever()
+
+            threading.Thread(target=run, name="anthropic-scheduler", daemon=True).start()
+            ready.wait()
+            self._loop = loop
+
+    # 以下はイベントループのスレッドでのみ呼ばれる
+
+    def _enqueue(self, job: _Job, front: bool = False):
+        jobs = self._queues.setdefault(job.session_id, deque())
+        if front:
+            jobs.appendleft(job)
+            self._queues.move_to_end(job.session_id, last=False)
+        else:
+            jobs.append(job)
+        self._wakeup.set()
+
+    def _cancel(self, job: _Job):
+        job.cancelled = True
+        if job.task is None or job.task.done():
+            # 送信前（429 で待ち行列に戻ったものを含む）は待ち行列から捨てられるだけ
+            job.finished.set()
+        else:
+            job.task.cancel()
+
+    def _next_job(self):
+        """ラウンドロビンで次のリクエストを選ぶ（取り消し済みは捨てる）"""
+        while self._queues:
+            session_id, jobs = next(iter(self._queues.items()))
+            while jobs and jobs[0].cancelled:
+                jobs.popleft()
+            if jobs:
+                return jobs[0]
+            del self._queues[session_id]
+        return None
+
+    def _pop(self, job: _Job):
+        jobs = self._queues[job.session_id]
+        jobs.popleft()
+        if jobs:
+            self._queues.move_to_end(job.session_id)
+        else:
+            del self._queues[job.session_id]
+
+    async def _dispatch(self):
+        while True:
+            job = self._next_job()
+            if job is None or self._in_flight >= self.max_concurrency:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            wait = max(self.requests.wait_time(1), self.input_tokens.wait_time(job.cost))
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+
+            self._pop(job)
+            self.requests.consume(1)
+            self.input_tokens.consume(job.cost)
+            self._in_flight += 1
+            self.stats["dispatched"] += 1
+            job.events.put((job, "dispatched", None))
+            job.task = asyncio.create_task(self._run(job))
+            job.task.add_done_callback(partial(self._cancelled_before_start, job))
+
+    def _cancelled_before_start(self, job: _Job, task: asyncio.Task):
+        # 実行が始まる前に取り消されたタスクは _run の finally を通らない
+        if task.cancelled():
+            self._in_flight -= 1
+            job.finished.set()
+            self._wakeup.set()
+
+    def _observe(self, headers):
+        self.requests.observe(**rate_limit_headers(headers, "requests"))
+        self.input_tokens.observe(**rate_limit_headers(headers, "input-tokens"))
+
+    async def _run(self, job: _Job):
+        stream = None
+        texts = []
+        requeued = False
+        try:
+            async with self.client.messages.stream(**job.request) as stream:
+                self._observe(stream.response.headers)
+                async for text in stream.text_stream:
+                    texts.append(text)
+                    job.events.put((job, "text", text))
+                message = await stream.get_final_message()
+            stream = None
+
+            # 見積もりと実際の入力トークン数の差をバケットに反映
+            usage = message.usage
+            actual = usage.input_tokens + (getattr(usage, "cache_creation_input_tokens", None) or 0)
+            self.input_tokens.consume(actual - job.cost)
+            job.events.put((job, "final", message))
+        except anthropic.RateLimitError as e:
+            self.stats["rate_limited"] += 1
+            headers = e.response.headers
+            self._observe(headers)
+            retry_after = _header_number(headers, "retry-after")
+            if retry_after is None:
+                retry_after = DEFAULT_RETRY_AFTER
+            self.requests.pause(retry_after)
+            if job.attempts < self.max_retries and not job.cancelled:
+                job.attempts += 1
+                self.stats["requeued"] += 1
+                requeued = True
+                self._enqueue(job, front=True)
+            else:
+                self.stats["failed"] += 1
+                job.events.put((job, "error", e))
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            retryable = not texts and is_transient_error(e) and not job.cancelled
+            if retryable and job.errors < self.max_error_retries:
+                job.errors += 1
+                self.stats["error_retries"] += 1
+                requeued = True
+                asyncio.get_running_loop().call_later(
+                    error_backoff(job.errors), self._enqueue, job, True
+                )
+            else:
+                self.stats["failed"] += 1
+                job.events.put((job, "error", e))
+        finally:
+            if stream is not None:
+                # 取り消し・途中のエラーでも受け取った分は課金される（再送した分は合算）
+                usage = partial_usage(stream, texts)
+                if usage is not None:
+                    previous = job.partial_usage or {}
+                    job.partial_usage = {
+                        name: tokens + previous.get(name, 0) for name, tokens in usage.items()
+                    }
+            if not requeued:
+                job.finished.set()
+            self._in_flight -= 1
+            self._wakeup.set()
@@ -0,0 +1,107 @@
+# LLM 応答の完全一致キャッシュ（メモリの LRU + SQLite の永続層）
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from threading import Lock
+from database import (
+    current_tenant, get_cached_response, queue_cached_response, queue_response_cache_hit
+)
+
+# キャッシュの有効期間（秒）
+TTL_SECONDS = int(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "86400"))
+
+# メモリに保持する応答の最大数
+MEMORY_SIZE = int(os.getenv("RESPONSE_CACHE_MEMORY_SIZE", "128"))
+
+# SQLite に保持する応答の最大数（超えた分は最後に使われた日時が古いものから削除）
+MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "2000"))
+
+# キャッシュした応答を再生するときの1回あたりの最小の文字数と間隔（秒）
+REPLAY_CHUNK_CHARS = 24
+REPLAY_INTERVAL = 0.02
+
+# 再生にかける時間の上限（秒。長い応答は1回あたりの文字数を増やしてこの時間に収める）
+REPLAY_MAX_SECONDS = 0.5
+
+def cache_key(request: dict) -> str:
+    """
+    リクエスト（モデル・システムプロンプト・会話履歴・max_tokens）のハッシュ
+
+    build_stream_request の戻り値をそのまま渡す。
+    cache_control の有無も含めて同じリクエストなら同じキーになる。
+    """
+    payload = json.dumps(request, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class ResponseCache:
+    """
+    メモリ上の LRU を SQLite の永続層の前に置いた TTL 付きキャッシュ
+
+    応答は利用者（database.current_tenant()）ごとに分けて保持する。
+    """
+
+    def __init__(self, ttl_seconds: int = TTL_SECONDS, memory_size: int = MEMORY_SIZE,
+                 max_entries: int = MAX_ENTRIES, clock=datetime.now):
+        self.ttl = timedelta(seconds=ttl_seconds)
+        self.memory_size = memory_size
+        self.max_entries = max_entries
+        self.clock = clock
+        self._memory = OrderedDict()  # (利用者, key) -> (response, expires_at)
+        self._lock = Lock()
+
+    def _remember(self, key: str, response: str, expires_at: datetime):
+        memory_key = (current_tenant(), key)
+        with self._lock:
+            self._memory[memory_key] = (response, expires_at)
+            self._memory.move_to_end(memory_key)
+            while len(self._memory) > self.memory_size:
+                self._memory.popitem(last=False)
+
+    def get(self, key: str):
+        """キャッシュされた応答を返す。無いか期限切れなら None"""
+        now = self.clock()
+        memory_key = (current_tenant(), key)
+        with self._lock:
+            entry = self._memory.get(memory_key)
+            if entry is not None:
+                if entry[1] > now:
+                    self._memory.move_to_end(memory_key)
+                else:
+                    del self._memory[memory_key]
+                    entry = None
+
+        if entry is None:
+            entry = get_cached_response(key, now)
+            if entry is None:
+                return None
+            self._remember(key, entry.response, entry.expires_at)
+
+        queue_response_cache_hit(key)
+        return entry[0]
+
+    def put(self, key: str, avatar_type: str, response: str):
+        """応答をメモリと SQLite（書き込みキュー経由）に保存"""
+        expires_at = self.clock() + self.ttl
+        self._remember(key, response, expires_at)
+        queue_cached_response(key, avatar_type, response, expires_at, self.max_entries)
+
+    def clear_memory(self):
+        with self._lock:
+            self._memory.clear()
+
+def replay_chunks(text: str, size: int = REPLAY_CHUNK_CHARS,
+                  max_chunks: int = int(REPLAY_MAX_SECONDS / REPLAY_INTERVAL)):
+    """
+    キャッシュした応答をストリーミングと同じように少しずつ返す
+
+    max_chunks 回を超えないように1回あたりの文字数を増やすので、
+    REPLAY_INTERVAL ごとに表示すれば応答の長さに関わらず REPLAY_MAX_SECONDS 秒で終わる。
+    """
+    size = max(size, -(-len(text) // max_chunks))
+    for i in range(0, len(text), size):
+        yield text[i:i + size]
+
+# アプリ全体で共有するキャッシュ
+response_cache = ResponseCache()
@@ -0,0 +1,65 @@
+# 秘書アバター向けの予定コンテキスト（書き込みで無効化されるメモ化）
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from threading import Lock
+from database import (
+    Schedule, current_tenant, get_schedules, get_schedules_in_range, get_write_version
+)
+from scheduler import extract_date_range
+
+# コンテキストに含める予定の最大件数
+MAX_SCHEDULES = 10
+
+# メモ化するコンテキストの最大数
+CACHE_SIZE = 64
+
+_cache = OrderedDict()
+_cache_lock = Lock()
+
+def _build_context(date_range) -> str:
+    """予定一覧のコンテキストを組み立てる（同じ予定なら常に同じ文字列になる）"""
+    if date_range is None:
+        schedules = get_schedules(limit=MAX_SCHEDULES)
+        header = "現在登録されている予定:"
+    else:
+        start, end = date_range
+        schedules = get_schedules_in_range(start, end, limit=MAX_SCHEDULES)
+        last_day = end - timedelta(days=1)
+        if last_day.date() == start.date():
+            header = f"{start.strftime('%m/%d')} の予定:"
+        else:
+            header = f"{start.strftime('%m/%d')}〜{last_day.strftime('%m/%d')} の予定:"
+    
+    schedules = sorted(schedules, key=lambda s: (s.scheduled_datetime, s.id))
+    if not schedules:
+        return "" if date_range is None else f"{header}\n- なし\n"
+    
+    lines = [header]
+    for s in schedules:
+        lines.append(f"- {s.scheduled_datetime.strftime('%m/%d %H:%M')}: {s.title}")
+    return "\n".join(lines) + "\n"
+
+def get_schedule_context(prompt: str, now: datetime = None) -> str:
+    """
+    発言に関係する期間の予定コンテキストを返す
+    
+    発言に日付の指定があればその期間の予定を、無ければ直近の予定を選ぶ。
+    結果は利用者と予定テーブルの書き込みバージョンごとにメモ化され、
+    add_schedule / complete_schedule / delete_schedule で無効化される。
+    """
+    date_range = extract_date_range(prompt, now)
+    key = (current_tenant(), get_write_version(Schedule.__tablename__), date_range)
+    
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+    
+    context = _build_context(date_range)
+    
+    with _cache_lock:
+        _cache[key] = context
+        _cache.move_to_end(key)
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return context
@@ -1,17 +1,23 @@
 # スケジュールページの設定
 import streamlit as st
 from datetime import datetime, timedelta
-from database import SessionLocal, Schedule, add_schedule
-import pandas as pd
+from database import (
+    DEFAULT_TENANT, current_tenant, add_schedule, complete_schedule, delete_schedule,
+    get_schedule_counts, get_schedules_in_range
+)
+
+# 各区分で一度に表示する件数
+PAGE_SIZE = 20
 
 def show_schedule_page():
     """スケジュール管理ページの表示"""
     st.title("📅 スケジュール管理")
+    # 予定は利用者ごと（複数利用者の構成のときは誰の予定かを表示）
+    if current_tenant() != DEFAULT_TENANT:
+        st.caption(f"👤 {current_tenant()} の予定")
     
     tab1, tab2 = st.tabs(["📋 予定一覧", "➕ 新規追加"])
     
-    db = SessionLocal()
-    
     with tab1:
         # フィルター
         col1, col2 = st.columns([3, 1])
@@ -21,44 +27,56 @@ def show_schedule_page():
             if st.button("🔄 更新", use_container_width=True):
                 st.rerun()
         
-        # スケジュール取得
-        query = db.query(Schedule)
-        if not show_completed:
-            query = query.filter(Schedule.completed == 0)
+        # 今日（期限切れを含む）、明日、それ以降の境界
+        today_start = datetime.combine(datetime.now().date(), datetime.min.time())
+        tomorrow_start = today_start + timedelta(days=1)
+        day_after_start = today_start + timedelta(days=2)
         
-        schedules = query.order_by(Schedule.scheduled_datetime).all()
+        # 件数は SQL で数える（行は読み込まない）
+        counts = get_schedule_counts(today_start, tomorrow_start, day_after_start)
+        active_count = counts["today"] + counts["tomorrow"] + counts["later"]
         
-        if schedules:
-            st.subheader(f"📌 予定: {len(schedules)}件")
-            
-            # 今日、明日、それ以降に分類
-            now = datetime.now()
-            today_end = now.replace(hour=23, minute=59, second=59)
-            tomorrow_end = (now + timedelta(days=1)).replace(hour=23, minute=59, second=59)
-            
-            today_schedules = [s for s in schedules if s.scheduled_datetime <= today_end]
-            tomorrow_schedules = [s for s in schedules if today_end < s.scheduled_datetime <= tomorrow_end]
-            later_schedules = [s for s in schedules if s.scheduled_datetime > tomorrow_end]
+        if active_count or (show_completed and counts["completed"]):
+            st.subheader(f"📌 予定: {active_count}件")
             
             # 今日の予定
-            if today_schedules:
-                st.markdown("### 🔴 今日の予定")
-                for schedule in today_schedules:
-                    display_schedule_card(schedule, db)
+            if counts["today"]:
+                st.markdown(f"### 🔴 今日の予定 ({counts['today']}件)")
+                show_windowed_section(
+                    "today",
+                    counts["today"],
+                    lambda limit: get_schedules_in_range(end=tomorrow_start, limit=limit)
+                )
                 st.divider()
             
             # 明日の予定
-            if tomorrow_schedules:
-                st.markdown("### 🟡 明日の予定")
-                for schedule in tomorrow_schedules:
-                    display_schedule_card(schedule, db)
+            if counts["tomorrow"]:
+                st.markdown(f"### 🟡 明日の予定 ({counts['tomorrow']}件)")
+                show_windowed_section(
+                    "tomorrow",
+                    counts["tomorrow"],
+                    lambda limit: get_schedules_in_range(tomorrow_start, day_after_start, limit=limit)
+                )
                 st.divider()
             
             # それ以降の予定
-            if later_schedules:
-                st.markdown("### 🟢 今後の予定")
-                for schedule in later_schedules:
-                    display_schedule_card(schedule, db)
+            if counts["later"]:
+                st.markdown(f"### 🟢 今後の予定 ({counts['later']}件)")
+                show_windowed_section(
+                    "later",
+                    counts["later"],
+                    lambda limit: get_schedules_in_range(start=day_after_start, limit=limit)
+                )
+            
+            # 完了済みの予定
+            if show_completed and counts["completed"]:
+                st.divider()
+                st.markdown(f"### ✅ 完了済み ({counts['completed']}件)")
+                show_windowed_section(
+                    "completed",
+                    counts["completed"],
+                    lambda limit: get_schedules_in_range(completed=True, limit=limit)
+                )
         else:
             st.info("📭 予定がありません")
     
@@ -94,10 +112,25 @@ def show_schedule_page():
                     st.rerun()
                 else:
                     st.error("タイトルを入力してください")
+
+def show_windowed_section(name: str, total: int, load):
+    """先頭から表示件数分だけ読み込み、「さらに表示」で表示件数を増やす"""
+    window_key = f"schedule_window_{name}"
+    window = st.session_state.get(window_key, PAGE_SIZE)
+    
+    for schedule in load(window):
+        display_schedule_card(schedule)
     
-    db.close()
+    if total > window:
+        if st.button(
+            f"さらに表示（残り {total - window}件）",
+            key=f"more_{name}",
+            use_container_width=True
+        ):
+            st.session_state[window_key] = window + PAGE_SIZE
+            st.rerun()
 
-def display_schedule_card(schedule, db):
+def display_schedule_card(schedule):
     """スケジュールカードの表示"""
     col1, col2, col3 = st.columns([6, 2, 1])
     
@@ -119,15 +152,13 @@ def display_schedule_card(schedule, db):
         # 完了ボタン
         if not schedule.completed:
             if st.button("✓ 完了", key=f"complete_{schedule.id}", use_container_width=True):
-                schedule.completed = 1
-                db.commit()
+                complete_schedule(schedule.id)
                 st.rerun()
     
     with col3:
         # 削除ボタン
         if st.button("🗑️", key=f"delete_{schedule.id}", use_container_width=True):
-            db.delete(schedule)
-            db.commit()
+            delete_schedule(schedule.id)
             st.rerun()
     
-    st.divider()
\ No newline at end of file
+    st.divider()
@@ -1,92 +1,294 @@
 import re
-from datetime import datetime, timedelta
+from datetime import datetime, date, timedelta
 import json
 
-def parse_schedule_request(text: str) -> dict:
+# 日時表現のトークン（1回の走査で全て拾うため1つの正規表現にまとめる）
+# 同じ位置で複数の候補に一致しうるものは、長い表現を先に並べる
+_TOKEN_PATTERN = re.compile(
+    r"""
+    (?P<date>(?:(?P<year>\d{4})[年/\-])?(?P<month>\d{1,2})(?:月|/)(?P<day>\d{1,2})日?)
+    | (?P<iso_date>(?P<iso_year>\d{4})-(?P<iso_month>\d{1,2})-(?P<iso_day>\d{1,2}))
+    | (?P<days_later>\d+)日後
+    | (?P<weeks_later>\d+)週間後
+    | (?P<time_later>(?:(?P<later_hours>\d+)時間(?:(?P<later_hour_minutes>\d+)分|(?P<later_half>半))?
+                      |(?P<later_minutes>\d+)分)後)
+    | (?P<duration>(?:(?P<dur_hours>\d+)時間(?:(?P<dur_hour_minutes>\d+)分|(?P<dur_half>半))?
+                    |(?P<dur_minutes>\d+)分間?))
+    | (?P<day_of_month>\d{1,2})日(?!間|\d+(?:回|分|時間|錠|杯|度))
+    | (?P<day_word>今日|本日|明後日|あさって|明日|あした|今週|再来週|来週)
+    | (?P<weekday>[月火水木金土日])曜日?
+    | (?P<weekday_note>[(（][月火水木金土日][)）])
+    | (?P<time>(?P<ampm>午前|午後|朝|夜|夕方|昼)?\s*
+                (?:(?P<clock_hour>\d{1,2}):(?P<clock_minute>\d{2})
+                  |(?P<hour>\d{1,2})時(?:(?P<minute>\d{1,2})分|(?P<half>半))?
+                  |(?P<noon>正午)))
+    | (?P<day_part>午前中|午後|夕方)
+    | (?P<range>から|〜|~|－|-)
+    """,
+    re.VERBOSE
+)
+
+_DAY_OFFSETS = {
+    '今日': 0, '本日': 0,
+    '明日': 1, 'あした': 1,
+    '明後日': 2, 'あさって': 2,
+}
+
+_WEEK_OFFSETS = {
+    '今週': 0,
+    '来週': 1,
+    '再来週': 2,
+}
+
+_WEEKDAYS = {
+    '月': 0, '火': 1, '水': 2, '木': 3, '金': 4, '土': 5, '日': 6
+}
+
+# 時刻なしの「午前中」「午後」などは代表的な時刻にする
+_DAY_PART_TIMES = {
+    '午前中': (9, 0),
+    '午後': (13, 0),
+    '夕方': (17, 0),
+}
+
+_PM_WORDS = {'午後', '夜', '夕方'}
+_AM_WORDS = {'午前', '朝'}
+
+# タイトルから除く依頼表現・助詞
+_COMMAND_SUFFIX = re.compile(
+    r"(?:を|の)?(?:予定|スケジュール)?(?:を)?"
+    r"(?:入れて|入れる|追加して|追加|登録して|登録|予約して|予約|設定して|おいて|"
+    r"お願いします|お願い|ください|下さい|して)+$"
+)
+_EDGE_PARTICLES = re.compile(
+    r"^(?:[のにでをはと、,\s]|から|まで|だけ|ほど|くらい|ぐらい)+"
+    r"|(?:[のにでをはと、,。\s]|から|まで|だけ|ほど|くらい|ぐらい)+$"
+)
+_TOKEN_GAP = "\x00"
+
+DEFAULT_TIME = (9, 0)
+
+def _resolve_hour(hour: int, ampm: str) -> int:
+    """午前・午後などの修飾を 24 時間表記に反映"""
+    if ampm in _PM_WORDS and hour < 12:
+        return hour + 12
+    if ampm == '昼' and hour < 6:
+        return hour + 12
+    if ampm in _AM_WORDS and hour == 12:
+        return 0
+    return hour
+
+def _clean_title(text: str) -> str:
+    """日時トークンを除いた残りからタイトルを取り出す"""
+    candidates = []
+    for segment in text.split(_TOKEN_GAP):
+        segment = _EDGE_PARTICLES.sub("", segment)
+        segment = _COMMAND_SUFFIX.sub("", segment)
+        segment = _EDGE_PARTICLES.sub("", segment)
+        if segment:
+            candidates.append(segment)
+    if not candidates:
+        return ""
+    return max(candidates, key=len)
+
+def parse_schedule_request(text: str, now: datetime = None) -> dict:
     """
     自然言語からスケジュール情報を抽出
     
+    日付・時刻・所要時間・タイトルを1回の走査で取り出す。
+    
     例:
     - "明日の10時に会議"
     - "来週の月曜日15:00にミーティング"
     - "3日後の14時30分に打ち合わせ"
-    """
-    result = {
-        "title": "",
-        "datetime": None,
-        "description": ""
-    }
+    - "10月20日 午後2時から4時まで 定例会議を入れて"
+    - "金曜の夜7時に1時間半 飲み会"
     
-    # 時刻パターン
-    time_patterns = [
-        r'(\d{1,2}):(\d{2})',  # 10:30
-        r'(\d{1,2})時(\d{1,2})分',  # 10時30分
-        r'(\d{1,2})時',  # 10時
-    ]
+    Returns:
+        {
+            "title": タイトル,
+            "datetime": 開始日時（時刻が無ければ 9:00）,
+            "end_datetime": 終了日時（範囲・所要時間が無ければ None）,
+            "duration_minutes": 所要時間（分、無ければ None）,
+            "description": "",
+        }
+    """
+    now = now or datetime.now()
+    today = now.date()
     
-    # 日付パターン
-    date_patterns = {
-        '今日': 0,
-        '明日': 1,
-        '明後日': 2,
-        '来週': 7,
-    }
+    target_date = None
+    week_offset = None
+    weekday = None
+    start_time = None
+    day_part_time = None
+    end_time = None
+    duration_minutes = None
+    range_pending = False
+    last_kind = None
     
-    # 曜日パターン
-    weekdays = {
-        '月': 0, '火': 1, '水': 2, '木': 3, '金': 4, '土': 5, '日': 6
-    }
+    remainder = []
+    position = 0
+    for match in _TOKEN_PATTERN.finditer(text):
+        kind = match.lastgroup
+        groups = match.groupdict()
+        
+        # 範囲記号（「から」「〜」）は時刻の直後のときだけトークンとして扱う
+        if kind == 'range':
+            if last_kind != 'time':
+                continue
+            range_pending = True
+        elif kind in ('date', 'iso_date'):
+            prefix = 'iso_' if kind == 'iso_date' else ''
+            year = groups[f'{prefix}year']
+            month = int(groups[f'{prefix}month'])
+            day = int(groups[f'{prefix}day'])
+            try:
+                target_date = date(int(year) if year else today.year, month, day)
+            except ValueError:
+                continue
+            if not year and target_date < today:
+                target_date = target_date.replace(year=today.year + 1)
+        elif kind == 'days_later':
+            target_date = today + timedelta(days=int(groups['days_later']))
+        elif kind == 'weeks_later':
+            target_date = today + timedelta(weeks=int(groups['weeks_later']))
+        elif kind == 'time_later':
+            if groups['later_minutes']:
+                later = now + timedelta(minutes=int(groups['later_minutes']))
+            else:
+                minutes = int(groups['later_hour_minutes'] or (30 if groups['later_half'] else 0))
+                later = now + timedelta(hours=int(groups['later_hours']), minutes=minutes)
+            target_date = later.date()
+            start_time = (later.hour, later.minute)
+        elif kind == 'duration':
+            if groups['dur_minutes']:
+                duration_minutes = int(groups['dur_minutes'])
+            else:
+                duration_minutes = int(groups['dur_hours']) * 60
+                if groups['dur_hour_minutes']:
+                    duration_minutes += int(groups['dur_hour_minutes'])
+                elif groups['dur_half']:
+                    duration_minutes += 30
+        elif kind == 'day_of_month':
+            day = int(groups['day_of_month'])
+            month_start = today.replace(day=1)
+            try:
+                target_date = month_start.replace(day=day)
+                if target_date < today:
+                    next_month = (month_start + timedelta(days=32)).replace(day=1)
+                    target_date = next_month.replace(day=day)
+            except ValueError:
+                continue
+        elif kind == 'day_word':
+            word = groups['day_word']
+            if word in _DAY_OFFSETS:
+                target_date = today + timedelta(days=_DAY_OFFSETS[word])
+            else:
+                week_offset = _WEEK_OFFSETS[word]
+        elif kind == 'day_part':
+            day_part_time = _DAY_PART_TIMES[groups['day_part']]
+        elif kind == 'weekday':
+            weekday = _WEEKDAYS[groups['weekday']]
+        elif kind == 'weekday_note':
+            # 「10/20(月)」の括弧書きの曜日は日付の補足なので読み飛ばす
+            pass
+        elif kind == 'time':
+            if groups['noon']:
+                hour, minute = 12, 0
+            elif groups['clock_hour']:
+                hour, minute = int(groups['clock_hour']), int(groups['clock_minute'])
+            else:
+                hour = int(groups['hour'])
+                minute = int(groups['minute']) if groups['minute'] else (30 if groups['half'] else 0)
+            hour = _resolve_hour(hour, groups['ampm'])
+            if hour > 23 or minute > 59:
+                continue
+            
+            if range_pending and start_time is not None:
+                # 終了時刻に午前/午後が無ければ開始時刻より後になるよう補正
+                # （12時間足しても開始より前なら日付をまたぐ範囲として翌日の時刻にする）
+                if (not groups['ampm'] and hour < 12 and (hour, minute) <= start_time
+                        and (hour + 12, minute) > start_time):
+                    hour += 12
+                end_time = (hour, minute)
+                range_pending = False
+            else:
+                start_time = (hour, minute)
+        
+        remainder.append(text[position:match.start()])
+        remainder.append(_TOKEN_GAP)
+        position = match.end()
+        last_kind = kind
+    remainder.append(text[position:])
     
-    # 基準時刻
-    now = datetime.now()
-    target_date = now.date()
-    target_time = None
-    
-    # 時刻の抽出
-    for pattern in time_patterns:
-        match = re.search(pattern, text)
-        if match:
-            hour = int(match.group(1))
-            minute = int(match.group(2)) if len(match.groups()) > 1 else 0
-            target_time = datetime.strptime(f"{hour:02d}:{minute:02d}", "%H:%M").time()
-            break
-    
-    # 日付の抽出
-    for keyword, days in date_patterns.items():
-        if keyword in text:
-            target_date = (now + timedelta(days=days)).date()
-            break
-    
-    # "X日後" パターン
-    days_later_match = re.search(r'(\d+)日後', text)
-    if days_later_match:
-        days = int(days_later_match.group(1))
-        target_date = (now + timedelta(days=days)).date()
-    
-    # 曜日指定
-    for day_name, day_num in weekdays.items():
-        if f'{day_name}曜' in text or f'{day_name}曜日' in text:
-            days_ahead = (day_num - now.weekday() + 7) % 7
+    # 日付の決定（曜日指定は週の指定と組み合わせる）
+    if weekday is not None:
+        if week_offset is not None:
+            monday = today - timedelta(days=today.weekday()) + timedelta(weeks=week_offset)
+            target_date = monday + timedelta(days=weekday)
+        else:
+            days_ahead = (weekday - today.weekday() + 7) % 7
             if days_ahead == 0:
                 days_ahead = 7  # 来週の同じ曜日
-            target_date = (now + timedelta(days=days_ahead)).date()
-            break
-    
-    # 日時の組み合わせ
-    if target_time:
-        result["datetime"] = datetime.combine(target_date, target_time)
-    else:
-        # 時刻が指定されていない場合は9:00をデフォルトに
-        result["datetime"] = datetime.combine(target_date, datetime.strptime("09:00", "%H:%M").time())
-    
-    # タイトルの抽出（「に」の後の部分）
-    title_match = re.search(r'に(.+)', text)
-    if title_match:
-        result["title"] = title_match.group(1).strip()
-    else:
-        result["title"] = text.strip()
+            target_date = today + timedelta(days=days_ahead)
+    elif week_offset and target_date is None:
+        target_date = today + timedelta(weeks=week_offset)
     
-    return result
+    target_date = target_date or today
+    hour, minute = start_time or day_part_time or DEFAULT_TIME
+    start = datetime.combine(target_date, datetime.min.time()).replace(hour=hour, minute=minute)
+    
+    end = None
+    if end_time is not None:
+        end = start.replace(hour=end_time[0], minute=end_time[1])
+        if end <= start:
+            end += timedelta(days=1)
+        duration_minutes = int((end - start).total_seconds() // 60)
+    elif duration_minutes is not None:
+        end = start + timedelta(minutes=duration_minutes)
+    
+    title = _clean_title("".join(remainder)) or text.strip()
+    
+    return {
+        "title": title,
+        "datetime": start,
+        "end_datetime": end,
+        "duration_minutes": duration_minutes,
+        "description": ""
+    }
+
+def extract_date_range(text: str, now: datetime = None):
+    """
+    発言が指している期間を返す
+    
+    - 「来週」「今週」など週だけの指定はその週（月曜〜日曜）
+    - 日付・曜日・「明日」などの指定はその日
+    - 日付の指定が無ければ None
+    
+    Returns:
+        (開始日時, 終了日時) の組（終了は含まない）または None
+    """
+    now = now or datetime.now()
+    today = now.date()
+    week_offset = None
+    has_day = False
+    for match in _TOKEN_PATTERN.finditer(text):
+        kind = match.lastgroup
+        if kind == 'day_word' and match.group('day_word') in _WEEK_OFFSETS:
+            week_offset = _WEEK_OFFSETS[match.group('day_word')]
+        elif kind in ('date', 'iso_date', 'days_later', 'weeks_later', 'time_later',
+                      'day_of_month', 'day_word', 'weekday'):
+            has_day = True
+    
+    if has_day:
+        day = parse_schedule_request(text, now=now)["datetime"].date()
+        start = datetime.combine(day, datetime.min.time())
+        return start, start + timedelta(days=1)
+    if week_offset is not None:
+        monday = today - timedelta(days=today.weekday()) + timedelta(weeks=week_offset)
+        start = datetime.combine(monday, datetime.min.time())
+        return start, start + timedelta(weeks=1)
+    return None
 
 def format_schedule_list(schedules) -> str:
     """スケジュールリストを整形"""
@@ -0,0 +1,250 @@
+# ストリーミング応答のテールレイテンシ対策（最初のトークンの期限・停止検知・再試行・ヘッジ）
+import os
+import queue
+import random
+import time
+from collections import deque
+from request_scheduler import is_transient_error
+
+# 最初のトークンが届くまでの期限（秒。スケジューラが送信した時点から数える）
+TTFT_TIMEOUT = float(os.getenv("STREAM_TTFT_TIMEOUT_SECONDS", "20"))
+
+# スケジューラの待ち行列で送信を待つ時間の上限（秒）
+QUEUE_TIMEOUT = float(os.getenv("STREAM_QUEUE_TIMEOUT_SECONDS", "300"))
+
+# トークンの間隔がこれを超えたら停止とみなす（秒）
+STALL_TIMEOUT = float(os.getenv("STREAM_STALL_TIMEOUT_SECONDS", "30"))
+
+# 期限切れ・接続エラー・5xx のときの再試行回数と待ち時間（指数バックオフ）
+MAX_RETRIES = int(os.getenv("STREAM_MAX_RETRIES", "2"))
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 8.0
+
+# ヘッジ（最初のトークンが遅いときに同じリクエストをもう1本送る）
+HEDGE_ENABLED = os.getenv("STREAM_HEDGE_ENABLED", "false").lower() == "true"
+HEDGE_PERCENTILE = float(os.getenv("STREAM_HEDGE_PERCENTILE", "0.95"))
+
+# ヘッジの待ち時間を決めるのに必要な最初のトークンまでの時間の件数
+HEDGE_MIN_SAMPLES = 20
+
+# 取り消した送信が終わる（課金されたトークン数が分かる）のを待つ時間（秒）
+ABANDONED_WAIT = 2.0
+
+USAGE_FIELDS = ("input_tokens", "output_tokens", "cache_creation_tokens", "cache_read_tokens")
+
+class StreamTimeout(Exception):
+    """最初のトークンが期限までに届かないか、途中で止まった"""
+
+class QueueTimeout(Exception):
+    """スケジューラの待ち行列から送信されないまま期限を過ぎた（再試行しない）"""
+
+def is_retryable(error: Exception) -> bool:
+    """再試行して意味のあるエラーか（429 はスケジューラが処理済み）"""
+    return isinstance(error, StreamTimeout) or is_transient_error(error)
+
+def backoff_delay(attempt: int) -> float:
+    """attempt 回目の再試行までの待ち時間（ジッター付き）"""
+    delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempt - 1))
+    return delay * random.uniform(0.5, 1.0)
+
+class TTFTTracker:
+    """最近の最初のトークンまでの時間からヘッジの待ち時間を決める"""
+
+    def __init__(self, window: int = 200, min_samples: int = HEDGE_MIN_SAMPLES):
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=window)
+
+    def record(self, seconds: float):
+        self._samples.append(seconds)
+
+    def percentile(self, p: float):
+        """p（0〜1）パーセンタイル。件数が足りなければ None"""
+        if len(self._samples) < self.min_samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+# プロセス全体で共有する計測値
+ttft_tracker = TTFTTracker()
+
+class GuardedStream:
+    """
+    RequestScheduler.stream を包み、遅い・止まった応答をやり直すストリーム
+
+    - 最初のトークンが ttft_timeout 秒以内に届かなければやり直す
+    - トークンの間隔が stall_timeout 秒を超えたらやり直す
+    - やり直しは指数バックオフで max_retries 回まで（途中まで表示していた場合は
+      on_retry が呼ばれるので、表示を消してから新しい応答を受け取る）
+    - hedge が有効なら、最初のトークンまでの時間が最近のパーセンタイルを超えた時点で
+      同じリクエストをもう1本送り、先にトークンが届いた方を残して他方は取り消す
+
+    ttft_timeout とヘッジの待ち時間は、スケジューラが待ち行列から送り出した時点から数える
+    （レート制限で待った時間で期限切れ・ヘッジにならないように）。
+    retries / hedges には実際に行った回数が入り、取り消し・やり直しで捨てた送信の
+    トークン数は abandoned_usage() で分かる。
+    """
+
+    def __init__(self, scheduler, session_id: str, request: dict,
+                 ttft_timeout: float = TTFT_TIMEOUT, stall_timeout: float = STALL_TIMEOUT,
+                 max_retries: int = MAX_RETRIES, hedge: bool = HEDGE_ENABLED,
+                 hedge_percentile: float = HEDGE_PERCENTILE, tracker: TTFTTracker = ttft_tracker,
+                 queue_timeout: float = QUEUE_TIMEOUT, on_retry=None, clock=time.monotonic,
+                 sleep=time.sleep):
+        self._scheduler = scheduler
+        self._session_id = session_id
+        self._request = request
+        self.ttft_timeout = ttft_timeout
+        self.stall_timeout = stall_timeout
+        self.max_retries = max_retries
+        self.queue_timeout = queue_timeout
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.tracker = tracker
+        self.on_retry = on_retry
+        self.clock = clock
+        self.sleep = sleep
+        self.retries = 0
+        self.hedges = 0
+        self._streams = []
+        self._started = []  # これまでに送ったすべてのストリーム
+        self._final = None
+        self.text_stream = self._iter_text()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+    def close(self):
+        for stream in self._streams:
+            stream.close()
+        self._streams = []
+
+    def get_final_message(self):
+        for _ in self.text_stream:
+            pass
+        return self._final
+
+    def abandoned_usage(self, timeout: float = ABANDONED_WAIT) -> dict:
+        """
+        最終メッセージを受け取らずに終わった送信（取り消したヘッジ・やり直した送信・
+        失敗した送信）で課金されたトークン数の合計（usage_from_message と同じ形）
+
+        close() した送信は取り消しが終わるまで、それぞれ timeout 秒まで待つ。
+        """
+        total = dict.fromkeys(USAGE_FIELDS, 0)
+        for stream in self._started:
+            stream.wait_closed(timeout)
+            for name, value in (stream.partial_usage or {}).items():
+                total[name] += value
+        return total
+
+    def _hedge_delay(self):
+        if not self.hedge:
+            return None
+        delay = self.tracker.percentile(self.hedge_percentile)
+        if delay is None or delay >= self.ttft_timeout:
+            return None
+        return delay
+
+    def _start(self, events: queue.Queue):
+        stream = self._scheduler.stream(self._session_id, self._request, events)
+        self._streams.append(stream)
+        self._started.append(stream)
+        return stream
+
+    def _wait_first_event(self, events: queue.Queue):
+        """最初のイベントを待つ。ヘッジした場合は先に届いた方を返す"""
+        primary = self._streams[0]
+        queued_until = self.clock() + self.queue_timeout
+        started = deadline = hedge_at = None
+
+        while True:
+            if started is None:
+                wake_at = queued_until
+            else:
+                wake_at = hedge_at if hedge_at is not None else deadline
+            try:
+                event = events.get(timeout=max(0.0, wake_at - self.clock()))
+            except queue.Empty:
+                if started is None:
+                    raise QueueTimeout(f"not dispatched within {self.queue_timeout:.1f}s")
+                if hedge_at is not None and self.clock() >= hedge_at:
+                    self._start(events)
+                    self.hedges += 1
+                    hedge_at = None
+                    continue
+                if self.clock() >= deadline:
+                    raise StreamTimeout(f"no first token within {self.ttft_timeout:.1f}s")
+                continue
+
+            owner = next((s for s in self._streams if s.owns(event)), None)
+            if owner is None:
+                continue
+            if event[1] == "dispatched":
+                if owner is primary:
+                    # 期限・ヘッジは送信した時点から（429 で待ち行列に戻ったら再送から数え直す）
+                    started = self.clock()
+                    deadline = started + self.ttft_timeout
+                    hedge_delay = None if self.hedges else self._hedge_delay()
+                    hedge_at = started + hedge_delay if hedge_delay is not None else None
+                continue
+            if event[1] == "error" and len(self._streams) > 1:
+                # ヘッジしたもう一方がまだ生きていればそちらを待つ
+                self._streams.remove(owner)
+                continue
+
+            if started is not None:
+                self.tracker.record(self.clock() - started)
+            for other in self._streams:
+                if other is not owner:
+                    other.close()
+            self._streams = [owner]
+            return event
+
+    def _attempt(self):
+        """1回分の送信。届いたテキストを順に返す"""
+        events = queue.Queue()
+        self._start(events)
+        event = self._wait_first_event(events)
+        winner = self._streams[0]
+        while True:
+            _, kind, value = event
+            if kind == "text":
+                yield value
+            elif kind == "final":
+                self._final = value
+                return
+            else:
+                raise value
+
+            while True:
+                try:
+                    event = events.get(timeout=self.stall_timeout)
+                except queue.Empty:
+                    raise StreamTimeout(f"no token for {self.stall_timeout:.1f}s")
+                if winner.owns(event) and event[1] != "dispatched":
+                    break
+
+    def _iter_text(self):
+        attempt = 0
+        while True:
+            emitted = False
+            try:
+                for text in self._attempt():
+                    emitted = True
+                    yield text
+                return
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    raise
+            finally:
+                self.close()
+
+            attempt += 1
+            self.retries += 1
+            if emitted and self.on_retry is not None:
+                self.on_retry()
+            self.sleep(backoff_delay(attempt))
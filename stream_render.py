@@ -0,0 +1,58 @@
+# ストリーミング応答の描画間引き
+import time
+
+CURSOR = "▌"
+
+class ThrottledRenderer:
+    """
+    ストリーミング中の placeholder.markdown 呼び出しをまとめる
+
+    テキスト差分ごとに全文を描画し直すと応答長の2乗に比例して送信量が増えるため、
+    前回の描画から frame_interval 秒経過したか、未描画の文字が char_threshold 文字
+    たまったときだけ描画する。finish() では最終テキストをそのまま描画する。
+    """
+
+    def __init__(self, placeholder, frame_interval: float = 0.1, char_threshold: int = 400,
+                 clock=time.monotonic):
+        self._placeholder = placeholder
+        self._frame_interval = frame_interval
+        self._char_threshold = char_threshold
+        self._clock = clock
+        self._chunks = []
+        self._pending_chars = 0
+        self._last_render = None
+        self.render_calls = 0
+        self.bytes_sent = 0
+
+    @property
+    def text(self) -> str:
+        return "".join(self._chunks)
+
+    def append(self, delta: str):
+        """テキスト差分を追加し、必要なら描画する"""
+        self._chunks.append(delta)
+        self._pending_chars += len(delta)
+
+        now = self._clock()
+        due = self._last_render is None or now - self._last_render >= self._frame_interval
+        if due or self._pending_chars >= self._char_threshold:
+            self._render(self.text + CURSOR)
+            self._last_render = now
+
+    def reset(self):
+        """それまでのテキストを破棄する（応答を最初から受け取り直すとき）"""
+        self._chunks = []
+        self._pending_chars = 0
+        self._last_render = None
+
+    def finish(self) -> str:
+        """最終テキストを描画して返す"""
+        text = self.text
+        self._render(text)
+        return text
+
+    def _render(self, body: str):
+        self._placeholder.markdown(body)
+        self._pending_chars = 0
+        self.render_calls += 1
+        self.bytes_sent += len(body.encode("utf-8"))
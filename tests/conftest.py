@@ -0,0 +1,6 @@
+# テストは一時ディレクトリの DB を使う（database の import より前に設定する）
+import os
+import tempfile
+
+os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp(prefix='llm_app_test_')}/test.db"
+os.environ.setdefault("ANTHROPIC_API_KEY", "fake")
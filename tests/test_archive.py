@@ -0,0 +1,132 @@
+"""古い会話のアーカイブ（日ごとの圧縮した塊）と、履歴・検索・エクスポート・要約の読み通し"""
+import io
+import json
+from datetime import datetime, timedelta
+
+import database
+from data_export import export
+from database import ConversationArchive, tenant_scope
+
+# この日時から30日より前（2025-01-30 より前）の会話をアーカイブする
+NOW = datetime(2025, 3, 1, 12, 0)
+
+def add_at(avatar_type, role, content, timestamp):
+    db = database.get_db()
+    database._insert_conversation(db, avatar_type, role, content, timestamp)
+    db.commit()
+    db.close()
+
+def archive():
+    return database.archive_conversations(older_than_days=30, now=NOW)
+
+def archived_blobs():
+    db = database.get_db()
+    blobs = db.query(ConversationArchive)\
+        .filter(ConversationArchive.tenant_id == database.current_tenant())\
+        .order_by(ConversationArchive.date, ConversationArchive.avatar_type)\
+        .all()
+    db.close()
+    return blobs
+
+def test_second_run_merges_into_the_existing_day_blob():
+    day = datetime(2025, 1, 10)
+    with tenant_scope("archive-merge"):
+        add_at("secretary", "user", "9時の発言", day.replace(hour=9))
+        add_at("secretary", "assistant", "10時の発言", day.replace(hour=10))
+        assert archive()["messages"] >= 2
+
+        add_at("secretary", "user", "8時の発言", day.replace(hour=8))
+        assert archive()["messages"] == 1
+
+        blobs = archived_blobs()
+        assert len(blobs) == 1
+        blob = blobs[0]
+        messages = database._decode_archive(blob.data)
+        assert [m["content"] for m in messages] == ["8時の発言", "9時の発言", "10時の発言"]
+        assert blob.message_count == 3
+        assert (blob.first_timestamp, blob.last_timestamp) == (day.replace(hour=8), day.replace(hour=10))
+        assert database.get_conversations_after("secretary", None, limit=10)[0].content == "8時の発言"
+        db = database.get_db()
+        hot = db.query(database.Conversation)\
+            .filter(database.Conversation.tenant_id == "archive-merge").count()
+        db.close()
+        assert hot == 0
+
+def test_keyset_paging_across_the_archive_boundary():
+    contents = []
+    with tenant_scope("archive-paging"):
+        for day in range(20):
+            timestamp = datetime(2025, 1, 20, 9) + timedelta(days=day)
+            for i in range(2):
+                content = f"{timestamp:%m/%d} の発言{i}"
+                # 同じ時刻の発言は id の順に並ぶ
+                add_at("secretary", "user" if i == 0 else "assistant", content, timestamp)
+                contents.append(content)
+        archive()
+        assert sum(blob.message_count for blob in archived_blobs()) == 20
+
+        pages, before = [], None
+        while True:
+            page = database.get_conversations("secretary", limit=7, before=before)
+            if not page:
+                break
+            pages.append(page)
+            before = (page[0].timestamp, page[0].id)
+
+    loaded = [conv.content for page in reversed(pages) for conv in page]
+    assert loaded == contents
+
+def test_search_and_export_see_archived_rows():
+    with tenant_scope("archive-search"):
+        add_at("secretary", "user", "古い議事録の共有", datetime(2025, 1, 5, 10))
+        add_at("secretary", "user", "新しい議事録の共有", datetime(2025, 2, 20, 10))
+        archive()
+
+        found = database.search_conversations("議事録", limit=5)
+        assert [r["timestamp"].month for r in found["results"]] == [2, 1]
+        assert "**議事録**" in found["results"][1]["snippet"]
+        assert not found["has_more"]
+        # 2文字の語・期間の絞り込み・ページ送り
+        assert len(database.search_conversations("議事")["results"]) == 2
+        assert len(database.search_conversations(
+            "議事録", start=datetime(2025, 1, 1), end=datetime(2025, 1, 31)
+        )["results"]) == 1
+        first = database.search_conversations("議事録", limit=1)
+        second = database.search_conversations("議事録", limit=1, offset=1)
+        assert first["has_more"] and not second["has_more"]
+        assert second["results"][0]["timestamp"] == datetime(2025, 1, 5, 10)
+
+        fp = io.BytesIO()
+        assert export("conversations", "jsonl", fp) == 2
+        rows = [json.loads(line) for line in fp.getvalue().decode("utf-8").splitlines()]
+        assert [row["content"] for row in rows] == ["古い議事録の共有", "新しい議事録の共有"]
+
+def test_archive_keeps_tenants_apart():
+    for tenant in ("archive-alice", "archive-bob"):
+        with tenant_scope(tenant):
+            add_at("secretary", "user", f"{tenant} の秘密の相談", datetime(2025, 1, 8, 9))
+    with tenant_scope("archive-alice"):
+        archive()
+
+    for tenant, other in (("archive-alice", "archive-bob"), ("archive-bob", "archive-alice")):
+        with tenant_scope(tenant):
+            assert [blob.message_count for blob in archived_blobs()] == [1]
+            history = database.get_conversations("secretary")
+            assert [conv.content for conv in history] == [f"{tenant} の秘密の相談"]
+            found = database.search_conversations("秘密の相談")["results"]
+            assert len(found) == 1 and other not in found[0]["snippet"]
+            assert len(database.get_conversations_after("secretary")) == 1
+
+def test_summarizer_reads_turns_archived_before_they_were_summarized():
+    with tenant_scope("archive-summary"):
+        for day in range(4):
+            add_at("secretary", "user", f"発言{day}", datetime(2025, 1, 27, 9) + timedelta(days=day))
+        archive()
+        assert sum(blob.message_count for blob in archived_blobs()) == 3
+
+        oldest = database.get_conversations_after("secretary", None, limit=2)
+        assert [conv.content for conv in oldest] == ["発言0", "発言1"]
+        rest = database.get_conversations_after(
+            "secretary", (oldest[-1].timestamp, oldest[-1].id), limit=10
+        )
+        assert [conv.content for conv in rest] == ["発言2", "発言3"]
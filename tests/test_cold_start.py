@@ -0,0 +1,9 @@
+"""チャットページの起動が重いモジュールを読み込まず、import 時間・再実行時間が上限内に収まること"""
+from benchmarks.cold_start import MAX_IMPORT_MS, MAX_RERUN_MS, run_child
+
+def test_chat_page_cold_start():
+    timings, imports = run_child(reruns=5)
+    assert timings["forbidden_loaded"] == []
+    assert sum(imports.values()) < MAX_IMPORT_MS
+    # チャットの1ターンごとの再実行（p50）
+    assert timings["rerun_p50_ms"] < MAX_RERUN_MS
@@ -0,0 +1,61 @@
+"""会話履歴のコンテキストウィンドウ（予算での切り詰め・トークン数のキャッシュ・交互のロール）"""
+from context_window import estimate_tokens, fit_to_budget, message_tokens
+
+def conversation(turns: int, chars: int = 96) -> list:
+    """本文がほぼ chars 文字の user と assistant が交互の会話"""
+    messages = []
+    for i in range(turns):
+        messages.append({"role": "user", "content": f"質{i:02d}" + "あ" * (chars - 3)})
+        messages.append({"role": "assistant", "content": f"答{i:02d}" + "い" * (chars - 3)})
+    return messages
+
+def test_over_budget_trims_to_the_low_water_mark_from_a_user_turn():
+    messages = conversation(10) + [{"role": "user", "content": "最新の質問"}]
+    counts = [message_tokens(m) for m in messages]
+    context = fit_to_budget(messages, budget=1000, low_water=0.7)
+
+    assert context["kept_tokens"] <= 700
+    assert context["messages"][0]["role"] == "user"
+    assert context["messages"][-1]["content"] == "最新の質問"
+    assert context["messages"] == messages[context["start"]:]
+    # 削った分の報告
+    assert context["kept_tokens"] == sum(counts[context["start"]:])
+    assert context["trimmed_tokens"] == sum(counts[:context["start"]]) > 0
+    assert context["trimmed_messages"] == context["start"]
+
+def test_start_is_reused_while_under_budget():
+    messages = conversation(10)
+    first = fit_to_budget(messages, budget=1000)
+    # 1往復増えても予算内なら先頭は動かない（プロンプトキャッシュを保つ）
+    messages += [{"role": "user", "content": "次"}, {"role": "assistant", "content": "はい"}]
+    second = fit_to_budget(messages, budget=1000, start=first["start"])
+    assert second["start"] == first["start"]
+    assert fit_to_budget(messages, budget=10**6)["trimmed_tokens"] == 0
+
+def test_message_counts_are_cached_per_content():
+    messages = conversation(5)
+    estimate_tokens.cache_clear()
+    fit_to_budget(messages, budget=10**6)
+    misses = estimate_tokens.cache_info().misses
+    fit_to_budget(messages + [{"role": "user", "content": "新しい発言"}], budget=10**6)
+    info = estimate_tokens.cache_info()
+    assert misses == len(messages)
+    assert info.misses == misses + 1
+    assert info.hits == len(messages)
+
+def test_same_role_runs_are_merged_into_alternating_turns():
+    messages = [
+        {"role": "assistant", "content": "⏰ リマインダー"},
+        {"role": "user", "content": "こんにちは"},
+        {"role": "assistant", "content": "こんにちは！"},
+        {"role": "assistant", "content": "⏰ 会議の時間です"},
+        {"role": "user", "content": "返事が来なかった質問"},
+        {"role": "user", "content": "もう一度聞きます"},
+    ]
+    context = fit_to_budget(messages, budget=10**6)
+    roles = [m["role"] for m in context["messages"]]
+
+    assert roles == ["user", "assistant", "user"]
+    assert context["messages"][1]["content"] == "こんにちは！\n\n⏰ 会議の時間です"
+    assert context["messages"][2]["content"] == "返事が来なかった質問\n\nもう一度聞きます"
+    assert messages[2]["content"] == "こんにちは！"
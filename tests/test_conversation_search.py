@@ -0,0 +1,64 @@
+"""会話検索（3文字以上は trigram 索引、それより短い語は bigram 索引）"""
+import sqlite3
+
+import database
+from database import tenant_scope
+
+def _contents(found):
+    return sorted(result["snippet"].replace("**", "") for result in found["results"])
+
+def test_short_terms_use_bigram_index():
+    with tenant_scope("search-short"):
+        database.add_conversation("secretary", "user", "明日の会議の資料を準備して")
+        database.add_conversation("secretary", "assistant", "予定を確認しました")
+        database.add_conversation("secretary", "user", "AIの会")
+
+        assert _contents(database.search_conversations("会議")) == ["明日の会議の資料を準備して"]
+        assert _contents(database.search_conversations("会議 資料")) == ["明日の会議の資料を準備して"]
+        assert _contents(database.search_conversations("会議 予定")) == []
+        # 1文字の語（末尾の文字も見つかる）と英字の大文字小文字
+        assert _contents(database.search_conversations("会")) == ["AIの会", "明日の会議の資料を準備して"]
+        assert _contents(database.search_conversations("ai")) == ["AIの会"]
+        # trigram の語との組み合わせ
+        assert _contents(database.search_conversations("準備して 資料")) == ["明日の会議の資料を準備して"]
+        assert _contents(database.search_conversations("確認しました 会議")) == []
+
+def test_bigram_index_follows_updates_and_deletes():
+    with tenant_scope("search-sync"):
+        database.add_conversation("secretary", "user", "旧い資料")
+        engine = database.get_engine()
+        with engine.begin() as conn:
+            conn.exec_driver_sql(
+                "UPDATE conversations SET content = '新しい議事録' WHERE tenant_id = 'search-sync'"
+            )
+        assert database.search_conversations("資料")["results"] == []
+        assert len(database.search_conversations("議事")["results"]) == 1
+
+        with engine.begin() as conn:
+            conn.exec_driver_sql("DELETE FROM conversations WHERE tenant_id = 'search-sync'")
+        assert database.search_conversations("議事")["results"] == []
+
+def test_short_term_search_uses_index():
+    engine = database.get_engine()
+    with engine.connect() as conn:
+        plan = [row[-1] for row in conn.exec_driver_sql(
+            "EXPLAIN QUERY PLAN SELECT rowid FROM conversations_bigram "
+            "WHERE conversations_bigram MATCH '\"会議\"'"
+        )]
+    assert any("VIRTUAL TABLE INDEX" in detail for detail in plan)
+
+def test_migration_backfills_bigram_index(tmp_path):
+    path = tmp_path / "v9.db"
+    with sqlite3.connect(path) as conn:
+        conn.execute(
+            "CREATE TABLE conversations (id INTEGER PRIMARY KEY, content TEXT)"
+        )
+        conn.execute("INSERT INTO conversations (content) VALUES ('来週の会議')")
+    engine = database.create_db_engine(f"sqlite:///{path}")
+    with engine.begin() as conn:
+        database._migration_10_short_term_search(conn)
+        rows = conn.exec_driver_sql(
+            "SELECT rowid FROM conversations_bigram WHERE conversations_bigram MATCH '\"会議\"'"
+        ).all()
+    engine.dispose()
+    assert rows == [(1,)]
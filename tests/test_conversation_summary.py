@@ -0,0 +1,103 @@
+"""会話のローリング要約（要約済みの数え方・畳み込みの区切り・バックグラウンド更新）"""
+import threading
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import database
+from conversation_summary import ConversationSummarizer, summarized_count
+from database import tenant_scope
+
+class FakeScheduler:
+    """stream() の最終メッセージとして決まった要約を返す"""
+
+    def __init__(self):
+        self.requests = []
+
+    def stream(self, session_id, request):
+        self.requests.append(request)
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def get_final_message(self):
+        return SimpleNamespace(
+            content=[SimpleNamespace(type="text", text=f"要約{len(self.requests)}")],
+            usage=SimpleNamespace(input_tokens=100, output_tokens=20),
+        )
+
+def test_summarized_count_with_session_messages_without_id():
+    through = datetime(2026, 5, 1, 12, 0)
+    summary = SimpleNamespace(through_timestamp=through, through_id=7)
+    messages = [
+        {"id": 6, "timestamp": through - timedelta(minutes=1)},
+        # このセッションで追加した発言（id なし）は同じ時刻までなら要約済み
+        {"timestamp": through},
+        {"timestamp": through + timedelta(seconds=1)},
+        {"id": 5, "timestamp": through - timedelta(minutes=5)},
+    ]
+    assert summarized_count(messages, summary) == 2
+    assert summarized_count(messages, None) == 0
+    # timestamp の無い発言より後ろは数えない
+    assert summarized_count([{"role": "user"}] + messages, summary) == 0
+
+def test_refresh_splits_batches_before_a_user_turn():
+    roles = ["user", "assistant", "user", "assistant", "assistant", "user", "assistant",
+             "user", "assistant"]
+    scheduler = FakeScheduler()
+    summarizer = ConversationSummarizer(scheduler, keep_recent=3, batch_size=3)
+    with tenant_scope("summary-split"):
+        for i, role in enumerate(roles):
+            database.add_conversation("secretary", role, f"発言{i}")
+
+        # 4件目・5件目は assistant なので、次のユーザーの発言の直前まで延ばして畳み込む
+        assert summarizer.refresh("secretary") == 5
+        summary = database.get_conversation_summary("secretary")
+        pending = database.get_conversations_after(
+            "secretary", (summary.through_timestamp, summary.through_id)
+        )
+
+    assert summary.summary == "要約1"
+    assert [conv.content for conv in pending] == ["発言5", "発言6", "発言7", "発言8"]
+    assert pending[0].role == "user"
+    assert len(scheduler.requests) == 1
+    assert "発言4" in scheduler.requests[0]["messages"][0]["content"]
+
+class BlockingSummarizer(ConversationSummarizer):
+    """refresh の呼び出しを記録し、release されるまで戻らない"""
+
+    def __init__(self):
+        super().__init__(FakeScheduler())
+        self.calls = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def refresh(self, avatar_type):
+        self.calls.append((database.current_tenant(), avatar_type))
+        self.started.set()
+        assert self.release.wait(5)
+        return 0
+
+def test_request_refresh_does_not_block_and_deduplicates():
+    summarizer = BlockingSummarizer()
+    with tenant_scope("summary-queue"):
+        started = time.monotonic()
+        summarizer.request_refresh("secretary")
+        assert summarizer.started.wait(5)
+        # 実行中の更新とは別に1件だけ待ち行列に入る
+        for _ in range(3):
+            summarizer.request_refresh("secretary")
+        summarizer.request_refresh("tech_advisor")
+        assert time.monotonic() - started < 1.0
+
+    summarizer.release.set()
+    summarizer.join()
+    assert summarizer.calls == [
+        ("summary-queue", "secretary"),
+        ("summary-queue", "secretary"),
+        ("summary-queue", "tech_advisor"),
+    ]
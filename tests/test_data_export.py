@@ -0,0 +1,34 @@
+"""エクスポートの形式と、失敗を ExportError で伝えること"""
+import io
+
+import pytest
+from sqlalchemy.exc import OperationalError
+
+import data_export
+import database
+from data_export import ExportError, export, write_parquet
+from database import tenant_scope
+
+def test_csv_starts_with_bom():
+    with tenant_scope("export-csv"):
+        database.add_conversation("secretary", "user", "こんにちは")
+        fp = io.BytesIO()
+        assert export("conversations", "csv", fp) == 1
+    data = fp.getvalue()
+    assert data.startswith(b"\xef\xbb\xbfid,")
+    assert "こんにちは" in data.decode("utf-8-sig")
+
+def test_database_errors_raise_export_error(monkeypatch):
+    def failing_chunks(*args):
+        raise OperationalError("SELECT", {}, Exception("database is locked"))
+        yield
+
+    monkeypatch.setattr(data_export, "iter_chunks", failing_chunks)
+    with pytest.raises(ExportError, match="database is locked"):
+        export("usage", "jsonl", io.BytesIO())
+
+def test_parquet_conversion_errors_raise_export_error():
+    pytest.importorskip("pyarrow")
+    chunks = [[{"id": "not a number"}]]
+    with pytest.raises(ExportError, match="Parquet export failed"):
+        write_parquet(chunks, io.BytesIO(), database.Conversation)
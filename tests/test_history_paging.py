@@ -0,0 +1,53 @@
+"""会話履歴のキーセットページング（(timestamp, id) のカーソルで古い方へ読む）"""
+from datetime import datetime, timedelta
+
+import database
+from database import tenant_scope
+
+START = datetime(2026, 3, 1, 9, 0)
+
+def add_at(avatar_type, content, timestamp):
+    db = database.get_db()
+    database._insert_conversation(db, avatar_type, "user", content, timestamp)
+    db.commit()
+    db.close()
+
+def cursor(page):
+    return (page[0].timestamp, page[0].id)
+
+def test_pages_cover_every_message_once_even_with_equal_timestamps():
+    with tenant_scope("paging-ties"):
+        contents = []
+        for i in range(23):
+            # 3件ずつ同じ時刻にする（ページの境目が同じ時刻の途中に来る）
+            content = f"発言{i:02d}"
+            add_at("secretary", content, START + timedelta(minutes=i // 3))
+            add_at("tech_advisor", f"別のアバター{i}", START + timedelta(minutes=i // 3))
+            contents.append(content)
+
+        latest = database.get_conversations("secretary", limit=5)
+        assert [conv.content for conv in latest] == contents[-5:]
+
+        pages, before = [], None
+        while True:
+            page = database.get_conversations("secretary", limit=5, before=before)
+            if not page:
+                break
+            pages.append([conv.content for conv in page])
+            before = cursor(page)
+
+    assert [len(page) for page in pages] == [5, 5, 5, 5, 3]
+    assert [content for page in reversed(pages) for content in page] == contents
+
+def test_cursor_is_not_shifted_by_new_messages():
+    with tenant_scope("paging-live"):
+        for i in range(6):
+            add_at("secretary", f"発言{i}", START + timedelta(minutes=i))
+        first = database.get_conversations("secretary", limit=3)
+        assert [conv.content for conv in first] == ["発言3", "発言4", "発言5"]
+
+        # 読み込みの間に新しい発言が増えても、次のページは表示中の最古の発言の直前から
+        database.add_conversation("secretary", "user", "新しい発言")
+        older = database.get_conversations("secretary", limit=3, before=cursor(first))
+        assert [conv.content for conv in older] == ["発言0", "発言1", "発言2"]
+        assert database.get_conversations("secretary", limit=3, before=cursor(older)) == []
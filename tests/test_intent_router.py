@@ -0,0 +1,20 @@
+"""秘書アバターの意図判定（ベンチマークのラベル付き発言と、予定以外の話題の誤判定）"""
+import pytest
+
+from benchmarks.intent_router import LABELED_PROMPTS
+from intent_router import route_intent
+
+@pytest.mark.parametrize("prompt, expected", LABELED_PROMPTS)
+def test_labeled_prompts(prompt, expected):
+    assert route_intent(prompt)["intent"] == expected
+
+@pytest.mark.parametrize("prompt", [
+    "テストが終わったので次は何をすればいい？",
+    "Pythonのリストに要素を追加する方法を教えて",
+    "タスクの優先順位のつけ方を教えて",
+    "ユーザー一覧の画面を削除したい",
+])
+def test_strong_words_without_schedule_topic_go_to_the_llm(prompt):
+    result = route_intent(prompt)
+    assert result["intent"] == "none"
+    assert not result["topic"]
@@ -0,0 +1,31 @@
+"""使用履歴と一緒に数えるレイテンシのヒストグラムと、そこから求めるパーセンタイル"""
+import statistics
+from datetime import date
+
+import database
+from database import tenant_scope
+from usage_dashboard import histogram_percentiles
+
+def test_percentiles_match_samples():
+    samples = [100 * 1.01 ** i for i in range(300)]
+    with tenant_scope("latency"):
+        for ttft in samples:
+            database.add_usage_log("secretary", 10, 20, 0.0, ttft_ms=ttft, stream_ms=ttft + 1000)
+        # キャッシュからの応答は数えない
+        database.add_usage_log(
+            "secretary", 0, 0, 0.0, response_cache_hits=1, ttft_ms=1.0, stream_ms=2.0
+        )
+        stats = histogram_percentiles(database.get_latency_histogram(date.today()), 'avatar_type')
+
+    expected = statistics.quantiles(samples, n=100, method="inclusive")
+    for q, rank in ((0.5, 49), (0.95, 94), (0.99, 98)):
+        got = stats.loc["secretary", ("ttft_ms", q)]
+        assert abs(got / expected[rank] - 1) < 0.05
+
+def test_rebuild_matches_incremental_counts():
+    with tenant_scope("latency-rebuild"):
+        for ttft in (120.0, 340.0, 340.5, 2000.0):
+            database.add_usage_log("tech_advisor", 10, 20, 0.0, ttft_ms=ttft, stream_ms=ttft * 2)
+        incremental = sorted(database.get_latency_histogram(date.today(), "date"))
+        database.rebuild_usage_rollups()
+        assert sorted(database.get_latency_histogram(date.today(), "date")) == incremental
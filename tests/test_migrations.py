@@ -0,0 +1,90 @@
+"""最初のスキーマ（user_version 0）の DB を開くと v1〜最新まで順に移行されること"""
+import sqlite3
+
+import database
+from database import DEFAULT_TENANT, SCHEMA_VERSION, SharedLayout, tenant_scope
+
+# 最初のリリースの init_db が作っていたテーブル（インデックス・FTS・ロールアップなし）
+BASELINE_DDL = """
+CREATE TABLE conversations (
+    id INTEGER NOT NULL PRIMARY KEY,
+    avatar_type VARCHAR(50) NOT NULL,
+    role VARCHAR(20) NOT NULL,
+    content TEXT NOT NULL,
+    timestamp DATETIME
+);
+CREATE TABLE schedules (
+    id INTEGER NOT NULL PRIMARY KEY,
+    title VARCHAR(200) NOT NULL,
+    scheduled_datetime DATETIME NOT NULL,
+    description TEXT,
+    created_at DATETIME,
+    completed INTEGER
+);
+CREATE TABLE usage_logs (
+    id INTEGER NOT NULL PRIMARY KEY,
+    avatar_type VARCHAR(50) NOT NULL,
+    input_tokens INTEGER NOT NULL,
+    output_tokens INTEGER NOT NULL,
+    cost FLOAT NOT NULL,
+    timestamp DATETIME
+);
+INSERT INTO conversations (avatar_type, role, content, timestamp) VALUES
+    ('secretary', 'user', '来週の会議の資料', '2025-03-01 09:00:00.000000'),
+    ('secretary', 'assistant', '準備しておきます', '2025-03-01 09:00:05.000000');
+INSERT INTO schedules (title, scheduled_datetime, description, created_at, completed) VALUES
+    ('会議', '2099-01-01 10:00:00.000000', '', '2025-03-01 09:00:00.000000', 0);
+INSERT INTO usage_logs (avatar_type, input_tokens, output_tokens, cost, timestamp) VALUES
+    ('secretary', 100, 20, 0.5, '2025-03-01 09:00:05.000000'),
+    ('tech_advisor', 300, 40, 1.5, '2025-03-02 10:00:00.000000');
+"""
+
+def test_baseline_database_is_migrated_to_the_latest_schema(tmp_path, monkeypatch):
+    path = tmp_path / "llm_app.db"
+    with sqlite3.connect(path) as conn:
+        conn.executescript(BASELINE_DDL)
+
+    layout = SharedLayout(f"sqlite:///{path}")
+    monkeypatch.setattr(database, "layout", layout)
+    try:
+        with tenant_scope(DEFAULT_TENANT):
+            database.init_db()
+            with database.get_engine().connect() as conn:
+                assert conn.exec_driver_sql("PRAGMA user_version").scalar() == SCHEMA_VERSION
+                usage_columns = database._column_names(conn, "usage_logs")
+            assert {"tenant_id", "cache_read_tokens", "stream_hedges", "db_enqueue_ms"} <= usage_columns
+            assert "db_write_ms" not in usage_columns
+
+            # 既存の行は DEFAULT_TENANT のもの
+            history = database.get_conversations("secretary")
+            assert [conv.content for conv in history] == ["来週の会議の資料", "準備しておきます"]
+            assert [s.title for s in database.get_schedules()] == ["会議"]
+
+            # 検索索引（trigram・bigram）とロールアップは既存の行から作られる
+            assert len(database.search_conversations("会議の資料")["results"]) == 1
+            assert len(database.search_conversations("資料")["results"]) == 1
+            total = database.get_total_usage()
+            assert (total.total_requests, total.total_input) == (2, 400)
+
+            # 移行後のインデックスがホットなクエリに使われる
+            assert all(uses_index for *_, uses_index in database.explain_hot_queries())
+
+            # 新しい行も索引・ロールアップに入る
+            database.add_conversation("secretary", "user", "会議は何時から？")
+            database.add_usage_log("secretary", 10, 2, 0.1)
+            assert len(database.search_conversations("会議")["results"]) == 2
+            assert database.get_total_usage().total_requests == 3
+        with tenant_scope("migrated-other"):
+            assert database.get_conversations("secretary") == []
+    finally:
+        layout.close()
+
+    # 最新のバージョンの DB は開き直しても移行・再集計しない
+    reopened = SharedLayout(f"sqlite:///{path}")
+    monkeypatch.setattr(database, "layout", reopened)
+    try:
+        with tenant_scope(DEFAULT_TENANT):
+            assert database.get_total_usage().total_requests == 3
+            assert len(database.search_conversations("会議")["results"]) == 2
+    finally:
+        reopened.close()
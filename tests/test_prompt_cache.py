@@ -0,0 +1,105 @@
+"""プロンプトキャッシュのブレークポイントとトークン数・コストの計算"""
+from types import SimpleNamespace
+
+import pytest
+
+from prompt_cache import (
+    CACHE_CONTROL, add_cache_breakpoints, build_stream_request, calculate_cost, usage_from_message
+)
+
+def cached_prefix(request):
+    """最後のキャッシュブレークポイントまでのブロック（(役割, テキスト) の並び）"""
+    blocks = [("system", block) for block in request["system"]]
+    for message in request["messages"]:
+        content = message["content"]
+        if isinstance(content, str):
+            content = [{"type": "text", "text": content}]
+        blocks += [(message["role"], block) for block in content]
+    last = max(i for i, (_, block) in enumerate(blocks) if "cache_control" in block)
+    return [(role, block["text"]) for role, block in blocks[:last + 1]]
+
+def build(messages, dynamic_context):
+    return build_stream_request("model", 1024, "あなたは秘書です", messages, dynamic_context)
+
+def test_breakpoints_on_the_last_two_messages():
+    messages = [
+        {"role": "user", "content": "1"},
+        {"role": "assistant", "content": "2"},
+        {"role": "user", "content": "3", "timestamp": "2026-05-01"},
+    ]
+    cached = add_cache_breakpoints(messages)
+
+    assert cached[0] == {"role": "user", "content": "1"}
+    assert cached[1]["content"] == [{"type": "text", "text": "2", "cache_control": CACHE_CONTROL}]
+    # API に送らないキーは落とす
+    assert cached[2] == {
+        "role": "user",
+        "content": [{"type": "text", "text": "3", "cache_control": CACHE_CONTROL}],
+    }
+    # 元の発言は変更しない
+    assert messages[1]["content"] == "2"
+
+def test_breakpoint_on_block_content_and_single_message():
+    blocks = [{"type": "text", "text": "a"}, {"type": "text", "text": "b"}]
+    cached = add_cache_breakpoints([{"role": "user", "content": blocks}])
+
+    assert len(cached) == 1
+    assert cached[0]["content"] == [
+        {"type": "text", "text": "a"},
+        {"type": "text", "text": "b", "cache_control": CACHE_CONTROL},
+    ]
+    assert "cache_control" not in blocks[-1]
+    assert add_cache_breakpoints([]) == []
+
+def test_usage_from_message_defaults_missing_cache_fields_to_zero():
+    with_cache = SimpleNamespace(usage=SimpleNamespace(
+        input_tokens=10, output_tokens=20, cache_creation_input_tokens=30,
+        cache_read_input_tokens=40
+    ))
+    assert usage_from_message(with_cache) == {
+        "input_tokens": 10, "output_tokens": 20,
+        "cache_creation_tokens": 30, "cache_read_tokens": 40,
+    }
+    without_cache = SimpleNamespace(usage=SimpleNamespace(
+        input_tokens=1, output_tokens=2, cache_creation_input_tokens=None
+    ))
+    assert usage_from_message(without_cache) == {
+        "input_tokens": 1, "output_tokens": 2, "cache_creation_tokens": 0, "cache_read_tokens": 0,
+    }
+
+def test_calculate_cost(monkeypatch):
+    for name in ("INPUT", "OUTPUT", "CACHE_WRITE", "CACHE_READ"):
+        monkeypatch.delenv(f"CLAUDE_SONNET_4_5_{name}_COST", raising=False)
+    # 既定の単価: 入力 $3、出力 $15、キャッシュ書き込みは入力の1.25倍、読み込みは0.1倍
+    assert calculate_cost(1_000_000, 1_000_000) == pytest.approx(18.0)
+    assert calculate_cost(0, 0, cache_creation_tokens=1_000_000) == pytest.approx(3.75)
+    assert calculate_cost(0, 0, cache_read_tokens=1_000_000) == pytest.approx(0.3)
+
+    # 入力単価を変えるとキャッシュの単価も追従する
+    monkeypatch.setenv("CLAUDE_SONNET_4_5_INPUT_COST", "1.0")
+    assert calculate_cost(0, 0, 1_000_000, 1_000_000) == pytest.approx(1.25 + 0.1)
+
+def test_dynamic_context_stays_outside_the_cached_prefix():
+    history = [
+        {"role": "user", "content": "明日の予定は？"},
+        {"role": "assistant", "content": "会議が1件あります"},
+        {"role": "user", "content": "来週は？"},
+    ]
+    monday = build(history, "## 予定一覧\n- 10/20 会議")
+    tuesday = build(history, "## 予定一覧\n- 10/21 歯医者")
+    assert cached_prefix(monday) == cached_prefix(tuesday)
+    assert cached_prefix(monday)[-1] == ("user", "来週は？")
+    # 予定一覧は最新の発言の最後（ブレークポイントの後ろ）に付く
+    assert monday["messages"][-1]["content"][-1] == {"type": "text", "text": "## 予定一覧\n- 10/20 会議"}
+    assert len(monday["system"]) == 1
+
+    # 次のターンは、前のターンでキャッシュした範囲をそのまま先頭に含む
+    next_turn = build(history + [
+        {"role": "assistant", "content": "予定はありません"},
+        {"role": "user", "content": "ありがとう"},
+    ], "## 予定一覧\n- 10/22 面接")
+    assert cached_prefix(next_turn)[:len(cached_prefix(monday))] == cached_prefix(monday)
+
+def test_no_dynamic_context_leaves_messages_unchanged():
+    request = build([{"role": "user", "content": "こんにちは"}], "")
+    assert request["messages"] == add_cache_breakpoints([{"role": "user", "content": "こんにちは"}])
@@ -0,0 +1,115 @@
+"""予定のリマインダー（ヒープの更新・完了/削除の取り消し・通知時刻での配達）"""
+from datetime import datetime
+
+import database
+from database import tenant_scope
+from reminders import ReminderEngine
+
+DAY = datetime(2030, 1, 7)
+
+class Clock:
+    """テストで進める時計"""
+
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+def at(hour, minute=0, second=0):
+    return DAY.replace(hour=hour, minute=minute, second=second)
+
+def add(title, scheduled_datetime):
+    database.add_schedule(title, scheduled_datetime)
+    return next(s.id for s in database.get_schedules(limit=100) if s.title == title)
+
+def fire_due(engine):
+    """通知時刻が来た要素を通知スレッド（_run）と同じように処理する（スレッドは起動しない）"""
+    while True:
+        with engine._cond:
+            now = engine.clock()
+            if not any(
+                fire_at <= now and (
+                    schedule_id is None
+                    or engine._live.get((tenant, schedule_id), (None,))[0] == seq
+                )
+                for fire_at, seq, tenant, schedule_id in engine._heap
+            ):
+                return
+            _, _, tenant, schedule_id = engine._next_due()
+            if schedule_id is not None:
+                engine._deliver(tenant, schedule_id)
+                continue
+        engine._load(tenant)
+
+def titles(reminders):
+    return [reminder["title"] for reminder in reminders]
+
+def test_heap_follows_added_completed_and_deleted_schedules():
+    clock = Clock(at(9))
+    engine = ReminderEngine(lead_minutes=10, load_batch=2, session_ttl=86400, clock=clock)
+    database.add_schedule_listener(engine.on_schedule_change)
+    try:
+        with tenant_scope("reminders-heap"):
+            add("朝会", at(10))
+            standup = add("定例", at(11))
+            add("昼の打ち合わせ", at(12))
+            assert engine.poll("tab") == []
+            fire_due(engine)
+            # 最初の分（load_batch 件）だけを読み込み、最後の予定の通知時刻に続きを読む
+            assert (engine.stats["loads"], engine.stats["loaded"]) == (1, 2)
+
+            # 読み込んだ範囲の追加はヒープに入れ、その先は次の読み込みに任せる
+            moved = add("電話", at(10, 30))
+            add("夕方の面談", at(13))
+            assert engine.stats["added"] == 1
+
+            # 完了・削除は取り消しの印だけで、ヒープからはすぐには取り除かない
+            size = len(engine._heap)
+            database.complete_schedule(standup)
+            database.delete_schedule(moved)
+            assert engine.stats["removed"] == 2
+            assert len(engine._heap) == size
+
+            clock.now = at(13)
+            fire_due(engine)
+            assert titles(engine.poll("tab")) == ["朝会", "昼の打ち合わせ", "夕方の面談"]
+            # 続きの2件と、続きが無いことを確かめる読み込み
+            assert engine.stats["loads"] == 3
+            assert engine.stats["fired"] == 3
+            assert engine._heap == []
+    finally:
+        database.remove_schedule_listener(engine.on_schedule_change)
+
+def test_reminder_is_delivered_lead_minutes_before_to_live_sessions():
+    clock = Clock(at(9))
+    engine = ReminderEngine(lead_minutes=10, session_ttl=600, clock=clock)
+    database.add_schedule_listener(engine.on_schedule_change)
+    try:
+        with tenant_scope("reminders-lead"):
+            engine.poll("open-tab")
+            engine.poll("closed-tab")
+            fire_due(engine)
+            add("歯医者", at(10))
+
+            clock.now = at(9, 45)
+            assert engine.poll("open-tab") == []
+            clock.now = at(9, 49, 59)
+            fire_due(engine)
+            assert engine.stats["fired"] == 0
+
+            clock.now = at(9, 50)
+            fire_due(engine)
+            reminders = engine.poll("open-tab")
+            assert reminders == [
+                {"schedule_id": reminders[0]["schedule_id"], "title": "歯医者",
+                 "scheduled_datetime": at(10)}
+            ]
+            # TTL より長く poll していないセッションには届けない
+            assert engine.poll("closed-tab") == []
+            assert engine.stats["delivered"] == 1
+        # 他の利用者のセッションには届かない
+        with tenant_scope("reminders-other"):
+            assert engine.poll("open-tab") == []
+    finally:
+        database.remove_schedule_listener(engine.on_schedule_change)
@@ -0,0 +1,122 @@
+"""RequestScheduler のレート制限（トークンバケット）・429 の再送・一時的なエラーの再送・公平性"""
+import time
+from types import SimpleNamespace
+
+import anthropic
+import pytest
+
+from benchmarks.fake_client import FakeAsyncAnthropic
+from request_scheduler import RequestScheduler, TokenBucket
+
+def make_request(content: str) -> dict:
+    return {
+        "model": "claude-sonnet-4-20250514",
+        "max_tokens": 256,
+        "messages": [{"role": "user", "content": content}],
+    }
+
+def api_error(error_class, status: int, headers: dict = None):
+    response = SimpleNamespace(status_code=status, headers=headers or {}, request=None)
+    return error_class("error", response=response, body=None)
+
+class RecordingClient(FakeAsyncAnthropic):
+    """送信したリクエストの本文を順に記録する"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.sent = []
+
+    def response_words(self, request: dict) -> list:
+        self.sent.append(request["messages"][0]["content"])
+        return super().response_words(request)
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def test_token_bucket_refills_at_limit_per_period():
+    clock = FakeClock()
+    bucket = TokenBucket(60, period=60.0, clock=clock)
+    bucket.consume(60)
+    assert bucket.wait_time(1) == pytest.approx(1.0)
+    clock.now = 0.5
+    assert bucket.wait_time(1) == pytest.approx(0.5)
+    clock.now = 1.0
+    assert bucket.wait_time(1) == 0.0
+    # 上限を超える量は満杯になるまで待てばよい
+    assert bucket.wait_time(1000) == pytest.approx(59.0)
+
+def test_token_bucket_follows_response_headers():
+    clock = FakeClock()
+    bucket = TokenBucket(100, period=60.0, clock=clock)
+    bucket.observe(limit=50, remaining=0, reset_after=3.0)
+    assert bucket.capacity == 50
+    assert bucket.wait_time(1) == pytest.approx(3.0)
+
+def test_dispatch_is_paced_by_requests_per_period():
+    client = FakeAsyncAnthropic(response_tokens=1)
+    # 0.4 秒に2リクエスト（満杯の2本の後は 0.2 秒ごとに1本）
+    scheduler = RequestScheduler(client, requests_per_minute=2, period=0.4)
+    started = time.monotonic()
+    streams = [scheduler.stream("a", make_request(str(i))) for i in range(4)]
+    for stream in streams:
+        stream.get_final_message()
+    assert time.monotonic() - started >= 0.35
+    assert scheduler.stats["dispatched"] == 4
+
+def test_rate_limited_request_is_requeued():
+    rate_limited = api_error(anthropic.RateLimitError, 429, {"retry-after": "0.1"})
+    client = FakeAsyncAnthropic(response_tokens=2, errors=[rate_limited])
+    scheduler = RequestScheduler(client)
+    started = time.monotonic()
+    message = scheduler.stream("a", make_request("こんにちは")).get_final_message()
+    assert message.stop_reason == "end_turn"
+    assert time.monotonic() - started >= 0.1  # retry-after の間は送らない
+    assert scheduler.stats["rate_limited"] == 1
+    assert scheduler.stats["requeued"] == 1
+    assert client.calls == 2
+
+def test_rate_limit_retries_are_bounded():
+    rate_limited = api_error(anthropic.RateLimitError, 429, {"retry-after": "0"})
+    client = FakeAsyncAnthropic(errors=[rate_limited] * 3)
+    scheduler = RequestScheduler(client, max_retries=1)
+    with pytest.raises(anthropic.RateLimitError):
+        scheduler.stream("a", make_request("こんにちは")).get_final_message()
+    assert client.calls == 2
+    assert scheduler.stats["failed"] == 1
+
+def test_transient_errors_are_resent():
+    overloaded = api_error(anthropic.APIStatusError, 529)
+    client = FakeAsyncAnthropic(response_tokens=2, errors=[overloaded, overloaded])
+    scheduler = RequestScheduler(client, max_error_retries=2)
+    message = scheduler.stream("a", make_request("こんにちは")).get_final_message()
+    assert message.stop_reason == "end_turn"
+    assert scheduler.stats["error_retries"] == 2
+
+def test_client_errors_are_not_resent():
+    bad_request = api_error(anthropic.BadRequestError, 400)
+    client = FakeAsyncAnthropic(errors=[bad_request])
+    scheduler = RequestScheduler(client)
+    with pytest.raises(anthropic.BadRequestError):
+        scheduler.stream("a", make_request("こんにちは")).get_final_message()
+    assert client.calls == 1
+
+def test_sessions_are_served_round_robin():
+    client = RecordingClient(first_token_delay=0.05, response_tokens=1)
+    scheduler = RequestScheduler(client, max_concurrency=1)
+    streams = [scheduler.stream("a", make_request(f"a{i}")) for i in range(3)]
+    streams += [scheduler.stream("b", make_request(f"b{i}")) for i in range(3)]
+    for stream in streams:
+        stream.get_final_message()
+    assert client.sent == ["a0", "b0", "a1", "b1", "a2", "b2"]
+
+def test_stream_times_out_without_events():
+    client = FakeAsyncAnthropic(first_token_delay=5.0)
+    scheduler = RequestScheduler(client)
+    stream = scheduler.stream("a", make_request("こんにちは"), timeout=0.1)
+    with pytest.raises(TimeoutError):
+        stream.get_final_message()
+    assert stream.wait_closed(1.0)
@@ -0,0 +1,34 @@
+"""キャッシュした応答の再生（ストリーミングと同じ表示を、長さに関わらず一定時間で）"""
+from response_cache import REPLAY_CHUNK_CHARS, REPLAY_INTERVAL, REPLAY_MAX_SECONDS, replay_chunks
+from stream_render import ThrottledRenderer
+
+class FakePlaceholder:
+    def __init__(self):
+        self.bodies = []
+
+    def markdown(self, body):
+        self.bodies.append(body)
+
+def test_short_responses_replay_in_fixed_size_chunks():
+    text = "あ" * 100
+    chunks = list(replay_chunks(text))
+    assert "".join(chunks) == text
+    assert [len(chunk) for chunk in chunks] == [REPLAY_CHUNK_CHARS] * 4 + [4]
+
+def test_long_responses_replay_within_the_time_cap():
+    text = "応答" * 5000
+    chunks = list(replay_chunks(text))
+    assert "".join(chunks) == text
+    assert len(chunks) * REPLAY_INTERVAL <= REPLAY_MAX_SECONDS + 1e-9
+
+def test_replay_goes_through_the_streaming_renderer():
+    placeholder = FakePlaceholder()
+    clock = iter(range(1000))
+    renderer = ThrottledRenderer(placeholder, frame_interval=0.5, clock=lambda: next(clock))
+    text = "キャッシュした応答です。" * 40
+    for chunk in replay_chunks(text):
+        renderer.append(chunk)
+    assert renderer.finish() == text
+    # 途中経過はカーソル付きで複数回描画し、最後に全文を描画する
+    assert len(placeholder.bodies) > 2
+    assert placeholder.bodies[-1] == text
@@ -0,0 +1,60 @@
+"""秘書の予定コンテキストのメモ化（予定の追加・完了・削除で無効化）"""
+from datetime import datetime
+
+import pytest
+
+import database
+import schedule_context
+from database import tenant_scope
+from schedule_context import get_schedule_context
+
+NOW = datetime(2031, 6, 2, 9, 0)
+
+@pytest.fixture
+def builds(monkeypatch):
+    """_build_context を呼んだ回数（メモ化に当たらなかった回数）"""
+    calls = []
+    build = schedule_context._build_context
+
+    def counting(date_range):
+        calls.append(date_range)
+        return build(date_range)
+
+    monkeypatch.setattr(schedule_context, "_build_context", counting)
+    return calls
+
+def context(prompt="明日の予定は？"):
+    return get_schedule_context(prompt, now=NOW)
+
+def schedule_id(title):
+    return next(s.id for s in database.get_schedules(limit=100) if s.title == title)
+
+def test_context_is_memoized_until_the_schedules_change(builds):
+    with tenant_scope("context-invalidation"):
+        assert context() == "06/03 の予定:\n- なし\n"
+        assert context() == "06/03 の予定:\n- なし\n"
+        assert len(builds) == 1
+
+        database.add_schedule("会議", datetime(2031, 6, 3, 10))
+        database.add_schedule("歯医者", datetime(2031, 6, 3, 15))
+        assert context() == "06/03 の予定:\n- 06/03 10:00: 会議\n- 06/03 15:00: 歯医者\n"
+        assert context() == context()
+        assert len(builds) == 2
+
+        database.complete_schedule(schedule_id("会議"))
+        assert context() == "06/03 の予定:\n- 06/03 15:00: 歯医者\n"
+
+        database.delete_schedule(schedule_id("歯医者"))
+        assert context() == "06/03 の予定:\n- なし\n"
+        assert len(builds) == 4
+
+def test_other_tenants_writes_do_not_invalidate(builds):
+    with tenant_scope("context-alice"):
+        database.add_schedule("定例", datetime(2031, 6, 3, 11))
+        assert "定例" in context()
+    with tenant_scope("context-bob"):
+        database.add_schedule("面接", datetime(2031, 6, 3, 13))
+        assert "定例" not in context()
+    with tenant_scope("context-alice"):
+        assert "面接" not in context()
+    assert len(builds) == 2
@@ -0,0 +1,21 @@
+"""benchmarks/schedule_corpus.json のラベル付きフレーズで parse_schedule_request の正解と速度を検証する"""
+import pytest
+
+from benchmarks.schedule_parser import MIN_RATE, load_corpus, measure_rate
+from scheduler import parse_schedule_request
+
+NOW, CASES = load_corpus()
+
+@pytest.mark.parametrize("case", CASES, ids=[case["text"] for case in CASES])
+def test_corpus(case):
+    result = parse_schedule_request(case["text"], now=NOW)
+    assert result["datetime"].isoformat(timespec="minutes") == case["datetime"]
+    assert result["duration_minutes"] == case["duration_minutes"]
+    assert result["title"] == case["title"]
+
+def test_range_past_midnight_ends_next_day():
+    result = parse_schedule_request("12月31日 23時から1時 年越しライブ", now=NOW)
+    assert result["end_datetime"].isoformat(timespec="minutes") == "2027-01-01T01:00"
+
+def test_parses_per_second():
+    assert measure_rate(NOW, CASES, seconds=0.3) >= MIN_RATE
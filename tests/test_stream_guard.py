@@ -0,0 +1,50 @@
+"""GuardedStream の期限（送信した時点から数える）と、捨てた送信のトークン数"""
+import pytest
+
+from benchmarks.fake_client import FakeAsyncAnthropic
+from request_scheduler import RequestScheduler, estimate_request_tokens
+from stream_guard import GuardedStream, StreamTimeout, TTFTTracker
+
+REQUEST = {
+    "model": "claude-sonnet-4-20250514",
+    "max_tokens": 256,
+    "system": [{"type": "text", "text": "あなたは秘書です。"}],
+    "messages": [{"role": "user", "content": "明日の予定は？"}],
+}
+
+def guarded(scheduler, session_id: str, **kwargs) -> GuardedStream:
+    kwargs.setdefault("tracker", TTFTTracker())
+    return GuardedStream(scheduler, session_id, REQUEST, sleep=lambda seconds: None, **kwargs)
+
+def test_queue_wait_does_not_count_toward_first_token_deadline():
+    client = FakeAsyncAnthropic(first_token_delay=0.05, response_tokens=3)
+    # 0.5 秒に1リクエストしか送れないので、2本目は期限より長く待ち行列で待つ
+    scheduler = RequestScheduler(client, requests_per_minute=1, period=0.5)
+    first = guarded(scheduler, "a", ttft_timeout=0.3)
+    second = guarded(scheduler, "b", ttft_timeout=0.3)
+    with first, second:
+        first.get_final_message()
+        assert second.get_final_message() is not None
+    assert (first.retries, second.retries) == (0, 0)
+    assert client.calls == 2
+
+def test_stalled_attempt_usage_is_reported():
+    client = FakeAsyncAnthropic(response_tokens=5, stalled_calls=1)
+    scheduler = RequestScheduler(client)
+    with guarded(scheduler, "a", stall_timeout=0.2) as stream:
+        message = stream.get_final_message()
+        abandoned = stream.abandoned_usage()
+    assert stream.retries == 1
+    assert message.usage.output_tokens == 5
+    assert abandoned["input_tokens"] == estimate_request_tokens(REQUEST)
+    assert abandoned["output_tokens"] > 0
+
+def test_retries_exhausted_usage_is_reported():
+    client = FakeAsyncAnthropic(response_tokens=5, stalled_calls=3)
+    scheduler = RequestScheduler(client)
+    stream = guarded(scheduler, "a", stall_timeout=0.1, max_retries=1)
+    with pytest.raises(StreamTimeout):
+        stream.get_final_message()
+    abandoned = stream.abandoned_usage()
+    assert stream.retries == 1
+    assert abandoned["input_tokens"] == 2 * estimate_request_tokens(REQUEST)
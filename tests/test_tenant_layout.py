@@ -0,0 +1,28 @@
+"""利用者ごとの DB ファイル（PerTenantLayout）を閉じて開き直すときの準備"""
+import database
+from database import PerTenantLayout, tenant_scope
+
+def test_reopened_file_is_not_prepared_again(tmp_path, monkeypatch):
+    layout = PerTenantLayout(f"sqlite:///{tmp_path}/{{tenant}}.db", max_open=1)
+    monkeypatch.setattr(database, "layout", layout)
+    prepared = []
+    create_all = database.Base.metadata.create_all
+
+    def counting_create_all(engine):
+        prepared.append(str(engine.url))
+        create_all(engine)
+
+    monkeypatch.setattr(database.Base.metadata, "create_all", counting_create_all)
+    try:
+        for tenant in ("alice", "bob", "alice", "bob"):
+            with tenant_scope(tenant):
+                database.add_conversation("secretary", "user", "こんにちは")
+        with tenant_scope("alice"):
+            assert len(database.get_conversations("secretary")) == 2
+    finally:
+        layout.close()
+
+    # 開くたびに閉じる（max_open=1）が、テーブルを作るのは各ファイルの最初の1回だけ
+    assert sorted(prepared) == [
+        f"sqlite:///{tmp_path}/alice.db", f"sqlite:///{tmp_path}/bob.db"
+    ]
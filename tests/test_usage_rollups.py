@@ -0,0 +1,71 @@
+"""使用履歴の集計テーブル（書き込みと同時の upsert と、rebuild-rollups による作り直し）"""
+from datetime import date, datetime
+
+import pytest
+
+import database
+from database import UsageLog, tenant_scope
+
+def add_log_at(avatar_type, timestamp, input_tokens, output_tokens, cost, **extra):
+    db = database.get_db()
+    database._insert_usage_log(
+        db, avatar_type, timestamp,
+        **database._usage_metrics(input_tokens, output_tokens, cost, extra)
+    )
+    db.commit()
+    db.close()
+
+def daily(since=date(2025, 1, 1)):
+    return [
+        (row.date, row.request_count, row.input_tokens, row.output_tokens, row.cache_read_tokens)
+        for row in database.get_daily_usage(since)
+    ]
+
+def by_avatar(since=date(2025, 1, 1)):
+    return {
+        row.avatar_type: (row.request_count, row.input_tokens, row.output_tokens)
+        for row in database.get_avatar_usage(since)
+    }
+
+def test_usage_logs_upsert_daily_and_avatar_rollups():
+    with tenant_scope("rollup-upsert"):
+        add_log_at("secretary", datetime(2025, 4, 1, 9), 100, 10, 0.5, cache_read_tokens=30)
+        add_log_at("secretary", datetime(2025, 4, 1, 18), 200, 20, 1.0)
+        add_log_at("tech_advisor", datetime(2025, 4, 1, 23, 59), 300, 30, 1.5)
+        add_log_at("secretary", datetime(2025, 4, 2, 0, 1), 400, 40, 2.0)
+
+        # 同じ日・同じアバターの行は1行に足し込む
+        assert daily() == [
+            (date(2025, 4, 1), 3, 600, 60, 30),
+            (date(2025, 4, 2), 1, 400, 40, 0),
+        ]
+        assert by_avatar() == {"secretary": (3, 700, 70), "tech_advisor": (1, 300, 30)}
+        assert by_avatar(since=date(2025, 4, 2)) == {"secretary": (1, 400, 40)}
+        total = database.get_total_usage()
+        assert (total.total_requests, total.total_cache_read) == (4, 30)
+        assert total.total_cost == pytest.approx(5.0)
+
+def test_rebuild_rollups_backfills_logs_written_before_the_rollups():
+    with tenant_scope("rollup-backfill"):
+        add_log_at("secretary", datetime(2025, 5, 1, 9), 10, 1, 0.1)
+        incremental = (daily(), by_avatar())
+
+        # 集計テーブルができる前の行（使用履歴だけにある）
+        with database.get_engine().begin() as conn:
+            conn.execute(UsageLog.__table__.insert(), [
+                {"tenant_id": "rollup-backfill", "avatar_type": avatar_type, "timestamp": timestamp,
+                 "input_tokens": 20, "output_tokens": 2, "cost": 0.2}
+                for avatar_type, timestamp in (
+                    ("secretary", datetime(2025, 5, 1, 12)),
+                    ("mental_support", datetime(2025, 5, 3, 8)),
+                )
+            ])
+        assert (daily(), by_avatar()) == incremental
+
+        database.rebuild_usage_rollups()
+        assert daily() == [(date(2025, 5, 1), 2, 30, 3, 0), (date(2025, 5, 3), 1, 20, 2, 0)]
+        assert by_avatar() == {"secretary": (2, 30, 3), "mental_support": (1, 20, 2)}
+
+        # 作り直した後も書き込みと同時の upsert が続く
+        add_log_at("mental_support", datetime(2025, 5, 3, 20), 5, 1, 0.0)
+        assert by_avatar()["mental_support"] == (2, 25, 3)
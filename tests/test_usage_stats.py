@@ -0,0 +1,65 @@
+"""使用量の集計のキャッシュ（利用者ごとの usage_logs の書き込みバージョンで無効化）"""
+import functools
+from datetime import datetime
+
+import pytest
+
+import database
+import usage_stats
+from database import tenant_scope
+
+@pytest.fixture
+def loads(monkeypatch):
+    """database の集計関数を実際に呼んだ回数（キャッシュに当たらなかった回数）"""
+    calls = []
+    for name in ("get_usage_between", "get_total_usage"):
+        load = getattr(database, name)
+
+        @functools.wraps(load)
+        def counting(*args, load=load):
+            calls.append((database.current_tenant(), load.__name__))
+            return load(*args)
+
+        monkeypatch.setattr(database, name, counting)
+    return calls
+
+def test_stats_are_cached_until_usage_is_written(loads):
+    with tenant_scope("stats-cache"):
+        assert usage_stats.get_today_stats() == {"count": 0, "cost": 0.0}
+        assert usage_stats.get_today_stats() == {"count": 0, "cost": 0.0}
+        assert usage_stats.get_total_usage().total_requests is None
+        assert len(loads) == 2
+
+        database.add_usage_log("secretary", 10, 20, 0.25)
+        assert usage_stats.get_today_stats() == {"count": 1, "cost": 0.25}
+        assert usage_stats.get_total_usage().total_requests == 1
+        assert len(loads) == 4
+
+        # 書き込みキューの書き込みはコミットした時点で無効化する
+        database.queue_usage_log("secretary", 10, 20, 0.5)
+        database.flush_writes()
+        assert usage_stats.get_today_stats() == {"count": 2, "cost": 0.75}
+        assert usage_stats.get_today_stats() == {"count": 2, "cost": 0.75}
+        assert len(loads) == 5
+
+        # 引数（期間）が違えば別の結果
+        assert usage_stats.get_today_stats(datetime(2020, 1, 1, 12)) == {"count": 0, "cost": 0.0}
+        assert len(loads) == 6
+
+def test_cache_is_per_tenant(loads):
+    with tenant_scope("stats-alice"):
+        database.add_usage_log("secretary", 10, 20, 1.0)
+        assert usage_stats.get_today_stats()["count"] == 1
+    with tenant_scope("stats-bob"):
+        assert usage_stats.get_today_stats()["count"] == 0
+        database.add_usage_log("secretary", 10, 20, 1.0)
+        database.add_usage_log("secretary", 10, 20, 1.0)
+        assert usage_stats.get_today_stats()["count"] == 2
+    with tenant_scope("stats-alice"):
+        # 他の利用者の書き込みでは読み直さない
+        assert usage_stats.get_today_stats()["count"] == 1
+    assert loads == [
+        ("stats-alice", "get_usage_between"),
+        ("stats-bob", "get_usage_between"),
+        ("stats-bob", "get_usage_between"),
+    ]
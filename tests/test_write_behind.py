@@ -0,0 +1,115 @@
+"""書き込みキュー（WriteBehindQueue）のまとめ書き・失敗時の1件ずつの書き直し・close"""
+import threading
+
+import pytest
+from sqlalchemy import Column, Integer, MetaData, String, Table, func, select
+from sqlalchemy.orm import sessionmaker
+
+import database
+from database import PerTenantLayout, WriteBehindQueue, WriteQueueClosed, tenant_scope
+
+metadata = MetaData()
+items = Table(
+    "items", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("value", String, nullable=False),
+)
+
+class CountingSessions:
+    """作ったセッションの数（= まとめて書いたトランザクションの数）を数える"""
+
+    def __init__(self, engine):
+        self._factory = sessionmaker(bind=engine)
+        self.count = 0
+
+    def __call__(self):
+        self.count += 1
+        return self._factory()
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = database.create_db_engine(f"sqlite:///{tmp_path / 'queue.db'}")
+    metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+def insert_item(db, value):
+    if value == "bad":
+        raise ValueError("bad row")
+    db.execute(items.insert().values(value=value))
+
+def blocking_writer():
+    """release されるまで書き込みスレッドを止める書き込みと、そのイベント"""
+    started, release = threading.Event(), threading.Event()
+
+    def writer(db):
+        started.set()
+        release.wait(5)
+
+    return writer, started, release
+
+def stored_values(engine):
+    with engine.connect() as conn:
+        return sorted(conn.execute(select(items.c.value)).scalars())
+
+def test_queued_writes_are_batched(engine):
+    sessions = CountingSessions(engine)
+    write_queue = WriteBehindQueue(sessions, max_batch=3)
+    writer, started, release = blocking_writer()
+    write_queue.put(writer)
+    assert started.wait(5)
+    for i in range(5):
+        write_queue.put(insert_item, value=str(i))
+    release.set()
+    write_queue.flush()
+
+    # 書き込み中に溜まった5件は max_batch 件ずつ2回にまとめて書く
+    assert sessions.count == 3
+    assert stored_values(engine) == ["0", "1", "2", "3", "4"]
+    write_queue.close()
+
+def test_failed_batch_is_retried_one_by_one(engine):
+    sessions = CountingSessions(engine)
+    write_queue = WriteBehindQueue(sessions)
+    writer, started, release = blocking_writer()
+    write_queue.put(writer)
+    assert started.wait(5)
+    for value in ("a", "bad", "b"):
+        write_queue.put(insert_item, invalidates=("items",), value=value)
+    version = database.get_write_version("items")
+    release.set()
+    write_queue.flush()
+
+    # 失敗した行だけを捨て、書けた行の分だけバージョンを上げる
+    assert stored_values(engine) == ["a", "b"]
+    assert database.get_write_version("items") == version + 2
+    write_queue.close()
+
+def test_close_drains_the_queue_and_rejects_later_writes(engine):
+    write_queue = WriteBehindQueue(sessionmaker(bind=engine))
+    for i in range(50):
+        write_queue.put(insert_item, value=f"{i:02d}")
+    write_queue.close()
+
+    assert len(stored_values(engine)) == 50
+    with pytest.raises(WriteQueueClosed):
+        write_queue.put(insert_item, value="late")
+    assert len(stored_values(engine)) == 50
+
+def test_queued_write_after_eviction_goes_to_the_reopened_store(tmp_path, monkeypatch):
+    layout = PerTenantLayout(f"sqlite:///{tmp_path}/{{tenant}}.db", max_open=1)
+    monkeypatch.setattr(database, "layout", layout)
+    try:
+        with tenant_scope("evicted"):
+            stale = database._store()
+            with tenant_scope("other"):
+                database._store()
+            with pytest.raises(WriteQueueClosed):
+                stale.write_queue.put(insert_item, value="x")
+
+            database.queue_usage_log("secretary", 10, 20, 0.0)
+            database.flush_writes()
+            with database.get_engine().connect() as conn:
+                assert conn.execute(select(func.count(database.UsageLog.id))).scalar() == 1
+    finally:
+        layout.close()
@@ -0,0 +1,36 @@
+# チャット処理の段階ごとの所要時間の計測
+import time
+from contextlib import contextmanager
+
+class StageTimer:
+    """
+    1回の応答の各段階の所要時間をミリ秒で集める
+
+    同じ名前の段階を複数回計測した場合は合計する。
+    metrics() の戻り値はそのまま queue_usage_log に渡せる（名前に _ms が付く）。
+    """
+
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        started = self.clock()
+        try:
+            yield
+        finally:
+            self.record(name, started)
+
+    def record(self, name: str, started: float):
+        """started（clock の値）から現在までの時間を name に加える"""
+        elapsed = (self.clock() - started) * 1000
+        self.stages[name] = self.stages.get(name, 0.0) + elapsed
+
+    def record_once(self, name: str, started: float):
+        """まだ計測していなければ記録する（最初のトークンなど）"""
+        if name not in self.stages:
+            self.record(name, started)
+
+    def metrics(self) -> dict:
+        return {f"{name}_ms": round(ms, 3) for name, ms in self.stages.items()}
@@ -3,23 +3,89 @@ import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 from datetime import datetime, timedelta
-from sqlalchemy import func
-from database import SessionLocal, UsageLog
+from database import DEFAULT_TENANT, current_tenant, latency_bucket_value
+from usage_stats import get_total_usage, get_daily_usage, get_avatar_usage, get_latency_histogram
 import os
 
+# レイテンシの集計対象と表示名
+LATENCY_COLUMNS = {
+    'ttft_ms': '最初のトークン (ms)',
+    'stream_ms': '応答完了 (ms)',
+    'tokens_per_second': '出力トークン/秒',
+    'context_ms': 'コンテキスト組み立て (ms)',
+    'db_enqueue_ms': 'DB書き込みキュー (ms)',
+}
+
+PERCENTILES = [0.5, 0.95, 0.99]
+
+def histogram_percentiles(histogram, by: str) -> pd.DataFrame:
+    """
+    get_latency_histogram の行から by ごとの各指標の p50 / p95 / p99 を求める
+    （列は (指標, パーセンタイル)）
+
+    値はその順位を含むヒストグラムの階級の代表値（誤差は ±2.5% 以内）。
+    """
+    counts = pd.DataFrame(histogram, columns=[by, 'metric', 'bucket', 'count'])\
+        .set_index([by, 'metric', 'bucket'])['count'].sort_index()
+    groups = counts.groupby(level=[by, 'metric'])
+    rank = groups.cumsum() / groups.transform('sum')
+    stats = {}
+    for q in PERCENTILES:
+        reached = rank[rank >= q - 1e-9].reset_index()
+        stats[q] = reached.groupby([by, 'metric'])['bucket'].first().map(latency_bucket_value)
+    return pd.DataFrame(stats).unstack('metric').swaplevel(axis=1)
+
+def show_latency_section(since, avatar_names: dict):
+    """レイテンシ（p50 / p95 / p99）をアバター別・日別に表示"""
+    st.subheader("⏱️ レイテンシ")
+    
+    histogram = get_latency_histogram(since, 'avatar_type')
+    if not histogram:
+        st.info("まだ計測データがありません。")
+        return
+    
+    # アバター別
+    stats = histogram_percentiles(histogram, 'avatar_type')
+    stats = stats.reindex(columns=pd.MultiIndex.from_product([list(LATENCY_COLUMNS), PERCENTILES]))
+    stats.columns = [f"{LATENCY_COLUMNS[name]} p{int(q * 100)}" for name, q in stats.columns]
+    by_avatar = stats.round(1).reset_index()
+    by_avatar.insert(0, 'アバター', by_avatar.pop('avatar_type').map(avatar_names))
+    st.dataframe(by_avatar, use_container_width=True, hide_index=True)
+    
+    # 日別の推移
+    stats = histogram_percentiles(get_latency_histogram(since, 'date'), 'date')
+    by_day = pd.concat(
+        {
+            q: stats.xs(q, axis=1, level=1).reindex(columns=['ttft_ms', 'stream_ms'])
+            for q in PERCENTILES
+        },
+        names=['percentile']
+    ).reset_index()
+    by_day['percentile'] = by_day['percentile'].map(lambda q: f"p{int(q * 100)}")
+    
+    col1, col2 = st.columns(2)
+    for col, name in ((col1, 'ttft_ms'), (col2, 'stream_ms')):
+        with col:
+            fig = px.line(
+                by_day,
+                x='date',
+                y=name,
+                color='percentile',
+                markers=True,
+                title=f"日別 {LATENCY_COLUMNS[name]}",
+                labels={name: 'ms', 'date': '日付', 'percentile': ''}
+            )
+            st.plotly_chart(fig, use_container_width=True)
+
 def show_usage_dashboard():
     """使用量ダッシュボードの表示"""
     st.title("📊 API使用量ダッシュボード")
+    # 集計は利用者ごと（複数利用者の構成のときは誰の使用量かを表示）
+    if current_tenant() != DEFAULT_TENANT:
+        st.caption(f"👤 {current_tenant()} の使用量")
     
-    db = SessionLocal()
-    
-    # 全体統計の取得
-    total_stats = db.query(
-        func.sum(UsageLog.input_tokens).label('total_input'),
-        func.sum(UsageLog.output_tokens).label('total_output'),
-        func.sum(UsageLog.cost).label('total_cost'),
-        func.count(UsageLog.id).label('total_requests')
-    ).first()
+    # 全体統計の取得（日別ロールアップから集計）
+    total_stats = get_total_usage()
     
     # メトリクス表示
     col1, col2, col3, col4 = st.columns(4)
@@ -31,7 +97,10 @@ def show_usage_dashboard():
         )
     
     with col2:
-        total_tokens = (total_stats.total_input or 0) + (total_stats.total_output or 0)
+        total_tokens = (
+            (total_stats.total_input or 0) + (total_stats.total_output or 0)
+            + (total_stats.total_cache_creation or 0) + (total_stats.total_cache_read or 0)
+        )
         st.metric(
             "総トークン数",
             f"{total_tokens:,}"
@@ -49,6 +118,73 @@ def show_usage_dashboard():
             f"{total_stats.total_output or 0:,}"
         )
     
+    # プロンプトキャッシュ・履歴トリム
+    col1, col2, col3, col4 = st.columns(4)
+    
+    total_cache_creation = total_stats.total_cache_creation or 0
+    total_cache_read = total_stats.total_cache_read or 0
+    with col1:
+        st.metric(
+            "キャッシュ書き込みトークン",
+            f"{total_cache_creation:,}"
+        )
+    
+    with col2:
+        st.metric(
+            "キャッシュ読み込みトークン",
+            f"{total_cache_read:,}"
+        )
+    
+    with col3:
+        total_prompt_tokens = (total_stats.total_input or 0) + total_cache_creation + total_cache_read
+        hit_rate = total_cache_read / total_prompt_tokens if total_prompt_tokens else 0
+        st.metric(
+            "キャッシュヒット率",
+            f"{hit_rate:.1%}"
+        )
+    
+    with col4:
+        st.metric(
+            "履歴トリムで削減したトークン",
+            f"{total_stats.total_context_trimmed or 0:,}"
+        )
+    
+    # 応答キャッシュ（キャッシュが有効なアバターのみ集計）・ストリームの再試行
+    col1, col2, col3, col4, col5 = st.columns(5)
+    
+    response_cache_hits = total_stats.total_response_cache_hits or 0
+    response_cache_misses = total_stats.total_response_cache_misses or 0
+    with col1:
+        st.metric(
+            "応答キャッシュヒット",
+            f"{response_cache_hits:,}"
+        )
+    
+    with col2:
+        st.metric(
+            "応答キャッシュミス",
+            f"{response_cache_misses:,}"
+        )
+    
+    with col3:
+        lookups = response_cache_hits + response_cache_misses
+        st.metric(
+            "応答キャッシュヒット率",
+            f"{response_cache_hits / lookups if lookups else 0:.1%}"
+        )
+    
+    with col4:
+        st.metric(
+            "ストリーム再試行",
+            f"{total_stats.total_stream_retries or 0:,}"
+        )
+    
+    with col5:
+        st.metric(
+            "ヘッジ送信",
+            f"{total_stats.total_stream_hedges or 0:,}"
+        )
+    
     # コスト表示
     st.divider()
     col1, col2 = st.columns(2)
@@ -74,28 +210,19 @@ def show_usage_dashboard():
     # 期間別の使用量
     st.subheader("📈 使用量の推移")
     
-    # 過去30日のデータ取得
-    thirty_days_ago = datetime.now() - timedelta(days=30)
-    usage_data = db.query(UsageLog).filter(
-        UsageLog.timestamp >= thirty_days_ago
-    ).all()
-    
-    if usage_data:
-        # DataFrameに変換
-        df = pd.DataFrame([{
-            'date': log.timestamp.date(),
-            'avatar_type': log.avatar_type,
-            'input_tokens': log.input_tokens,
-            'output_tokens': log.output_tokens,
-            'cost': log.cost
-        } for log in usage_data])
-        
+    # 過去30日のデータ取得（ロールアップのため行数は日数分のみ）
+    thirty_days_ago = (datetime.now() - timedelta(days=30)).date()
+    daily_usage = get_daily_usage(thirty_days_ago)
+    
+    if daily_usage:
         # 日別集計
-        daily_df = df.groupby('date').agg({
-            'input_tokens': 'sum',
-            'output_tokens': 'sum',
-            'cost': 'sum'
-        }).reset_index()
+        daily_df = pd.DataFrame([{
+            'date': row.date,
+            'input_tokens': row.input_tokens,
+            'output_tokens': row.output_tokens,
+            'cache_read_tokens': row.cache_read_tokens,
+            'cost': row.cost
+        } for row in daily_usage])
         
         # トークン使用量の推移グラフ
         fig_tokens = go.Figure()
@@ -113,6 +240,13 @@ def show_usage_dashboard():
             mode='lines+markers',
             line=dict(color='#FFB6C1')
         ))
+        fig_tokens.add_trace(go.Scatter(
+            x=daily_df['date'],
+            y=daily_df['cache_read_tokens'],
+            name='キャッシュ読み込み',
+            mode='lines+markers',
+            line=dict(color='#DDA0DD')
+        ))
         fig_tokens.update_layout(
             title='日別トークン使用量',
             xaxis_title='日付',
@@ -135,11 +269,14 @@ def show_usage_dashboard():
         # アバター別の使用量
         st.subheader("🤖 アバター別使用統計")
         
-        avatar_stats = df.groupby('avatar_type').agg({
-            'input_tokens': 'sum',
-            'output_tokens': 'sum',
-            'cost': 'sum'
-        }).reset_index()
+        avatar_stats = pd.DataFrame([{
+            'avatar_type': row.avatar_type,
+            'input_tokens': row.input_tokens,
+            'output_tokens': row.output_tokens,
+            'cache_creation_tokens': row.cache_creation_tokens,
+            'cache_read_tokens': row.cache_read_tokens,
+            'cost': row.cost
+        } for row in get_avatar_usage(thirty_days_ago)])
         
         # アバター名のマッピング
         avatar_names = {
@@ -153,7 +290,10 @@ def show_usage_dashboard():
         
         with col1:
             # トークン数の円グラフ
-            avatar_stats['total_tokens'] = avatar_stats['input_tokens'] + avatar_stats['output_tokens']
+            avatar_stats['total_tokens'] = (
+                avatar_stats['input_tokens'] + avatar_stats['output_tokens']
+                + avatar_stats['cache_creation_tokens'] + avatar_stats['cache_read_tokens']
+            )
             fig_pie_tokens = px.pie(
                 avatar_stats,
                 values='total_tokens',
@@ -174,12 +314,21 @@ def show_usage_dashboard():
         
         # 詳細テーブル
         st.subheader("📋 詳細データ")
-        display_stats = avatar_stats[['avatar_name', 'input_tokens', 'output_tokens', 'cost']].copy()
-        display_stats.columns = ['アバター', '入力トークン', '出力トークン', 'コスト (USD)']
+        display_stats = avatar_stats[[
+            'avatar_name', 'input_tokens', 'output_tokens', 'cache_creation_tokens',
+            'cache_read_tokens', 'cost'
+        ]].copy()
+        display_stats.columns = [
+            'アバター', '入力トークン', '出力トークン', 'キャッシュ書き込み', 'キャッシュ読み込み',
+            'コスト (USD)'
+        ]
         display_stats['コスト (USD)'] = display_stats['コスト (USD)'].apply(lambda x: f"${x:.4f}")
         st.dataframe(display_stats, use_container_width=True, hide_index=True)
         
+        st.divider()
+        
+        # レイテンシ（過去30日分のヒストグラムから集計）
+        show_latency_section(thirty_days_ago, avatar_names)
+        
     else:
-        st.info("まだ使用データがありません。チャットを開始すると統計が表示されます。")
-    
-    db.close()
\ No newline at end of file
+        st.info("まだ使用データがありません。チャットを開始すると統計が表示されます。")
\ No newline at end of file
@@ -0,0 +1,53 @@
+# 使用量の集計のキャッシュ（利用者ごとの usage_logs の書き込みバージョンで無効化）
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from threading import Lock
+import database
+from database import UsageLog, current_tenant, get_write_version
+
+# 保持する集計結果の最大数（利用者・期間などの引数違いを保持）
+CACHE_SIZE = 32
+
+_cache = OrderedDict()  # (利用者, 関数名, 引数) -> (書き込みバージョン, 結果)
+_cache_lock = Lock()
+
+def _cached(load, *args):
+    """
+    load(*args) の結果を利用者の usage_logs の書き込みバージョンごとにメモ化する
+
+    add_usage_log / queue_usage_log の書き込みがコミットされるとバージョンが上がり、
+    古いバージョンの結果は次に読んだときに置き換える。
+    """
+    version = get_write_version(UsageLog.__tablename__)
+    key = (current_tenant(), load.__name__, args)
+    with _cache_lock:
+        entry = _cache.get(key)
+        if entry is not None and entry[0] == version:
+            _cache.move_to_end(key)
+            return entry[1]
+
+    value = load(*args)
+    with _cache_lock:
+        _cache[key] = (version, value)
+        _cache.move_to_end(key)
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return value
+
+def get_today_stats(now: datetime = None) -> dict:
+    """今日（0時〜翌0時）のリクエスト数とコスト"""
+    now = now or datetime.now()
+    today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    return _cached(database.get_usage_between, today_start, today_start + timedelta(days=1))
+
+def get_total_usage():
+    return _cached(database.get_total_usage)
+
+def get_daily_usage(since):
+    return _cached(database.get_daily_usage, since)
+
+def get_avatar_usage(since):
+    return _cached(database.get_avatar_usage, since)
+
+def get_latency_histogram(since, by: str = 'avatar_type'):
+    return _cached(database.get_latency_histogram, since, by)